@@ -1,5 +1,19 @@
 # ai_model_integration/ai_utils.py
+import os
 import re
+import threading
+import warnings
+import zlib
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from config import get_setting
+
+# 预编译的空白字符模式 (包括换行符、制表符)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+NORMALIZATION_TYPES = ("min-max", "z-score", "robust")
 
 def clean_text(text):
     """
@@ -14,47 +28,325 @@ def clean_text(text):
     if not isinstance(text, str):
         return ""  # 如果输入不是字符串，返回空字符串
 
-    # 去除首尾空格
-    text = text.strip()
-    # 将多个空格替换为一个空格
-    text = re.sub(r'\s+', ' ', text)
-    # 去除换行符
-    text = text.replace('\n', ' ')
-    return text
+    # 连续的空白字符 (包括换行符) 替换为一个空格，再去除首尾空格
+    return _WHITESPACE_RE.sub(' ', text).strip()
 
-def extract_keywords(text, num_keywords=5):
+def clean_texts(texts: Iterable) -> Iterator[str]:
     """
-    (示例) 从文本中提取关键词 (这里只是一个简单的占位符实现，实际应用中可以使用更复杂的关键词提取算法).
+    批量清洗文本，逐条产出结果，不会把整个语料读入内存。
+
+    Args:
+        texts (Iterable[str]): 文本序列 (列表、生成器或逐行读取的文件对象).
+
+    Yields:
+        str: 清洗后的文本字符串，非字符串元素产出空字符串.
+    """
+    sub = _WHITESPACE_RE.sub
+    for text in texts:
+        yield sub(' ', text).strip() if isinstance(text, str) else ""
+
+# 词: 以字母/数字/汉字开头，可以包含连字符和撇号 (例如 open-source, don't)
+_TOKEN_RE = re.compile(r"\w[\w'-]*")
+# RAKE 的短语分隔符: 标点符号
+_PHRASE_SPLIT_RE = re.compile(r"[^\w\s'-]+")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just me more most my myself no nor not now of
+off on once only or other our ours ourselves out over own same she should so some such than that the their
+theirs them themselves then there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+KEYWORD_METHODS = ("tfidf", "rake")
+
+def tokenize(text):
+    """小写分词，去掉停用词、单字符词和纯数字"""
+    return [token for token in _TOKEN_RE.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORDS and not token.isdigit()]
+
+def _hash_tokens(tokens, n_features):
+    # crc32 在不同进程之间稳定 (内置 hash() 会随机化)，保证持久化的索引在重启后仍然有效
+    return np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                       dtype=np.int64, count=len(tokens)) % n_features
+
+class CorpusIndex:
+    """
+    增量更新的语料统计索引 (哈希词表)。
+
+    词经 crc32 哈希到 n_features 个桶，文档频率保存在定长的 int32 数组中，
+    新增文档只需一次 bincount 累加，不需要保存词表或重新统计整个语料。
+    给新文档打分只在该文档出现过的桶上做向量化的 TF-IDF 计算。
+    """
+
+    def __init__(self, n_features=2 ** 20):
+        self.n_features = n_features
+        self.doc_freq = np.zeros(n_features, dtype=np.int32)
+        self.num_docs = 0
+        self._lock = threading.Lock()
+
+    def add_documents(self, texts):
+        """把一批文档计入文档频率 (每个词在一篇文档中只计一次)"""
+        hashed = [np.unique(_hash_tokens(tokenize(text), self.n_features))
+                  for text in texts if isinstance(text, str)]
+        if not hashed:
+            return
+        counts = np.bincount(np.concatenate(hashed), minlength=self.n_features)
+        with self._lock:
+            self.doc_freq += counts.astype(np.int32)
+            self.num_docs += len(hashed)
+
+    def idf(self, buckets):
+        """平滑 IDF: log((1 + N) / (1 + df)) + 1，语料为空时所有词的 IDF 相同 (退化为按词频排序)"""
+        return np.log((1.0 + self.num_docs) / (1.0 + self.doc_freq[buckets])) + 1.0
+
+    def extract_batch(self, texts, num_keywords=5):
+        """
+        批量提取关键词: 所有文档的 (文档序号, 桶) 合并为一个数组，一次 np.unique 计数、一次 IDF 查表。
+
+        Returns:
+            list[list[str]]: 与 texts 顺序一致的关键词列表.
+        """
+        documents = [tokenize(text) if isinstance(text, str) else [] for text in texts]
+        lengths = np.fromiter((len(tokens) for tokens in documents), dtype=np.int64, count=len(documents))
+        all_tokens = [token for tokens in documents for token in tokens]
+        if not all_tokens:
+            return [[] for _ in documents]
+
+        buckets = _hash_tokens(all_tokens, self.n_features)
+        doc_ids = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+        keys, first_index, counts = np.unique(doc_ids * self.n_features + buckets,
+                                              return_index=True, return_counts=True)
+        key_docs, key_buckets = np.divmod(keys, self.n_features)
+        scores = counts / lengths[key_docs] * self.idf(key_buckets)
+
+        keywords = [[] for _ in documents]
+        boundaries = np.searchsorted(key_docs, np.arange(len(documents) + 1))
+        for doc_id in range(len(documents)):
+            start, end = boundaries[doc_id], boundaries[doc_id + 1]
+            if start == end:
+                continue
+            # 分数相同的词按在文档中首次出现的顺序排列
+            order = np.lexsort((first_index[start:end], -scores[start:end]))[:num_keywords]
+            keywords[doc_id] = [all_tokens[first_index[start + position]] for position in order]
+        return keywords
+
+    def extract(self, text, num_keywords=5):
+        return self.extract_batch([text], num_keywords)[0]
+
+    def save(self, path):
+        """保存为 .npz 文件，重启时用 CorpusIndex.load 直接加载 (先写临时文件再替换，读取方不会读到写了一半的文件)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.tmp-{os.getpid()}"
+        with self._lock, open(temporary, "wb") as f:
+            np.savez_compressed(f, doc_freq=self.doc_freq, num_docs=self.num_docs, n_features=self.n_features)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(n_features=int(data["n_features"]))
+            index.doc_freq = data["doc_freq"].astype(np.int32)
+            index.num_docs = int(data["num_docs"])
+        return index
+
+def rake_keywords(text, num_keywords=5):
+    """
+    RAKE 关键短语提取: 以停用词和标点切分候选短语，词分数 = 共现度 / 词频，短语分数为词分数之和。
+    不依赖语料统计，适合单篇文档。
+    """
+    phrases = []
+    for fragment in _PHRASE_SPLIT_RE.split(text.lower()):
+        phrase = []
+        for token in _TOKEN_RE.findall(fragment):
+            if token in STOPWORDS or token.isdigit():
+                if phrase:
+                    phrases.append(phrase)
+                phrase = []
+            else:
+                phrase.append(token)
+        if phrase:
+            phrases.append(phrase)
+
+    frequency, degree = {}, {}
+    for phrase in phrases:
+        for token in phrase:
+            frequency[token] = frequency.get(token, 0) + 1
+            degree[token] = degree.get(token, 0) + len(phrase)
+
+    scored = {}
+    for phrase in phrases:
+        key = " ".join(phrase)
+        if key not in scored:
+            scored[key] = sum(degree[token] / frequency[token] for token in phrase)
+    return sorted(scored, key=scored.get, reverse=True)[:num_keywords]
+
+_corpus_index = None
+_corpus_index_lock = threading.Lock()
+
+def get_corpus_index():
+    """
+    返回进程级共享的语料索引。配置了 keywords.index_path 且文件存在时直接从磁盘加载
+    (由 ingest_corpus 或离线用 CorpusIndex.add_documents 构建后 save 到该路径)，启动时无需重建。
+    """
+    global _corpus_index
+    if _corpus_index is None:
+        with _corpus_index_lock:
+            if _corpus_index is None:
+                path = get_setting("keywords.index_path")
+                if path and os.path.exists(path):
+                    _corpus_index = CorpusIndex.load(path)
+                else:
+                    _corpus_index = CorpusIndex(n_features=get_setting("keywords.n_features", 2 ** 20))
+    return _corpus_index
+
+def ingest_corpus(texts):
+    """
+    把文档计入共享语料索引的文档频率；配置了 keywords.index_path 时同时保存，
+    重启后 (以及进程池中的 worker) 从磁盘加载。
+
+    Returns:
+        int: 语料中的文档总数.
+    """
+    index = get_corpus_index()
+    index.add_documents(texts)
+    path = get_setting("keywords.index_path")
+    if path:
+        index.save(path)
+    return index.num_docs
+
+def extract_keywords(text, num_keywords=5, method="tfidf", index=None):
+    """
+    从文本中提取关键词。
 
     Args:
         text (str): 输入文本字符串.
         num_keywords (int, optional): 要提取的关键词数量. 默认为 5.
+        method (str, optional): "tfidf" (结合语料索引的文档频率) 或 "rake" (关键短语). 默认为 "tfidf".
+        index (CorpusIndex, optional): 使用的语料索引. 默认为进程级共享索引.
 
     Returns:
         list: 关键词列表 (字符串列表).
     """
     if not isinstance(text, str):
         return [] # 如果输入不是字符串，返回空列表
+    if method == "rake":
+        return rake_keywords(text, num_keywords)
+    if method != "tfidf":
+        raise ValueError(f"不支持的关键词提取方法 '{method}'，可选值: {', '.join(KEYWORD_METHODS)}")
+    return (index or get_corpus_index()).extract(text, num_keywords)
+
+def _check_normalization_type(normalization_type):
+    if normalization_type not in NORMALIZATION_TYPES:
+        raise ValueError(f"不支持的归一化类型 '{normalization_type}'，可选值: {', '.join(NORMALIZATION_TYPES)}")
 
-    # 简单地按空格分割文本，取前 N 个词作为关键词 (仅为示例)
-    words = text.split()
-    keywords = words[:num_keywords]
-    return keywords
+def _safe_scale(scale):
+    # 常数列的尺度为 0，归一化结果统一为 0 而不是产生 inf/nan
+    return np.where(scale == 0, 1.0, scale)
 
 def normalize_data(data, normalization_type="min-max"):
     """
-    (占位符) 对数据进行归一化处理 (这里只是一个占位符，实际应用中需要根据数据类型和需求实现具体的归一化逻辑).
+    对数值数据进行归一化处理。一维数据整体归一化，二维数据按列归一化；缺失值 (None/NaN) 被忽略并原样保留。
 
     Args:
-        data (list or numpy.ndarray): 要归一化的数据 (假设是数值型数据).
-        normalization_type (str, optional): 归一化类型. 默认为 "min-max".  可以扩展支持其他类型，例如 "z-score", "decimal scaling" 等.
+        data (list or numpy.ndarray): 要归一化的数值数据 (一维或二维).
+        normalization_type (str, optional): 归一化类型. 默认为 "min-max".
+            "min-max": 缩放到 [0, 1]; "z-score": 减均值除以标准差;
+            "robust": 减中位数除以四分位距 (对离群值不敏感).
 
     Returns:
-        list or numpy.ndarray: 归一化后的数据.
+        list or numpy.ndarray: 归一化后的数据，输入为列表时返回列表 (缺失值为 None，可以直接序列化为 JSON).
+
+    Raises:
+        ValueError: 数据不是一维或二维，或包含无穷大.
     """
-    # 这是一个占位符实现，实际应用中需要根据具体的数据类型和归一化需求来实现
-    print(f"警告: normalize_data 函数是一个占位符实现，尚未实现具体的归一化逻辑. 默认返回原始数据.")
-    return data # 默认返回原始数据
+    _check_normalization_type(normalization_type)
+    values = np.asarray(data, dtype=np.float64)
+    if values.ndim not in (1, 2):
+        raise ValueError(f"只支持一维或二维数据，输入为 {values.ndim} 维")
+    if np.isinf(values).any():
+        raise ValueError("数据中包含无穷大的值，无法归一化")
+    if values.size == 0:
+        return data
+
+    if normalization_type == "min-max":
+        offset = np.nanmin(values, axis=0)
+        scale = np.nanmax(values, axis=0) - offset
+    elif normalization_type == "z-score":
+        offset = np.nanmean(values, axis=0)
+        scale = np.nanstd(values, axis=0)
+    else:
+        q1, offset, q3 = np.nanpercentile(values, [25, 50, 75], axis=0)
+        scale = q3 - q1
+
+    normalized = (values - offset) / _safe_scale(scale)
+    if not isinstance(data, (list, tuple)):
+        return normalized
+    result = normalized.astype(object)
+    result[np.isnan(normalized)] = None  # NaN 不是合法的 JSON 值
+    return result.tolist()
+
+def iter_array_chunks(array, chunk_rows=65536):
+    """
+    按行切分数组 (例如 numpy.memmap 打开的磁盘文件)，每次只把 chunk_rows 行读入内存。
+    """
+    for start in range(0, len(array), chunk_rows):
+        yield np.asarray(array[start:start + chunk_rows], dtype=np.float64)
+
+def normalize_chunks(chunk_source: Callable[[], Iterable], normalization_type="min-max") -> Iterator[np.ndarray]:
+    """
+    分块归一化超出内存的数据: 第一遍流式统计每列的最小/最大值或均值/方差，第二遍逐块产出归一化结果。
+
+    均值和方差用并行合并公式 (Chan et al.) 逐块累积，数值上与一次性计算一致。
+    中位数和四分位数无法单遍精确流式计算，因此分块模式不支持 "robust"。
+
+    Args:
+        chunk_source (Callable): 无参函数，每次调用返回一个新的数据块迭代器
+            (数据需要读取两遍，例如 lambda: iter_array_chunks(np.load(path, mmap_mode="r"))).
+        normalization_type (str, optional): "min-max" 或 "z-score". 默认为 "min-max".
+
+    Yields:
+        numpy.ndarray: 与输入块一一对应的归一化结果.
+    """
+    _check_normalization_type(normalization_type)
+    if normalization_type == "robust":
+        raise ValueError("分块归一化不支持 robust 类型 (需要精确的中位数和四分位数)，请使用 normalize_data")
+
+    count = mean = m2 = minimum = maximum = None
+    for chunk in chunk_source():
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.size == 0:
+            continue
+        chunk_count = np.sum(~np.isnan(chunk), axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # 块中某列全部为 NaN
+            chunk_min = np.nanmin(chunk, axis=0)
+            chunk_max = np.nanmax(chunk, axis=0)
+            chunk_mean = np.where(chunk_count > 0, np.nanmean(chunk, axis=0), 0.0)
+        chunk_m2 = np.nansum((chunk - chunk_mean) ** 2, axis=0)
+        if count is None:
+            count, mean, m2, minimum, maximum = chunk_count, chunk_mean, chunk_m2, chunk_min, chunk_max
+            continue
+        total = count + chunk_count
+        delta = chunk_mean - mean
+        mean = mean + delta * chunk_count / np.maximum(total, 1)
+        m2 = m2 + chunk_m2 + delta ** 2 * count * chunk_count / np.maximum(total, 1)
+        count = total
+        minimum = np.fmin(minimum, chunk_min)
+        maximum = np.fmax(maximum, chunk_max)
+
+    if count is None:
+        return
+
+    if normalization_type == "min-max":
+        offset, scale = minimum, maximum - minimum
+    else:
+        offset, scale = mean, np.sqrt(m2 / np.maximum(count, 1))
+    scale = _safe_scale(scale)
+
+    for chunk in chunk_source():
+        yield (np.asarray(chunk, dtype=np.float64) - offset) / scale
 
 
 # 示例用法 (可选，但推荐用于测试模块)
@@ -67,12 +359,27 @@ if __name__ == "__main__":
 
     print("\n--- 测试 extract_keywords 函数 ---")
     sample_text = "AI-Flow is an open-source low-code platform for AI application development. It simplifies AI development."
-    keywords = extract_keywords(sample_text, num_keywords=7)
+    index = CorpusIndex(n_features=2 ** 16)
+    index.add_documents([
+        "AI application development with low-code tools.",
+        "An open-source platform for data pipelines.",
+        "Low-code platform for web development.",
+    ])
+    keywords = extract_keywords(sample_text, num_keywords=7, index=index)
     print(f"原始文本: '{sample_text}'")
-    print(f"提取的关键词 (前 7 个): {keywords}")
+    print(f"提取的关键词 (TF-IDF, 前 7 个): {keywords}")
+    print(f"提取的关键短语 (RAKE): {extract_keywords(sample_text, num_keywords=3, method='rake')}")
+
+    print("\n--- 测试 clean_texts 函数 ---")
+    print(list(clean_texts(["  a \t b ", None, "c\n\nd"])))
 
-    print("\n--- 测试 normalize_data 函数 (占位符) ---")
+    print("\n--- 测试 normalize_data 函数 ---")
     sample_data = [10, 20, 30, 40, 50]
-    normalized_data = normalize_data(sample_data, normalization_type="min-max")
-    print(f"原始数据: {sample_data}")
-    print(f"归一化后的数据 (min-max, 占位符实现): {normalized_data}")
\ No newline at end of file
+    for normalization_type in NORMALIZATION_TYPES:
+        print(f"归一化后的数据 ({normalization_type}): {normalize_data(sample_data, normalization_type=normalization_type)}")
+    print(f"按列归一化 (min-max): {normalize_data([[1, 100], [2, 200], [3, 300]])}")
+
+    print("\n--- 测试 normalize_chunks 函数 ---")
+    large_data = np.arange(10, dtype=np.float64).reshape(5, 2)
+    chunks = list(normalize_chunks(lambda: iter_array_chunks(large_data, chunk_rows=2), normalization_type="z-score"))
+    print(f"分块 z-score 与一次性计算一致: {np.allclose(np.vstack(chunks), normalize_data(large_data, 'z-score'))}")
\ No newline at end of file
@@ -0,0 +1,166 @@
+# benchmarks/bench_api.py
+"""
+进程内基准测试: 通过 ASGI 传输直接驱动 FastAPI app (不经过网络栈)，测量各接口的延迟分布和吞吐量。
+
+用法 (在仓库根目录运行):
+    python -m benchmarks.bench_api --output results.json
+    python -m benchmarks.bench_api --quick --only canvas
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+from benchmarks.common import (fake_openai_server, install_stub_hf_backend, make_canvas, summarize,
+                               use_openai_base_url, write_report)
+
+CATALOG_SIZE = 1000
+
+
+async def measure(name: str, make_request: Callable[[], Awaitable[httpx.Response]], iterations: int,
+                  concurrency: int = 1, warmup: int = 3, **extra: Any) -> Dict[str, Any]:
+    """以固定并发执行 iterations 次请求，状态码 >= 400 或抛出异常都计为错误"""
+    for _ in range(warmup):
+        await make_request()
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iterations
+
+    async def worker() -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await make_request()
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - start, concurrency=concurrency, **extra)
+
+
+def measure_function(name: str, fn: Callable[[], Any], iterations: int, **extra: Any) -> Dict[str, Any]:
+    """测量同步函数的耗时 (用于 ai_utils 等非 HTTP 的工具函数)"""
+    fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(name, latencies, 0, time.perf_counter() - start, **extra)
+
+
+def seed_catalog(main: Any) -> Dict[str, int]:
+    """创建基准测试使用的模块和工作流，返回各场景用到的 id"""
+    from models.workflow_models import AIModuleCreate, WorkflowCreate
+
+    for i in range(CATALOG_SIZE):
+        main.ai_service.create_ai_module(AIModuleCreate(
+            name=f"module-{i}", type=("text_generation", "image_classification", "data_processing")[i % 3],
+            description="benchmark module", config={"model": "gpt-2", "schema": {"field": "x" * 512}}))
+        main.workflow_service.create_workflow(WorkflowCreate(name=f"workflow-{i}", description="benchmark", steps=[]))
+
+    def module(config: Dict[str, Any]) -> int:
+        return main.ai_service.create_ai_module(AIModuleCreate(name="bench", type="text_generation", config=config)).id
+
+    return {
+        "workflow": 1,
+        "simulated": module({"model": "gpt-2"}),
+        "huggingface": module({"backend": "huggingface", "model": "stub-model"}),
+        "openai": module({"backend": "openai", "model": "stub-model", "temperature": 0.7}),
+    }
+
+
+async def run_benchmarks(quick: bool, only: str) -> List[Dict[str, Any]]:
+    import main
+    from openai_api import close_openai_backend
+
+    scale = 0.2 if quick else 1.0
+    ids = seed_catalog(main)
+    results: List[Dict[str, Any]] = []
+
+    def n(iterations: int) -> int:
+        return max(5, int(iterations * scale))
+
+    def selected(name: str) -> bool:
+        return not only or only in name
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        scenarios = [
+            ("catalog.list_modules_page", lambda: client.get("/ai-modules", params={"limit": 100}), n(500), 1),
+            ("catalog.list_modules_projected", lambda: client.get(
+                "/ai-modules", params={"limit": 1000, "fields": "id,name,type"}), n(200), 1),
+            ("catalog.list_workflows_page", lambda: client.get("/workflows", params={"limit": 100}), n(500), 1),
+            ("catalog.export_modules_ndjson", lambda: client.get("/ai-modules/export"), n(50), 1),
+        ]
+        for name, make_request, iterations, concurrency in scenarios:
+            if selected(name):
+                results.append(await measure(name, make_request, iterations, concurrency))
+
+        for num_nodes, iterations in ((10, 500), (1000, 50), (10000, 10)):
+            canvas = make_canvas(num_nodes)
+            url = f"/workflows/data/{ids['workflow']}"
+            if selected(f"canvas.save_{num_nodes}"):
+                results.append(await measure(f"canvas.save_{num_nodes}", lambda: client.post(url, json=canvas),
+                                             n(iterations), nodes=num_nodes))
+            if selected(f"canvas.load_{num_nodes}"):
+                await client.post(url, json=canvas)
+                results.append(await measure(f"canvas.load_{num_nodes}", lambda: client.get(url),
+                                             n(iterations), nodes=num_nodes))
+
+        def run(module: str) -> Callable[[], Awaitable[httpx.Response]]:
+            return lambda: client.post(f"/ai-modules/run/{ids[module]}", json={"input_text": "benchmark prompt"})
+
+        for module, iterations, concurrency in (("simulated", 500, 16), ("huggingface", 200, 32), ("openai", 200, 32)):
+            name = f"module.run_{module}_c{concurrency}"
+            if selected(name):
+                results.append(await measure(name, run(module), n(iterations), concurrency))
+
+        name = "module.batch_huggingface_32"
+        if selected(name):
+            batch = {"inputs": [{"input_text": f"prompt {i}"} for i in range(32)]}
+            results.append(await measure(name, lambda: client.post(
+                f"/ai-modules/run/{ids['huggingface']}/batch", json=batch), n(50), 1, items_per_request=32))
+
+    await close_openai_backend()
+
+    from ai_utils import clean_texts, normalize_data
+    texts = ["  Some   text\twith \n irregular   whitespace  " * 4] * 100_000
+    matrix = np.random.default_rng(0).normal(size=(1_000_000, 4))
+    for name, fn, iterations, extra in (
+        ("utils.clean_texts_100k", lambda: sum(1 for _ in clean_texts(texts)), 5, {"items": len(texts)}),
+        ("utils.normalize_zscore_1m_x4", lambda: normalize_data(matrix, "z-score"), 10, {"rows": len(matrix)}),
+    ):
+        if selected(name):
+            results.append(measure_function(name, fn, max(2, int(iterations * scale)), **extra))
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI-Flow in-process API benchmarks")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="run fewer iterations (smoke run)")
+    parser.add_argument("--only", default="", help="only run scenarios whose name contains this string")
+    args = parser.parse_args()
+
+    install_stub_hf_backend()
+    with fake_openai_server() as base_url:
+        use_openai_base_url(base_url)
+        results = asyncio.run(run_benchmarks(args.quick, args.only))
+    write_report("bench_api", results, args.output, catalog_size=CATALOG_SIZE, quick=args.quick)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/bench_inference.py
+"""
+推理模式基准测试: 在同一组提示上比较 fp32、int8 (动态量化) 和 onnx (ONNX Runtime) 的延迟、吞吐量和常驻内存。
+
+与其他基准测试不同，这里使用真实的 transformers 模型 (需要安装 torch 和 requirements-onnx.txt 中的 optimum[onnxruntime])。
+每种模式在独立的子进程中运行两次: 第一次只加载模型 (产物目录为空时包含转换耗时，即冷启动)，
+第二次从磁盘产物加载后测量，因此 RSS 只包含该模式自身的模型。
+贪心解码且固定生成 token 数，各模式的吞吐量可以直接比较；matches_fp32 为输出与 fp32 完全一致的提示比例。
+
+用法 (在仓库根目录运行):
+    python -m benchmarks.bench_inference --model gpt2 --output inference.json
+    python -m benchmarks.bench_inference --modes fp32,int8 --iterations 5 --max-new-tokens 16
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import peak_rss_mb, summarize, write_report
+
+PROMPTS = [
+    "Once upon a time",
+    "The weather is nice today, so",
+    "In a shocking finding, scientists discovered",
+    "The best way to learn a new programming language is",
+    "Low-code platforms let developers",
+    "Summarize the following customer review:",
+    "def fibonacci(n):",
+    "The history of the printing press",
+]
+
+
+def current_rss_mb() -> Optional[float]:
+    """当前常驻内存 (MB)，只支持 Linux (/proc)，其他平台返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def run_worker(args: argparse.Namespace) -> Dict[str, Any]:
+    """在当前进程中以 args.worker 模式加载模型并测量"""
+    import config
+
+    settings = config.get_config()
+    settings["ai_models"] = {**settings["ai_models"], "inference": {
+        **settings["ai_models"].get("inference", {}), "default_mode": args.worker, "models": {},
+        "artifact_dir": args.artifact_dir}}
+
+    from hf_transformers import get_text_generation_pipeline
+
+    start = time.perf_counter()
+    generator = get_text_generation_pipeline(args.model, "float32")
+    result: Dict[str, Any] = {"mode": args.worker, "load_seconds": round(time.perf_counter() - start, 3),
+                              "rss_after_load_mb": current_rss_mb()}
+    if args.iterations == 0:
+        return result
+
+    tokenizer = generator.tokenizer
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token_id = generator.model.config.eos_token_id
+    tokenizer.padding_side = "left"
+    options = dict(max_new_tokens=args.max_new_tokens, min_new_tokens=args.max_new_tokens, do_sample=False,
+                   num_return_sequences=1)
+
+    generator(PROMPTS[0], **options)  # 预热
+    latencies: List[float] = []
+    outputs: Dict[str, str] = {}
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        prompt = PROMPTS[i % len(PROMPTS)]
+        call_start = time.perf_counter()
+        outputs[prompt] = generator(prompt, **options)[0]["generated_text"]
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    batch_start = time.perf_counter()
+    generator(PROMPTS, batch_size=len(PROMPTS), **options)
+    batch_elapsed = time.perf_counter() - batch_start
+
+    result.update(summarize(f"inference.{args.worker}", latencies, 0, elapsed, **result))
+    result.update({
+        "tokens_per_second": round(args.iterations * args.max_new_tokens / elapsed, 2),
+        "batch_size": len(PROMPTS),
+        "batch_tokens_per_second": round(len(PROMPTS) * args.max_new_tokens / batch_elapsed, 2),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "outputs": outputs,
+    })
+    return result
+
+
+def spawn_worker(args: argparse.Namespace, mode: str, iterations: int) -> Dict[str, Any]:
+    command = [sys.executable, "-m", "benchmarks.bench_inference", "--worker", mode, "--model", args.model,
+               "--artifact-dir", args.artifact_dir, "--iterations", str(iterations),
+               "--max-new-tokens", str(args.max_new_tokens)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        stderr = completed.stderr.strip().splitlines()
+        return {"name": f"inference.{mode}", "mode": mode, "error": stderr[-1] if stderr else completed.returncode}
+    # 模型加载时可能向标准输出打印日志，结果在最后一行
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI-Flow local inference mode benchmark")
+    parser.add_argument("--model", default="gpt2", help="Hugging Face model name or path")
+    parser.add_argument("--modes", default="fp32,int8,onnx", help="comma separated inference modes to compare")
+    parser.add_argument("--iterations", type=int, default=20, help="sequential generations measured per mode")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--artifact-dir", default=None,
+                        help="reuse this artifact directory (default: a fresh temporary one, so the cold run converts)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args), ensure_ascii=False))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="aiflow-artifacts-") as temporary_dir:
+        args.artifact_dir = args.artifact_dir or temporary_dir
+        results = []
+        for mode in args.modes.split(","):
+            cold = spawn_worker(args, mode, iterations=0)
+            warm = spawn_worker(args, mode, iterations=args.iterations) if "error" not in cold else cold
+            if "error" not in warm:
+                warm["cold_load_seconds"] = cold["load_seconds"]
+            results.append(warm)
+
+    reference = next((r["outputs"] for r in results if r.get("mode") == "fp32" and "outputs" in r), None)
+    for result in results:
+        outputs = result.pop("outputs", None)
+        if reference and outputs:
+            result["matches_fp32"] = round(sum(outputs.get(p) == text for p, text in reference.items())
+                                           / len(reference), 3)
+    write_report("bench_inference", results, args.output, model=args.model, max_new_tokens=args.max_new_tokens,
+                 iterations=args.iterations)
+
+
+if __name__ == "__main__":
+    main()
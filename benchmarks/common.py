@@ -0,0 +1,145 @@
+# benchmarks/common.py
+"""
+基准测试的公共工具: 延迟统计、峰值内存、确定性的桩后端和本地模拟 OpenAI 服务。
+
+桩后端只在基准测试进程内替换，用固定的耗时模型代替真实推理，保证不同提交之间的结果可比。
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# 模拟的 Hugging Face 批量推理耗时: 每批固定开销 + 每条提示的边际开销
+STUB_HF_BATCH_OVERHEAD_S = 0.020
+STUB_HF_PER_PROMPT_S = 0.002
+# 模拟的 OpenAI 上游延迟
+FAKE_OPENAI_LATENCY_S = 0.050
+
+
+def summarize(name: str, latencies: Sequence[float], errors: int, elapsed: float, **extra: Any) -> Dict[str, Any]:
+    """把一组请求延迟 (秒) 汇总为 p50/p95/p99、均值和吞吐量"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values.size else (0.0, 0.0, 0.0)
+    return {
+        "name": name,
+        "requests": int(values.size),
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(values.mean()), 3) if values.size else 0.0,
+        "throughput_rps": round(values.size / elapsed, 2) if elapsed > 0 else 0.0,
+        **extra,
+    }
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存 (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def environment_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_report(benchmark: str, results: List[Dict[str, Any]], output: Optional[str], **extra: Any) -> Dict[str, Any]:
+    """输出机器可读的 JSON 报告 (output 为空时打印到标准输出)"""
+    report = {"benchmark": benchmark, "environment": environment_info(), "results": results,
+              "peak_rss_mb": peak_rss_mb(), **extra}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+def stub_generate_texts_hf(model_name="gpt2", prompts=(), dtype=None, max_length=50):
+    """确定性的 generate_texts_hf 替身: 按批耗时模型 sleep，输出只依赖输入"""
+    prompts = list(prompts)
+    time.sleep(STUB_HF_BATCH_OVERHEAD_S + STUB_HF_PER_PROMPT_S * len(prompts))
+    return [f"{prompt} [{model_name}]" for prompt in prompts]
+
+
+def stub_generate_text_hf(model_name="gpt2", prompt_text="Once upon a time", dtype=None, max_length=50):
+    return stub_generate_texts_hf(model_name, [prompt_text], dtype, max_length)[0], None
+
+
+def install_stub_hf_backend() -> None:
+    """用桩实现替换 hf_transformers 模块 (无需安装 transformers/torch，也不加载模型)"""
+    module = types.ModuleType("hf_transformers")
+    module.generate_texts_hf = stub_generate_texts_hf
+    module.generate_text_hf = stub_generate_text_hf
+    sys.modules["hf_transformers"] = module
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(FAKE_OPENAI_LATENCY_S)
+        data = json.dumps({"choices": [{"text": f" echo: {body.get('prompt', '')}"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@contextmanager
+def fake_openai_server() -> Iterator[str]:
+    """在本地启动一个固定延迟的 OpenAI completions 模拟服务，产出其 base_url"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAIHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def use_openai_base_url(base_url: str) -> None:
+    """让 OpenAI 后端指向模拟服务 (在首次使用共享后端之前调用)"""
+    import config
+
+    settings = config.get_config()
+    settings["openai"] = {**settings.get("openai", {}), "base_url": base_url, "max_retries": 0}
+
+
+def make_canvas(num_nodes: int) -> Dict[str, Any]:
+    """生成一个包含 num_nodes 个节点、首尾相连的画布"""
+    items = [{"id": f"node-{i}", "type": "text_generation", "name": f"Node {i}",
+              "top": float(i % 100) * 80, "left": float(i // 100) * 200, "width": 160.0, "height": 60.0,
+              "config": {"model": "gpt-2"}} for i in range(num_nodes)]
+    connections = [{"source": f"node-{i}", "target": f"node-{i + 1}"} for i in range(num_nodes - 1)]
+    return {"canvasItems": items, "connections": connections}
@@ -0,0 +1,62 @@
+# benchmarks/compare.py
+"""
+比较两份基准测试报告 (例如两个提交的结果)，p95 延迟上升或吞吐量下降超过阈值的场景视为回归。
+
+用法:
+    python -m benchmarks.compare baseline.json current.json --threshold 0.10
+退出码: 没有回归时为 0，存在回归时为 1。
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    base_results = {result["name"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        base = base_results.get(result["name"])
+        if base is None:
+            continue
+        p95_change = (result["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        throughput_change = ((result["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"]
+                             if base["throughput_rps"] else 0.0)
+        rows.append({
+            "name": result["name"],
+            "p95_ms": [base["p95_ms"], result["p95_ms"]],
+            "p95_change": round(p95_change, 4),
+            "throughput_rps": [base["throughput_rps"], result["throughput_rps"]],
+            "throughput_change": round(throughput_change, 4),
+            "regression": p95_change > threshold or throughput_change < -threshold,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change treated as a regression")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'scenario':<36} {'p95 ms (base -> now)':>24} {'change':>8} {'rps (base -> now)':>22} {'change':>8}")
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['name']:<36} {row['p95_ms'][0]:>10.2f} -> {row['p95_ms'][1]:<10.2f} {row['p95_change']:>+8.1%} "
+                  f"{row['throughput_rps'][0]:>9.1f} -> {row['throughput_rps'][1]:<9.1f} {row['throughput_change']:>+8.1%}{flag}")
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
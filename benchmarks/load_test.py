@@ -0,0 +1,130 @@
+# benchmarks/load_test.py
+"""
+负载生成器: 通过真实的 HTTP 连接 (uvicorn) 以固定并发持续压测各接口，报告延迟分位数、吞吐量和服务端峰值内存。
+
+默认在子进程中启动 benchmarks.serve；指定 --url 时压测已经运行的服务 (此时不报告服务端内存)。
+
+用法 (在仓库根目录运行):
+    python -m benchmarks.load_test --duration 10 --concurrency 32 --output load.json
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.bench_api import CATALOG_SIZE
+from benchmarks.common import make_canvas, summarize, write_report
+
+# 与 bench_api.seed_catalog 创建的数据一致: 目录数据之后依次是模拟、Hugging Face、OpenAI 模块
+SIMULATED_MODULE_ID = CATALOG_SIZE + 1
+HF_MODULE_ID = CATALOG_SIZE + 2
+OPENAI_MODULE_ID = CATALOG_SIZE + 3
+
+
+def scenarios() -> List[Dict[str, Any]]:
+    prompt = {"input_text": "benchmark prompt"}
+    return [
+        {"name": "catalog.list_modules_page", "method": "GET", "path": "/ai-modules?limit=100"},
+        {"name": "catalog.list_workflows_page", "method": "GET", "path": "/workflows?limit=100"},
+        {"name": "canvas.save_1000", "method": "POST", "path": "/workflows/data/1", "json": make_canvas(1000)},
+        {"name": "canvas.load_1000", "method": "GET", "path": "/workflows/data/1"},
+        {"name": "module.run_simulated", "method": "POST", "path": f"/ai-modules/run/{SIMULATED_MODULE_ID}", "json": prompt},
+        {"name": "module.run_huggingface", "method": "POST", "path": f"/ai-modules/run/{HF_MODULE_ID}", "json": prompt},
+        {"name": "module.run_openai", "method": "POST", "path": f"/ai-modules/run/{OPENAI_MODULE_ID}", "json": prompt},
+    ]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Dict[str, Any], duration: float, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario["method"], scenario["path"], json=scenario.get("json"))
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(scenario["name"], latencies, errors, time.perf_counter() - start, concurrency=concurrency)
+
+
+async def run_load(url: str, duration: float, concurrency: int, only: str) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        # 画布需要先保存一次才能读取
+        await client.post("/workflows/data/1", json=make_canvas(1000))
+        results = []
+        for scenario in scenarios():
+            if only and only not in scenario["name"]:
+                continue
+            results.append(await run_scenario(client, scenario, duration, concurrency))
+        return results
+
+
+def wait_until_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout} seconds")
+
+
+def server_peak_rss_mb(pid: int) -> Optional[float]:
+    """读取子进程的峰值常驻内存 (Linux /proc/<pid>/status 中的 VmHWM)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI-Flow HTTP load generator")
+    parser.add_argument("--url", help="target an already running server instead of starting benchmarks.serve")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--only", default="", help="only run scenarios whose name contains this string")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.serve", "--port", str(args.port)],
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        wait_until_ready(url)
+        results = asyncio.run(run_load(url, args.duration, args.concurrency, args.only))
+        server_rss = server_peak_rss_mb(server.pid) if server else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    write_report("load_test", results, args.output, server_peak_rss_mb=server_rss,
+                 duration_seconds=args.duration, url=url)
+
+
+if __name__ == "__main__":
+    main()
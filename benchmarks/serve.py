@@ -0,0 +1,32 @@
+# benchmarks/serve.py
+"""
+以基准测试配置启动 API 服务 (供 load_test 使用): 桩 Hugging Face 后端、本地模拟 OpenAI 服务、预置数据。
+
+用法:
+    python -m benchmarks.serve --port 8765
+"""
+import argparse
+
+import uvicorn
+
+from benchmarks.common import fake_openai_server, install_stub_hf_backend, use_openai_base_url
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the AI-Flow API with deterministic benchmark backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    install_stub_hf_backend()
+    with fake_openai_server() as base_url:
+        use_openai_base_url(base_url)
+        import main as app_module
+        from benchmarks.bench_api import seed_catalog
+
+        seed_catalog(app_module)
+        uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
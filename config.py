@@ -10,14 +10,52 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "server": {
         "host": "0.0.0.0",
         "port": 8000,
-        "reload": False  # Enable reload for development, disable for production
+        "reload": False,  # Enable reload for development, disable for production
+        "workers": 1 # Worker processes per instance, WEB_CONCURRENCY takes precedence; more than 1 requires shared storage
     },
     "database": {
-        "type": "inmemory", # Options: "inmemory", "postgresql", etc.
-        "url": None # Connection URL if applicable
+        "type": "inmemory", # Options: "inmemory" (single worker only), "postgresql", "redis"
+        "url": None, # Connection URL if applicable, falls back to the DATABASE_URL environment variable
+        "pool_min_size": 1, # Connection pool bounds for "postgresql"
+        "pool_max_size": 10,
+        "redis_url": None, # Used by "redis" storage and cache invalidation, falls back to the REDIS_URL environment variable
+        "key_prefix": "aiflow:",
+        "local_cache": { # Per-process read cache in front of shared storage, invalidated across workers via Redis pub/sub
+            "enabled": False,
+            "max_entries": 10000,
+            "ttl_seconds": 30 # Upper bound on staleness if an invalidation message is lost
+        }
     },
     "ai_models": {
         "default_text_generation_model": "gpt-2",
+        "default_dtype": "float32", # torch dtype used when loading local Hugging Face models
+        "stream_timeout_seconds": 60, # Streaming local generation fails when no new text arrives for this long
+        "model_pool": {
+            "max_memory_mb": 4096 # RAM budget for loaded models, least recently used models are evicted beyond it
+        },
+        "batching": {
+            "enabled": True, # Coalesce concurrent local text generation requests into one forward pass
+            "max_batch_size": 8,
+            "max_wait_ms": 10 # How long the first request of a batch waits for others to join
+        },
+        "prefix_cache": { # Reuse past_key_values of text generation modules' "prompt_prefix" across requests
+            "enabled": True,
+            "max_memory_mb": 512, # Budget for cached KV tensors, least recently used prefixes are evicted beyond it
+            "min_prefix_tokens": 32 # Shorter prefixes are cheaper to recompute than to copy
+        },
+        "inference": { # How local text generation models are executed, mostly relevant on CPU-only nodes
+            "default_mode": "fp32", # "fp32" (PyTorch, loaded in default_dtype), "int8" (dynamic quantization of linear layers) or "onnx" (ONNX Runtime via optimum)
+            "models": {}, # Per-model override, e.g. {"gpt2": "int8", "distilgpt2": "onnx"}
+            "artifact_dir": None, # Quantized/exported models are cached here and reused on restart, defaults to ~/.cache/ai-flow/models
+            "onnx_provider": "CPUExecutionProvider"
+        },
+        "image_classification": { # Local image classification modules with backend "huggingface"
+            "default_model": "google/vit-base-patch16-224",
+            "batch_size": 32, # Images per forward pass
+            "decode_workers": None, # Image decode/resize threads, defaults to the CPU count
+            "max_images": 10000, # Upper bound on image_paths/image_dir size of one run
+            "image_root": "data/images" # image_path/image_paths/image_dir must resolve under this directory, relative paths are resolved against it
+        },
         # ... other default AI model configurations ...
     },
     "api_keys": {
@@ -29,6 +67,85 @@ DEFAULT_CONFIG: Dict[str, Any] = {
         "enable_plugin_system": False,
         "show_debug_info": True,
         # ... other feature flags ...
+    },
+    "plugins": {
+        # Extra module types registered when feature_flags.enable_plugin_system is on,
+        # in addition to installed packages' "aiflow.module_types" entry points.
+        "module_types": {} # e.g. {"sentiment_analysis": "my_package.handlers:run_sentiment"}
+    },
+    "openai": {
+        "base_url": "https://api.openai.com/v1", # Point at a local stand-in server for testing
+        "max_connections": 200, # Upper bound of concurrent upstream connections per process
+        "max_keepalive_connections": 50,
+        "timeout_seconds": 30,
+        "max_retries": 3, # Retries on 429/5xx and network errors, with jittered exponential backoff
+        "scheduler": { # Client-side rate limiting in front of the shared OpenAI backend
+            "enabled": False,
+            "requests_per_minute": 3500, # Match the account's RPM/TPM limits
+            "tokens_per_minute": 90000,
+            "burst_seconds": 10, # Bucket capacity in seconds of quota
+            "chars_per_token": 4, # Prompt length estimate, max_tokens is added on top
+            "default_weight": 1.0, # Fair-share weight of tenants not listed below
+            "tenant_weights": {} # e.g. {"workflow:42": 4.0, "module:7": 0.5}
+        }
+    },
+    "execution": {
+        # Pools used to run blocking module logic off the event loop.
+        # "thread" suits blocking I/O and inference that releases the GIL (including the NumPy-based data_processing),
+        # "process" suits pure-Python CPU-bound work; process pools start fresh interpreters ("spawn") and do not
+        # share in-process state such as the keyword corpus index or the model pool.
+        "default": {"kind": "thread", "max_workers": 8},
+        "module_types": {
+            "text_generation": {"kind": "thread", "max_workers": 4},
+            "image_classification": {"kind": "thread", "max_workers": 4},
+            "data_processing": {"kind": "thread", "max_workers": 4}
+        },
+        "batch_max_items": 256, # Maximum number of inputs accepted by one batch run request
+        "batch_max_concurrency": 16, # Items of one batch run in flight at the same time (e.g. concurrent OpenAI calls)
+        "coalesce_identical_runs": True # Concurrent runs with the same type, config and input share one execution
+    },
+    "result_cache": {
+        "enabled": False, # Opt-in cache of deterministic module run results
+        "redis_url": None, # L2 cache, falls back to the REDIS_URL environment variable; only the in-process L1 is used when unset
+        "l1_max_entries": 1024,
+        "max_item_bytes": 262144, # Results larger than this are not cached
+        "ttl_seconds": { # Per-module-type TTL, module types not listed here are not cached
+            "text_generation": 3600,
+            "image_classification": 86400,
+            "data_processing": 3600
+        }
+    },
+    "workflow_engine": {
+        "max_concurrency": 8, # Maximum number of nodes executed at the same time within one workflow run
+        # Only module types with a result_cache.ttl_seconds entry are memoized, OpenAI nodes with temperature != 0 always run
+        "node_memo": { # Per-node output memoization keyed by a Merkle hash of type, config, inputs and upstream outputs
+            "enabled": True,
+            "max_entries": 4096,
+            "max_bytes": 67108864, # Total serialized size of memoized outputs, least recently used are evicted beyond it
+            "max_item_bytes": 1048576 # Outputs larger than this are recomputed on every run
+        }
+    },
+    "jobs": {
+        "backend": "inmemory", # "inmemory" (single process, tests) or "redis" (shared by all instances)
+        "redis_url": None, # Falls back to the REDIS_URL environment variable
+        "workers": 2, # Worker coroutines pulling jobs in each process, 0 to only accept jobs
+        "visibility_timeout_seconds": 300, # Jobs whose worker stops renewing the lease are requeued after this
+        "max_attempts": 3,
+        "poll_interval_ms": 200,
+        "result_ttl_seconds": 86400, # How long finished jobs are kept (Redis key TTL, evicted from the in-memory queue)
+        "max_finished_jobs": 10000 # Upper bound on finished jobs kept by the in-memory queue, oldest are evicted first
+    },
+    "metrics": {
+        "enabled": True # Per-route request metrics middleware and the /metrics endpoint collectors
+    },
+    "keywords": {
+        "index_path": None, # .npz corpus index, loaded at startup and rewritten after each POST /keywords/corpus
+        "n_features": 1048576 # Hash buckets of a new corpus index
+    },
+    "pagination": {
+        "default_limit": 100, # Page size of list endpoints when the client does not pass limit
+        "max_limit": 1000,
+        "export_batch_size": 500 # Rows fetched per round trip by the NDJSON export endpoints
     }
     # ... add more default settings as needed ...
 }
@@ -57,6 +174,20 @@ if "AI_FLOW_SERVER_PORT" in os.environ:
         _loaded_config["server"]["port"] = int(os.environ["AI_FLOW_SERVER_PORT"])
     except ValueError:
         print(f"Invalid environment variable AI_FLOW_SERVER_PORT. Using configuration file value: {_loaded_config['server']['port']}")
+# Example: Select the storage backend using environment variable AI_FLOW_DATABASE_TYPE
+if "AI_FLOW_DATABASE_TYPE" in os.environ:
+    _loaded_config["database"] = {**_loaded_config["database"], "type": os.environ["AI_FLOW_DATABASE_TYPE"]}
+# Example: Enable the per-process storage read cache using environment variable AI_FLOW_LOCAL_CACHE=1
+if "AI_FLOW_LOCAL_CACHE" in os.environ:
+    _loaded_config["database"] = {**_loaded_config["database"], "local_cache": {
+        **_loaded_config["database"].get("local_cache", {}), "enabled": os.environ["AI_FLOW_LOCAL_CACHE"] == "1"}}
+# Example: Select the job queue backend using environment variable AI_FLOW_JOBS_BACKEND
+if "AI_FLOW_JOBS_BACKEND" in os.environ:
+    _loaded_config["jobs"] = {**_loaded_config["jobs"], "backend": os.environ["AI_FLOW_JOBS_BACKEND"]}
+# Example: Select the default local inference mode using environment variable AI_FLOW_INFERENCE_MODE (fp32, int8, onnx)
+if "AI_FLOW_INFERENCE_MODE" in os.environ:
+    _loaded_config["ai_models"] = {**_loaded_config["ai_models"], "inference": {
+        **_loaded_config["ai_models"].get("inference", {}), "default_mode": os.environ["AI_FLOW_INFERENCE_MODE"]}}
 # Add more environment variable overrides as needed, following the same pattern
 
 # --- Configuration Access Functions ---
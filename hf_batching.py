@@ -0,0 +1,196 @@
+# ai_model_integration/hf_batching.py
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from config import get_setting
+from services.metrics import HF_BATCH_QUEUE_WAIT, HF_BATCH_SIZE
+
+
+class _PendingRequest:
+    def __init__(self, prompt: str, options: Tuple, future: Future):
+        self.prompt = prompt
+        self.options = options
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    动态微批调度器: 把同一模型的并发请求合并成一个批次执行。
+
+    第一个请求到达后最多等待 max_wait_ms，期间到达的、生成参数相同的请求会并入同一批，
+    直到达到 max_batch_size。批次结果按顺序拆分回各请求的 Future。
+    每组生成参数一个 FIFO 队列，组批时只从同组队列的头部取请求，不需要扫描其他参数的请求。
+    批大小和排队等待时间记录在 /metrics 的 aiflow_hf_batch_size / aiflow_hf_batch_queue_wait_seconds 中
+    (标签 model 的值为构造时传入的 name)。
+    """
+
+    def __init__(self, run_batch: Callable[[List[str], Dict[str, Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10, name: str = "default"):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self.batch_size_histogram = HF_BATCH_SIZE.labels(name)
+        self.queue_wait_histogram = HF_BATCH_QUEUE_WAIT.labels(name)
+        # 生成参数 -> 该参数的请求队列 (只保留非空队列)
+        self._queues: Dict[Tuple, Deque[_PendingRequest]] = {}
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, prompt: str, **generate_kwargs: Any) -> Future:
+        """提交一个生成请求，返回在批次完成后被设置结果的 Future"""
+        return self.submit_many([prompt], **generate_kwargs)[0]
+
+    def submit_many(self, prompts: Sequence[str], **generate_kwargs: Any) -> List[Future]:
+        """
+        一次性提交多个请求 (在同一次加锁中入队)，调度线程无需等待即可按 max_batch_size 切成整批。
+        """
+        options = tuple(sorted(generate_kwargs.items()))
+        requests = [_PendingRequest(prompt, options, Future()) for prompt in prompts]
+        with self._condition:
+            queue = self._queues.get(options)
+            if queue is None:
+                queue = self._queues[options] = deque()
+            queue.extend(requests)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"hf-batcher-{self.name}", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return [request.future for request in requests]
+
+    def generate(self, prompt: str, **generate_kwargs: Any) -> Any:
+        """阻塞式提交并等待结果"""
+        return self.submit(prompt, **generate_kwargs).result()
+
+    def _next_batch(self) -> List[_PendingRequest]:
+        with self._condition:
+            while not self._queues:
+                self._condition.wait()
+            # 先处理队头请求等待最久的参数组，各组之间仍按到达顺序
+            options = min(self._queues, key=lambda key: self._queues[key][0].enqueued_at)
+            queue = self._queues[options]
+            first = queue.popleft()
+            batch = [first]
+            deadline = first.enqueued_at + self.max_wait_ms / 1000
+            while True:
+                while queue and len(batch) < self.max_batch_size:
+                    batch.append(queue.popleft())
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if not queue and self._queues.get(options) is queue:
+                del self._queues[options]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            for request in batch:
+                self.queue_wait_histogram.observe(started - request.enqueued_at)
+            self.batch_size_histogram.observe(len(batch))
+
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.run_batch([request.prompt for request in batch], dict(batch[0].options))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+            if len(results) < len(batch):
+                # 结果数少于请求数时，没有对应结果的请求以错误结束，而不是永远挂起
+                error = RuntimeError(f"批次返回了 {len(results)} 个结果，期望 {len(batch)} 个")
+                for request in batch[len(results):]:
+                    request.future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queue_depth = sum(len(queue) for queue in self._queues.values())
+        return {
+            "queue_depth": queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+        }
+
+
+_batchers: Dict[Tuple[str, Optional[str]], MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_text_generation_batcher(model_name: str = "gpt2", dtype: Optional[str] = None) -> MicroBatcher:
+    """返回指定模型的微批调度器 (每个模型一个队列)"""
+    key = (model_name, dtype)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            def run_batch(prompts: List[str], options: Dict[str, Any]) -> List[Any]:
+                from hf_transformers import generate_texts_hf
+                return generate_texts_hf(model_name, prompts, dtype=dtype, **options)
+
+            batcher = _batchers[key] = MicroBatcher(
+                run_batch,
+                max_batch_size=get_setting("ai_models.batching.max_batch_size", 8),
+                max_wait_ms=get_setting("ai_models.batching.max_wait_ms", 10),
+                name=f"{model_name}:{dtype or 'default'}",
+            )
+        return batcher
+
+
+def generate_text_hf_batched(model_name="gpt2", prompt_text="Once upon a time", dtype=None, max_length=50):
+    """
+    通过微批调度器生成文本，返回值与 hf_transformers.generate_text_hf 一致。
+
+    Returns:
+        str: 生成的文本结果.
+        str: 错误信息，如果生成过程中发生错误，否则为 None.
+    """
+    if not get_setting("ai_models.batching.enabled", True):
+        from hf_transformers import generate_text_hf
+        return generate_text_hf(model_name, prompt_text, dtype=dtype)
+    try:
+        batcher = get_text_generation_batcher(model_name, dtype)
+        return batcher.generate(prompt_text, max_length=max_length), None
+    except Exception as e:
+        error_message = f"文本生成过程中发生错误: {str(e)}"
+        print(error_message)
+        return None, error_message
+
+
+async def generate_text_hf_batched_async(model_name="gpt2", prompt_text="Once upon a time", dtype=None, max_length=50):
+    """
+    generate_text_hf_batched 的异步版本: 在事件循环中提交到微批调度器并等待 Future。
+
+    等待期间不占用执行层的线程，同时在途的请求数不受 text_generation 线程池大小的限制，
+    并发请求可以凑满 max_batch_size。调用方被取消时，尚未开始执行的请求会从批次中移除。
+
+    Returns:
+        str: 生成的文本结果.
+        str: 错误信息，如果生成过程中发生错误，否则为 None.
+    """
+    try:
+        batcher = get_text_generation_batcher(model_name, dtype)
+        return await asyncio.wrap_future(batcher.submit(prompt_text, max_length=max_length)), None
+    except Exception as e:
+        error_message = f"文本生成过程中发生错误: {str(e)}"
+        print(error_message)
+        return None, error_message
+
+
+def get_batching_stats() -> Dict[str, Any]:
+    """返回每个模型的批大小、排队等待时间直方图和当前队列深度"""
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {f"{model_name}:{dtype or 'default'}": batcher.stats()
+            for (model_name, dtype), batcher in batchers.items()}
@@ -0,0 +1,198 @@
+# ai_model_integration/hf_inference.py
+# 本地文本生成模型的推理模式: fp32 (PyTorch 原始模型)、int8 (线性层动态量化) 和 onnx (ONNX Runtime)。
+# 量化和导出的产物缓存在磁盘上 (ai_models.inference.artifact_dir)，下次启动直接加载，不再重复转换。
+# 与 hf_transformers 一样，torch/transformers/optimum 只在函数内部导入。
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+from config import get_setting
+from services.metrics import HF_ARTIFACT_REBUILDS
+
+INFERENCE_MODES = ("fp32", "int8", "onnx")
+INT8_WEIGHTS_FILE = "quantized_state_dict.pt"
+
+def get_inference_mode(model_name):
+    """
+    返回模型的推理模式: ai_models.inference.models 中的单独设置优先，否则为 ai_models.inference.default_mode。
+
+    Raises:
+        ValueError: 配置了未知的模式.
+    """
+    settings = get_setting("ai_models.inference", {})
+    mode = settings.get("models", {}).get(model_name) or settings.get("default_mode", "fp32")
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"模型 '{model_name}' 的推理模式 '{mode}' 无效，可选: {', '.join(INFERENCE_MODES)}")
+    return mode
+
+def model_variant(model_name, dtype=None):
+    """
+    模型池和前缀缓存键中区分模型变体的部分: fp32 模式为加载时使用的 torch dtype，其他模式为模式名。
+    """
+    mode = get_inference_mode(model_name)
+    if mode == "fp32":
+        return dtype or get_setting("ai_models.default_dtype", "float32")
+    return mode
+
+def _library_versions(mode):
+    import torch
+    import transformers
+    versions = [torch.__version__, transformers.__version__]
+    if mode == "onnx":
+        import onnxruntime
+        from optimum.version import __version__ as optimum_version
+        versions += [onnxruntime.__version__, optimum_version]
+    return versions
+
+def get_artifact_path(model_name, mode):
+    """
+    返回模型在某个模式下的产物目录: <artifact_dir>/<模型名>-<模式>-<指纹>。
+
+    指纹包含 torch/transformers (onnx 模式还有 onnxruntime/optimum) 的版本，升级依赖后会重新转换，
+    不会加载与当前版本不兼容的旧产物。
+    """
+    artifact_dir = (get_setting("ai_models.inference", {}).get("artifact_dir")
+                    or os.path.join(os.path.expanduser("~"), ".cache", "ai-flow", "models"))
+    fingerprint = hashlib.sha256(repr([model_name, mode, *_library_versions(mode)]).encode("utf-8")).hexdigest()[:16]
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+    return os.path.join(artifact_dir, f"{safe_name}-{mode}-{fingerprint}")
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def _build_artifact(path, build):
+    """
+    在临时目录中生成产物，完成后原子地重命名为 path。
+
+    进程中途退出不会留下不完整的产物；多个 worker 同时转换同一个模型时保留先完成的那份。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(staging)
+    try:
+        result = build(staging)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        return result
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _conv1d_to_linear(model):
+    """GPT-2 等模型的投影层是 transformers 的 Conv1D (y = x @ W + b)，动态量化只处理 nn.Linear，先等价替换"""
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.nf)
+                with torch.no_grad():
+                    linear.weight.copy_(child.weight.t())
+                    linear.bias.copy_(child.bias)
+                setattr(parent, name, linear)
+    return model
+
+def _quantize_int8(model):
+    """线性层的权重量化为 int8，激活在运行时动态量化 (CPU 上矩阵乘法使用 int8 内核)"""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(_conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+def _build_int8(model_name, staging):
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model.config.save_pretrained(staging)
+    model.generation_config.save_pretrained(staging)
+    tokenizer.save_pretrained(staging)
+    model = _quantize_int8(model)
+    torch.save(model.state_dict(), os.path.join(staging, INT8_WEIGHTS_FILE))
+    return model, tokenizer
+
+def _load_int8(path):
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+
+    # 只从配置构建模型结构 (不读取 fp32 权重文件)，量化后载入缓存的 int8 权重
+    model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(path), torch_dtype=torch.float32)
+    model.eval()
+    model = _quantize_int8(model)
+    model.load_state_dict(torch.load(os.path.join(path, INT8_WEIGHTS_FILE), weights_only=True))
+    model.generation_config = GenerationConfig.from_pretrained(path)
+    return model, AutoTokenizer.from_pretrained(path)
+
+def _onnx_provider():
+    return get_setting("ai_models.inference", {}).get("onnx_provider", "CPUExecutionProvider")
+
+def _build_onnx(model_name, staging):
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    model = ORTModelForCausalLM.from_pretrained(model_name, export=True, provider=_onnx_provider())
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model.save_pretrained(staging)
+    tokenizer.save_pretrained(staging)
+    return model, tokenizer
+
+def _load_onnx(path):
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    return ORTModelForCausalLM.from_pretrained(path, provider=_onnx_provider()), AutoTokenizer.from_pretrained(path)
+
+def _load_artifact(path, load):
+    """
+    加载磁盘上的产物。
+
+    Returns:
+        tuple: (模型, 分词器)，加载失败时为 None.
+        str: 错误信息，如果加载过程中发生错误，否则为 None.
+    """
+    try:
+        return load(path), None
+    except Exception as e:
+        return None, f"加载推理产物 '{path}' 失败: {str(e)}"
+
+_BUILDERS = {"int8": (_build_int8, _load_int8), "onnx": (_build_onnx, _load_onnx)}
+
+def load_text_generation_model(model_name, mode):
+    """
+    加载 int8 或 onnx 模式的文本生成模型: 磁盘上有当前版本的产物时直接加载，否则从原始模型转换并写入产物目录。
+
+    Args:
+        model_name (str): Hugging Face 模型名称或路径.
+        mode (str): "int8" 或 "onnx".
+
+    Returns:
+        模型 (带 footprint_bytes 属性，供模型池估算内存) 和分词器.
+
+    Raises:
+        RuntimeError: 产物损坏且重新转换也失败 (错误信息包含两次失败的原因).
+    """
+    build, load = _BUILDERS[mode]
+    path = get_artifact_path(model_name, mode)
+    loaded = load_error = None
+    if os.path.isdir(path):
+        loaded, load_error = _load_artifact(path, load)
+        if load_error:
+            # 产物损坏 (例如磁盘写满时被截断) 时删除并重新转换，重建次数记录在 aiflow_hf_artifact_rebuilds_total
+            HF_ARTIFACT_REBUILDS.labels(mode).inc()
+            shutil.rmtree(path, ignore_errors=True)
+    if loaded is None:
+        try:
+            loaded = _build_artifact(path, lambda staging: build(model_name, staging))
+        except Exception as e:
+            if load_error:
+                raise RuntimeError(f"{load_error}，重新转换也失败: {str(e)}") from e
+            raise
+    model, tokenizer = loaded
+    # int8 的打包权重不在 parameters() 中，ONNX Runtime 会话没有 torch 张量，用产物大小近似内存占用
+    model.footprint_bytes = _directory_bytes(path)
+    return model, tokenizer
@@ -1,24 +1,72 @@
 # ai_model_integration/hf_transformers.py
-from transformers import pipeline, set_seed
+# transformers/torch 的导入耗时数秒并占用数百 MB 内存，因此只在函数内部导入，
+# 导入本模块本身不会加载它们 (只有真正运行 Hugging Face 模块的进程才付出这部分代价)。
+import copy
+import functools
+import hashlib
+import queue
+import threading
 
-def generate_text_hf(model_name="gpt2", prompt_text="Once upon a time"):
+from config import get_setting
+from hf_inference import get_inference_mode, load_text_generation_model, model_variant
+from model_pool import ModelPool, get_model_pool
+from services.metrics import HF_PREFIX_PREFILL_DURATION
+
+def get_text_generation_pipeline(model_name="gpt2", dtype=None):
+    """
+    从进程级模型池获取文本生成 pipeline，每个 (model_name, task, dtype) 只加载一次。
+
+    推理模式由 ai_models.inference 按模型配置: fp32 按 dtype 加载原始模型，int8/onnx 使用量化或导出的模型 (忽略 dtype)。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "gpt2".
+        dtype (str, optional): torch 数据类型名称，例如 "float32"、"bfloat16". 默认读取 ai_models.default_dtype.
+
+    Returns:
+        transformers.Pipeline: 文本生成 pipeline.
+    """
+    dtype = dtype or get_setting("ai_models.default_dtype", "float32")
+    mode = get_inference_mode(model_name)
+
+    def load():
+        from transformers import pipeline
+        if mode != "fp32":
+            # int8/onnx: 从磁盘产物加载 (首次使用时转换)
+            model, tokenizer = load_text_generation_model(model_name, mode)
+            generator = pipeline('text-generation', model=model, tokenizer=tokenizer)
+        else:
+            import torch
+            generator = pipeline('text-generation', model=model_name, torch_dtype=getattr(torch, dtype))
+        # GPT-2 等模型没有 pad token，批量生成时使用 eos 代替，并在左侧填充。
+        # 分词器在池中被所有请求共享，只在加载时设置一次，生成时不再修改
+        if generator.tokenizer.pad_token_id is None:
+            generator.tokenizer.pad_token_id = generator.model.config.eos_token_id
+        generator.tokenizer.padding_side = "left"
+        return generator
+
+    return get_model_pool().get((model_name, 'text-generation', model_variant(model_name, dtype)), load)
+
+def generate_text_hf(model_name="gpt2", prompt_text="Once upon a time", dtype=None):
     """
     使用 Hugging Face Transformers 库生成文本。
 
     Args:
         model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "gpt2" (小型 GPT-2 模型).
         prompt_text (str, optional): 生成文本的起始提示文本. 默认为 "Once upon a time".
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
 
     Returns:
         str: 生成的文本结果.
         str: 错误信息，如果生成过程中发生错误，否则为 None.
     """
     try:
+        from transformers import set_seed
+
         # 设置随机种子以获得可重复的结果 (仅用于示例目的，生产环境可能不需要)
         set_seed(42)
 
-        # 创建文本生成 pipeline
-        generator = pipeline('text-generation', model=model_name)
+        # 从模型池获取文本生成 pipeline (首次使用时加载，之后直接复用)
+        generator = get_text_generation_pipeline(model_name, dtype)
 
         # 使用 pipeline 生成文本
         generation_output = generator(prompt_text,
@@ -35,6 +83,216 @@ def generate_text_hf(model_name="gpt2", prompt_text="Once upon a time"):
         print(error_message) # 打印错误信息到控制台，方便调试
         return None, error_message # 返回 None 和错误信息
 
+def generate_texts_hf(model_name="gpt2", prompts=(), dtype=None, max_length=50):
+    """
+    一次前向批量生成多条文本 (供微批调度器 hf_batching 使用)。
+
+    不同长度的提示在左侧填充后合并为一个批次 (填充方式在加载 pipeline 时设置)，输出顺序与 prompts 一致。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "gpt2".
+        prompts (list[str]): 提示文本列表.
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
+        max_length (int, optional): 生成文本的最大长度. 默认为 50.
+
+    Returns:
+        list[str]: 生成的文本列表. 出错时直接抛出异常，由调用方分发给每个请求.
+    """
+    prompts = list(prompts)
+    if not prompts:
+        return []
+
+    from transformers import set_seed
+
+    set_seed(42)
+    generator = get_text_generation_pipeline(model_name, dtype)
+    generation_output = generator(prompts,
+                                  batch_size=len(prompts),
+                                  max_length=max_length,
+                                  num_return_sequences=1)
+    return [output[0]['generated_text'] for output in generation_output]
+
+def estimate_kv_cache_bytes(past_key_values):
+    """
+    估算 past_key_values 占用的内存 (所有层 key/value 张量的字节数)。
+
+    兼容新版 DynamicCache (layers)、旧版 DynamicCache (key_cache/value_cache) 和元组格式。
+    """
+    if hasattr(past_key_values, "layers"):
+        tensors = [t for layer in past_key_values.layers for t in (layer.keys, layer.values)]
+    elif hasattr(past_key_values, "key_cache"):
+        tensors = list(past_key_values.key_cache) + list(past_key_values.value_cache)
+    else:
+        tensors = [t for layer in past_key_values for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+def get_prefix_cache():
+    """
+    返回进程级共享的提示前缀 KV 缓存 (内存预算来自 ai_models.prefix_cache.max_memory_mb)。
+
+    复用模型池的实现: 键为 (模型名, dtype, 前缀 token 序列的哈希)，按内存预算 LRU 淘汰，
+    同一个前缀的并发请求只做一次预填充。
+    """
+    global _prefix_cache
+    if _prefix_cache is None:
+        with _prefix_cache_lock:
+            if _prefix_cache is None:
+                max_memory_mb = get_setting("ai_models.prefix_cache", {}).get("max_memory_mb", 512)
+                _prefix_cache = ModelPool(int(max_memory_mb * 1024 * 1024), size_estimator=estimate_kv_cache_bytes,
+                                          load_duration=HF_PREFIX_PREFILL_DURATION)
+    return _prefix_cache
+
+def get_prefix_cache_stats():
+    """返回前缀 KV 缓存的统计信息，尚未使用过时返回 None"""
+    return _prefix_cache.stats() if _prefix_cache is not None else None
+
+def generate_text_hf_prefixed(model_name="gpt2", prefix_text="", prompt_text="", dtype=None, max_new_tokens=50):
+    """
+    生成 "固定前缀 + 可变后缀" 形式的提示，复用前缀的 past_key_values，只对后缀做前向计算。
+
+    前缀和后缀分别分词后拼接，保证同一前缀总是得到相同的 token 序列 (从而命中缓存)。
+    前缀短于 ai_models.prefix_cache.min_prefix_tokens 或缓存被禁用时不使用缓存。
+    与 generate_text_hf 不同，长度限制的是新生成的 token 数 (前缀通常很长，max_length 容易被提示本身占满)。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "gpt2".
+        prefix_text (str): 固定前缀 (系统指令、少样本示例等).
+        prompt_text (str): 可变后缀.
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
+        max_new_tokens (int, optional): 最多生成的 token 数. 默认为 50.
+
+    Returns:
+        str: 生成的文本结果 (包含提示文本).
+        str: 错误信息，如果生成过程中发生错误，否则为 None.
+    """
+    try:
+        import torch
+        from transformers import set_seed
+
+        set_seed(42)
+        dtype = dtype or get_setting("ai_models.default_dtype", "float32")
+        generator = get_text_generation_pipeline(model_name, dtype)
+        tokenizer, model = generator.tokenizer, generator.model
+
+        prefix_ids = tokenizer(prefix_text)["input_ids"]
+        suffix_ids = tokenizer(prompt_text, add_special_tokens=False)["input_ids"]
+        input_ids = torch.tensor([prefix_ids + suffix_ids], device=model.device)
+        generation_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+        )
+
+        settings = get_setting("ai_models.prefix_cache", {})
+        variant = model_variant(model_name, dtype)
+        # 缓存的前缀必须严格短于完整输入，生成第一个 token 至少需要对一个新 token 做前向计算；
+        # ONNX Runtime 模型的 past_key_values 不能跨请求复制复用，直接完整计算
+        if (settings.get("enabled", True) and settings.get("min_prefix_tokens", 32) <= len(prefix_ids) and suffix_ids
+                and variant != "onnx"):
+            def prefill():
+                with torch.no_grad():
+                    return model(torch.tensor([prefix_ids], device=model.device), use_cache=True).past_key_values
+
+            prefix_hash = hashlib.sha256(repr(prefix_ids).encode("utf-8")).hexdigest()
+            past_key_values = get_prefix_cache().get((model_name, variant, prefix_hash), prefill)
+            # generate 会就地追加缓存，复制一份，缓存中的前缀保持不变
+            generation_kwargs["past_key_values"] = copy.deepcopy(past_key_values)
+
+        with torch.no_grad():
+            output_ids = model.generate(**generation_kwargs)
+        return tokenizer.decode(output_ids[0], skip_special_tokens=True), None
+
+    except Exception as e:
+        error_message = f"文本生成过程中发生错误: {str(e)}"
+        print(error_message)
+        return None, error_message
+
+@functools.lru_cache(maxsize=None)
+def _stop_on_event_class():
+    """首次流式生成时才定义 StoppingCriteria 子类 (避免在导入时加载 transformers)"""
+    from transformers import StoppingCriteria
+
+    class _StopOnEvent(StoppingCriteria):
+        """外部设置 stop_event 后在下一个 token 处停止生成 (用于客户端断开时取消)"""
+
+        def __init__(self, stop_event):
+            self.stop_event = stop_event
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return self.stop_event.is_set()
+
+    return _StopOnEvent
+
+def stream_text_hf(model_name="gpt2", prompt_text="Once upon a time", dtype=None, max_length=50, stop_event=None,
+                   executor=None):
+    """
+    流式生成文本，逐段产出新生成的文本 (不包含提示文本本身)。
+
+    生成在 executor (例如模块执行层的 text_generation 线程池) 中进行，未指定时使用一个后台线程；
+    设置 stop_event 后生成会在下一个 token 处停止，不再消耗算力。
+    生成出错时异常在消费方重新抛出；超过 ai_models.stream_timeout_seconds 没有新的片段时抛出 TimeoutError。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "gpt2".
+        prompt_text (str, optional): 生成文本的起始提示文本.
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
+        max_length (int, optional): 生成文本的最大长度. 默认为 50.
+        stop_event (threading.Event, optional): 取消信号.
+        executor (concurrent.futures.Executor, optional): 运行生成的线程池.
+
+    Yields:
+        str: 新生成的文本片段.
+    """
+    from transformers import StoppingCriteriaList, TextIteratorStreamer, set_seed
+
+    stop_event = stop_event or threading.Event()
+    timeout = get_setting("ai_models.stream_timeout_seconds", 60)
+    set_seed(42)
+    generator = get_text_generation_pipeline(model_name, dtype)
+    tokenizer, model = generator.tokenizer, generator.model
+
+    inputs = tokenizer(prompt_text, return_tensors="pt").to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+    generation_kwargs = dict(
+        **inputs,
+        streamer=streamer,
+        max_length=max_length,
+        pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+        stopping_criteria=StoppingCriteriaList([_stop_on_event_class()(stop_event)]),
+    )
+    errors = []
+
+    def generate():
+        try:
+            model.generate(**generation_kwargs)
+        except Exception as e:
+            # 记录异常并结束 streamer，否则消费方会一直等待下一个片段
+            errors.append(e)
+            streamer.end()
+
+    future = None
+    if executor is not None:
+        future = executor.submit(generate)
+    else:
+        threading.Thread(target=generate, daemon=True).start()
+    try:
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        except queue.Empty:
+            raise TimeoutError(f"文本生成超过 {timeout} 秒没有产出新的内容") from None
+        if errors:
+            raise errors[0]
+    finally:
+        stop_event.set()
+        if future is not None:
+            future.cancel()  # 还在排队时不再运行
+
 
 # 示例用法 (可选，但推荐用于测试模块)
 if __name__ == "__main__":
@@ -0,0 +1,260 @@
+# ai_model_integration/hf_vision.py
+# 基于 Hugging Face Transformers 的图像分类后端。
+# 与 hf_transformers 一样，Pillow/transformers/torch 只在函数内部导入，导入本模块不会加载它们。
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import get_setting
+from model_pool import get_model_pool
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+class ImageClassifier:
+    """模型池中的图像分类条目: 模型本体 + 预处理参数 (尺寸、均值、方差)"""
+
+    def __init__(self, model, processor):
+        self.model = model
+        self.labels = model.config.id2label
+        size = getattr(processor, "size", None) or {"height": 224, "width": 224}
+        crop_size = getattr(processor, "crop_size", None)
+        if "shortest_edge" in size:
+            # ResNet/ConvNeXt 等: 短边缩放后中心裁剪
+            edge = size["shortest_edge"]
+            crop_pct = getattr(processor, "crop_pct", None)
+            self.height, self.width = (crop_size["height"], crop_size["width"]) if crop_size else (edge, edge)
+            self.resize_shortest = int(edge / crop_pct) if crop_pct else edge
+        else:
+            # ViT 等: 直接缩放到固定尺寸
+            self.height, self.width = size["height"], size["width"]
+            self.resize_shortest = None
+        self.do_normalize = getattr(processor, "do_normalize", True)
+        self.mean = np.asarray(getattr(processor, "image_mean", None) or (0.5, 0.5, 0.5), dtype=np.float32)
+        self.std = np.asarray(getattr(processor, "image_std", None) or (0.5, 0.5, 0.5), dtype=np.float32)
+
+def get_image_classifier(model_name="google/vit-base-patch16-224", dtype=None):
+    """
+    从进程级模型池获取图像分类模型，每个 (model_name, task, dtype) 只加载一次。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径. 默认为 "google/vit-base-patch16-224".
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
+
+    Returns:
+        ImageClassifier: 模型和预处理参数.
+    """
+    dtype = dtype or get_setting("ai_models.default_dtype", "float32")
+
+    def load():
+        import torch
+        from transformers import AutoImageProcessor, AutoModelForImageClassification
+        model = AutoModelForImageClassification.from_pretrained(model_name, torch_dtype=getattr(torch, dtype))
+        model.eval()
+        return ImageClassifier(model, AutoImageProcessor.from_pretrained(model_name))
+
+    return get_model_pool().get((model_name, 'image-classification', dtype), load)
+
+def decode_image(image_path, height, width, resize_shortest=None):
+    """
+    通过内存映射读取图像文件并解码、缩放为 (height, width, 3) 的 uint8 数组。
+
+    mmap 让解码器直接读取页缓存，不需要先把整个文件复制到 Python bytes 中；
+    JPEG 使用 draft 模式在解码时就按 DCT 缩放，大图的解码开销随目标尺寸而不是原图尺寸增长。
+
+    Args:
+        image_path (str): 图像文件路径.
+        height (int): 输出高度.
+        width (int): 输出宽度.
+        resize_shortest (int, optional): 设置时先把短边缩放到该值再中心裁剪，否则直接缩放.
+
+    Returns:
+        numpy.ndarray: uint8 数组.
+    """
+    from PIL import Image
+
+    with open(image_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"图像文件 '{image_path}' 为空")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            image = Image.open(mapped)
+            target = resize_shortest or max(height, width)
+            image.draft("RGB", (target, target))
+            image = image.convert("RGB")  # 在 mmap 关闭之前完成解码
+
+    if resize_shortest:
+        scale = resize_shortest / min(image.size)
+        image = image.resize((max(width, round(image.width * scale)), max(height, round(image.height * scale))),
+                             Image.BILINEAR)
+        left, top = (image.width - width) // 2, (image.height - height) // 2
+        image = image.crop((left, top, left + width, top + height))
+    else:
+        image = image.resize((width, height), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+_decode_executor = None
+_decode_executor_lock = threading.Lock()
+
+def get_decode_executor():
+    """返回图像解码线程池 (Pillow 解码和缩放时释放 GIL，线程可以占满多个核)"""
+    global _decode_executor
+    if _decode_executor is None:
+        with _decode_executor_lock:
+            if _decode_executor is None:
+                workers = get_setting("ai_models.image_classification", {}).get("decode_workers") or os.cpu_count() or 4
+                _decode_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode")
+    return _decode_executor
+
+def shutdown_decode_executor():
+    global _decode_executor
+    with _decode_executor_lock:
+        executor, _decode_executor = _decode_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _decode_or_error(image_path, height, width, resize_shortest):
+    try:
+        return decode_image(image_path, height, width, resize_shortest), None
+    except Exception as e:
+        return None, str(e)
+
+def submit_image_decodes(image_paths, height, width, resize_shortest=None):
+    """把每张图像的解码作为独立任务提交到解码线程池，返回 future 列表"""
+    executor = get_decode_executor()
+    return [executor.submit(_decode_or_error, path, height, width, resize_shortest) for path in image_paths]
+
+def collect_image_batch(futures, height, width):
+    """
+    等待一批解码任务，把成功的图像堆叠为 (N, height, width, 3) 的 uint8 数组。
+
+    Returns:
+        numpy.ndarray: 成功解码的图像.
+        list[int]: 成功解码的图像在本批中的下标.
+        dict[int, str]: 解码失败的下标 -> 错误信息.
+    """
+    arrays, indices, errors = [], [], {}
+    for index, future in enumerate(futures):
+        array, error = future.result()
+        if error is None:
+            arrays.append(array)
+            indices.append(index)
+        else:
+            errors[index] = error
+    batch = np.stack(arrays) if arrays else np.empty((0, height, width, 3), dtype=np.uint8)
+    return batch, indices, errors
+
+def preprocess_batch(batch, mean, std, do_normalize=True):
+    """
+    把 (N, H, W, 3) uint8 批次向量化地转换为模型输入: 缩放到 [0, 1]、按通道标准化、转为 NCHW float32。
+
+    Returns:
+        numpy.ndarray: (N, 3, H, W) float32 数组.
+    """
+    pixels = batch.astype(np.float32)
+    pixels *= 1.0 / 255.0
+    if do_normalize:
+        pixels -= mean
+        pixels /= std
+    return np.ascontiguousarray(pixels.transpose(0, 3, 1, 2))
+
+def get_image_root():
+    """客户端提供的图像路径必须位于的目录 (ai_models.image_classification.image_root)"""
+    return get_setting("ai_models.image_classification", {}).get("image_root") or "."
+
+def resolve_image_path(path, image_root):
+    """
+    把客户端提供的路径解析为 image_root 之下的真实路径 (相对路径相对于 image_root)。
+
+    符号链接和 ".." 先展开再检查，不在 image_root 之下的路径抛出 ValueError。
+    """
+    root = os.path.realpath(image_root)
+    resolved = os.path.realpath(os.path.join(root, os.fspath(path)))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"图像路径 '{path}' 不在允许的目录 {image_root} 之下")
+    return resolved
+
+def expand_image_paths(image_paths=(), image_dir=None, max_images=None, image_root=None):
+    """
+    合并显式路径和目录中的图像文件 (按文件名排序，不递归)。
+
+    所有路径 (包括目录中列出的文件) 都必须位于 image_root 之下，默认读取 ai_models.image_classification.image_root。
+    """
+    if image_root is None:
+        image_root = get_image_root()
+    paths = [resolve_image_path(path, image_root) for path in image_paths]
+    if image_dir:
+        with os.scandir(resolve_image_path(image_dir, image_root)) as entries:
+            paths.extend(sorted(resolve_image_path(entry.path, image_root) for entry in entries
+                                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)))
+    if max_images is not None and len(paths) > max_images:
+        raise ValueError(f"一次最多分类 {max_images} 张图像，实际为 {len(paths)} 张")
+    return paths
+
+def classify_images_hf(model_name="google/vit-base-patch16-224", image_paths=(), top_k=1, dtype=None, batch_size=None):
+    """
+    批量分类图像: 解码在线程池中并行进行，预处理向量化为一个批次，模型按 batch_size 分批前向。
+
+    下一批图像的解码与当前批次的前向计算重叠进行。
+
+    Args:
+        model_name (str, optional): Hugging Face 模型名称或路径.
+        image_paths (list[str]): 图像文件路径.
+        top_k (int, optional): 每张图像返回的类别数. 默认为 1.
+        dtype (str, optional): torch 数据类型名称. 默认读取 ai_models.default_dtype.
+        batch_size (int, optional): 每次前向的图像数. 默认读取 ai_models.image_classification.batch_size.
+
+    Returns:
+        list[dict]: 与 image_paths 顺序一致，每项为 {"image_path", "label", "score", "top_k"} 或 {"image_path", "error"}.
+    """
+    import torch
+
+    image_paths = list(image_paths)
+    batch_size = batch_size or get_setting("ai_models.image_classification", {}).get("batch_size", 32)
+    classifier = get_image_classifier(model_name, dtype)
+    model = classifier.model
+    parameter = next(model.parameters())
+    results = [None] * len(image_paths)
+
+    def submit(start):
+        return submit_image_decodes(image_paths[start:start + batch_size], classifier.height, classifier.width,
+                                    classifier.resize_shortest)
+
+    starts = list(range(0, len(image_paths), batch_size))
+    pending = submit(starts[0]) if starts else None
+    for position, start in enumerate(starts):
+        batch, indices, errors = collect_image_batch(pending, classifier.height, classifier.width)
+        pending = submit(starts[position + 1]) if position + 1 < len(starts) else None
+        for index, error in errors.items():
+            results[start + index] = {"image_path": image_paths[start + index], "error": error}
+        if not indices:
+            continue
+
+        pixel_values = torch.from_numpy(preprocess_batch(batch, classifier.mean, classifier.std, classifier.do_normalize))
+        with torch.inference_mode():
+            logits = model(pixel_values=pixel_values.to(device=parameter.device, dtype=parameter.dtype)).logits
+        scores, labels = logits.float().softmax(dim=-1).topk(min(top_k, logits.shape[-1]), dim=-1)
+        for row, index in enumerate(indices):
+            predictions = [{"label": classifier.labels[int(label)], "score": float(score)}
+                           for score, label in zip(scores[row], labels[row])]
+            results[start + index] = {"image_path": image_paths[start + index], **predictions[0], "top_k": predictions}
+    return results
+
+def classify_image_hf(model_name="google/vit-base-patch16-224", image_path=None, top_k=1, dtype=None):
+    """
+    分类单张图像。
+
+    Returns:
+        dict: 分类结果 {"image_path", "label", "score", "top_k"}.
+        str: 错误信息，如果分类过程中发生错误，否则为 None.
+    """
+    try:
+        result = classify_images_hf(model_name, [image_path], top_k=top_k, dtype=dtype)[0]
+        if "error" in result:
+            raise ValueError(result["error"])
+        return result, None
+    except Exception as e:
+        error_message = f"图像分类过程中发生错误: {str(e)}"
+        print(error_message)
+        return None, error_message
@@ -1,17 +1,54 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+import base64
+import json
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator
 import uvicorn
 
-from services.workflow_service import WorkflowService
+from ai_utils import get_corpus_index, ingest_corpus
+from config import get_setting
+from model_pool import get_model_pool
+from hf_batching import get_batching_stats
+from hf_vision import shutdown_decode_executor
+from openai_api import close_openai_backend, get_openai_backend
+from openai_scheduler import request_context
+from services.workflow_service import WorkflowService, WorkflowDataPatch
+from services.repository import VersionConflictError
 from services.ai_service import AIService
+from services.workflow_engine import WorkflowEngine, WorkflowNodeError
+from services.module_executor import shutdown_module_executor
+from services.storage import check_shared_state, close_storage, get_worker_count
+from services.result_cache import close_result_cache, get_result_cache
+from services.metrics import MetricsMiddleware, register_default_collectors, render_metrics
+from services.job_queue import TERMINAL_STATUSES, Job, close_job_queue, get_job_queue, new_job, start_job_workers
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 多 worker 部署时拒绝使用进程内存储，避免各进程各自分配 id
+    check_shared_state()
+    # 启动时加载关键词语料索引 (keywords.index_path)，第一个关键词请求不需要等待读盘
+    get_corpus_index()
+    # 在应用的事件循环中创建共享的 OpenAI 后端，工作线程中的同步调用提交到这个循环
+    get_openai_backend()
+    start_job_workers({"module": run_module_job, "workflow": run_workflow_job})
+    yield
+    await close_job_queue()
+    # 关闭共享的上游连接池
+    await close_openai_backend()
+    shutdown_module_executor()
+    shutdown_decode_executor()
+    close_storage()
+    await close_result_cache()
 
 app = FastAPI(
     title="AI-Flow API",
     description="API for AI-Flow, a low-code AI application development platform.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS 中间件
@@ -25,10 +62,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Link"],
 )
 
+# 指标: 每个路由的请求数/延迟/在途请求数，通过 /metrics 以 Prometheus 文本格式暴露
+if get_setting("metrics.enabled", True):
+    app.add_middleware(MetricsMiddleware)
+    register_default_collectors()
+
 workflow_service = WorkflowService()
 ai_service = AIService()
+workflow_engine = WorkflowEngine(ai_service)
 
 # ------ 模型定义 ------
 class WorkflowCreate(BaseModel):
@@ -72,19 +116,95 @@ class WorkflowData(BaseModel):
     canvasItems: List[CanvasItem]
     connections: List[Connection]
 
+class WorkflowRunRequest(BaseModel):
+    inputs: Dict[str, Dict[str, Any]] = {}  # 按节点 ID 提供的初始输入
+
+class JobCreate(BaseModel):
+    kind: str  # "module" / "workflow"
+    target_id: int  # 模块 ID 或工作流 ID
+    input_data: Dict[str, Any] = {}  # 模块输入；工作流任务为按节点 ID 提供的初始输入
+    priority: int = 0  # 0-9，数值越大越先执行
+
+class ModuleBatchRunRequest(BaseModel):
+    inputs: List[Any]  # 每项是一次运行的 input_data，格式错误的项单独报错
+
+class CorpusIngestRequest(BaseModel):
+    texts: List[str]  # 计入 TF-IDF 关键词提取语料的文档
+
 # ------ 模型定义结束 ------
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to AI-Flow API"}
 
+def encode_cursor(last_id: int) -> str:
+    """把上一页最后一条记录的 id 编码为不透明游标"""
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["after"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def resolve_limit(limit: Optional[int]) -> int:
+    max_limit = get_setting("pagination.max_limit", 1000)
+    if limit is None:
+        return min(get_setting("pagination.default_limit", 100), max_limit)
+    if limit < 1 or limit > max_limit:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {max_limit}")
+    return limit
+
+def parse_fields(fields: Optional[str], model_cls: type) -> set:
+    """解析 fields= 投影参数，未指定时返回响应模型的全部字段 (id 总是包含在内，游标依赖它)"""
+    allowed = set(model_cls.__fields__)
+    if not fields:
+        return allowed
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected | {"id"}
+
+def paginated_response(request: Request, items: List[Any], limit: int, fields: set) -> JSONResponse:
+    """
+    返回一页列表 (响应体仍是数组，与分页前兼容)。
+
+    直接序列化投影后的字典，不再经过 response_model 逐条校验；
+    还有下一页时通过 X-Next-Cursor 和 Link 头给出游标。
+    """
+    response = JSONResponse([item.dict(include=fields) for item in items])
+    if len(items) == limit:
+        cursor = encode_cursor(items[-1].id)
+        response.headers["X-Next-Cursor"] = cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+    return response
+
+def ndjson_response(items: Iterator[Any], fields: set) -> StreamingResponse:
+    """逐行输出 NDJSON，同步迭代器由 Starlette 放到线程池中消费，不会阻塞事件循环"""
+    lines = (json.dumps(item.dict(include=fields), ensure_ascii=False) + "\n" for item in items)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @app.get("/workflows", response_model=List[Workflow])
-async def get_workflows():
+async def get_workflows(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                        fields: Optional[str] = None, name: Optional[str] = None):
+    page_size = resolve_limit(limit)
+    selected = parse_fields(fields, Workflow)
+    after_id = decode_cursor(cursor)
     try:
-        workflows = workflow_service.get_all_workflows()
-        return workflows
+        workflows = workflow_service.list_workflows(page_size, after_id, name=name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return paginated_response(request, workflows, page_size, selected)
+
+@app.get("/workflows/export")
+async def export_workflows(fields: Optional[str] = None, name: Optional[str] = None):
+    """以 NDJSON 流式导出全部工作流"""
+    selected = parse_fields(fields, Workflow)
+    batch_size = get_setting("pagination.export_batch_size", 500)
+    return ndjson_response(workflow_service.iter_workflows(batch_size, name=name), selected)
 
 @app.post("/workflows", response_model=Workflow)
 async def create_workflow(workflow: WorkflowCreate):
@@ -107,44 +227,247 @@ async def get_workflow(workflow_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def workflow_data_etag(workflow_id: int, version: int) -> str:
+    return f'"{workflow_id}-{version}"'
+
+def parse_etag_version(header: Optional[str], workflow_id: int) -> Optional[int]:
+    """从 If-Match 头 ("<workflow_id>-<version>") 中解析版本号"""
+    if not header:
+        return None
+    tag = header.strip().removeprefix("W/").strip('"')
+    prefix = f"{workflow_id}-"
+    if tag.startswith(prefix) and tag[len(prefix):].isdigit():
+        return int(tag[len(prefix):])
+    raise HTTPException(status_code=412, detail=f"Invalid If-Match header: {header}")
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
 @app.get("/workflows/data/{workflow_id}", response_model=WorkflowData)
-async def get_workflow_data(workflow_id: int):
+async def get_workflow_data(workflow_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
     try:
-        workflow_data = workflow_service.get_workflow_data_by_id(workflow_id)
-        if workflow_data:
-            return workflow_data
-        else:
-            raise HTTPException(status_code=404, detail=f"Workflow data for workflow id {workflow_id} not found")
+        versioned = workflow_service.get_workflow_data_versioned(workflow_id)
     except Exception as e:
         print(f"Error in get_workflow_data: {e}")  # 添加日志
         raise HTTPException(status_code=500, detail=str(e))
+    if versioned is None:
+        raise HTTPException(status_code=404, detail=f"Workflow data for workflow id {workflow_id} not found")
+    workflow_data, version = versioned
+    etag = workflow_data_etag(workflow_id, version)
+    # 画布未变化时返回 304，不传输文档
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return workflow_data
 
 @app.post("/workflows/data/{workflow_id}", response_model=WorkflowData)
-async def save_workflow_data(workflow_id: int, workflow_data: WorkflowData):
+async def save_workflow_data(workflow_id: int, workflow_data: WorkflowData, response: Response,
+                             if_match: Optional[str] = Header(None)):
+    expected_version = parse_etag_version(if_match, workflow_id)
     try:
-        saved_data = workflow_service.save_workflow_data(workflow_id, workflow_data)
-        return saved_data
+        saved_data, version = workflow_service.save_workflow_data_versioned(
+            workflow_id, workflow_data, expected_version=expected_version)
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "currentVersion": e.current_version})
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"Error in save_workflow_data: {e}")  # 添加日志
         raise HTTPException(status_code=422, detail=str(e))
+    response.headers["ETag"] = workflow_data_etag(workflow_id, version)
+    return saved_data
+
+@app.patch("/workflows/data/{workflow_id}")
+async def patch_workflow_data(workflow_id: int, patch: WorkflowDataPatch, response: Response,
+                              if_match: Optional[str] = Header(None)):
+    base_version = patch.baseVersion if patch.baseVersion is not None else parse_etag_version(if_match, workflow_id)
+    if base_version is None:
+        raise HTTPException(status_code=428, detail="baseVersion or If-Match is required")
+    try:
+        _, version = workflow_service.patch_workflow_data(workflow_id, patch, base_version)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "currentVersion": e.current_version})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in patch_workflow_data: {e}")  # 添加日志
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers["ETag"] = workflow_data_etag(workflow_id, version)
+    return {"version": version}
+
+@app.post("/workflows/run/{workflow_id}")
+async def run_workflow(workflow_id: int, run_request: Optional[WorkflowRunRequest] = None,
+                       cache_control: Optional[str] = Header(None),
+                       x_cache_bypass: Optional[str] = Header(None)):
+    """运行工作流，响应中的 cache_hits 列出复用了上次输出的节点 (Cache-Control: no-cache 时全部重新执行)"""
+    workflow_data = workflow_service.get_workflow_data_by_id(workflow_id)
+    if workflow_data is None:
+        raise HTTPException(status_code=404, detail=f"Workflow data for workflow id {workflow_id} not found")
+    try:
+        inputs = run_request.inputs if run_request else {}
+        with request_context(f"workflow:{workflow_id}"):
+            return await workflow_engine.run(workflow_data, inputs,
+                                             use_cache=should_use_cache(cache_control, x_cache_bypass))
+    except (ValueError, WorkflowNodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in run_workflow: {e}")  # 添加日志
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/ai-modules", response_model=List[AIModule])
-async def get_ai_modules():
+async def get_ai_modules(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                         fields: Optional[str] = None, type: Optional[str] = None, name: Optional[str] = None):
+    page_size = resolve_limit(limit)
+    selected = parse_fields(fields, AIModule)
+    after_id = decode_cursor(cursor)
     try:
-        ai_modules = ai_service.get_all_ai_modules()
-        return ai_modules
+        ai_modules = ai_service.list_ai_modules(page_size, after_id, module_type=type, name=name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return paginated_response(request, ai_modules, page_size, selected)
+
+@app.get("/ai-modules/export")
+async def export_ai_modules(fields: Optional[str] = None, type: Optional[str] = None, name: Optional[str] = None):
+    """以 NDJSON 流式导出全部 AI 模块，可用 fields= 跳过较大的 config"""
+    selected = parse_fields(fields, AIModule)
+    batch_size = get_setting("pagination.export_batch_size", 500)
+    return ndjson_response(ai_service.iter_ai_modules(batch_size, module_type=type, name=name), selected)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats/models")
+async def get_model_stats():
+    return get_model_pool().stats()
+
+@app.get("/stats/batching")
+async def get_hf_batching_stats():
+    return get_batching_stats()
+
+@app.post("/keywords/corpus")
+def ingest_keyword_corpus(ingest_request: CorpusIngestRequest):
+    """把文档计入关键词提取 (extract_keywords, method=tfidf) 使用的语料索引 (同步路由，在线程池中执行)"""
+    num_docs = ingest_corpus(ingest_request.texts)
+    return {"added": len(ingest_request.texts), "num_docs": num_docs}
+
+@app.get("/stats/cache")
+async def get_cache_stats():
+    return get_result_cache().stats()
+
+def should_use_cache(cache_control: Optional[str], x_cache_bypass: Optional[str]) -> bool:
+    """Cache-Control: no-cache 或 X-Cache-Bypass: 1 时跳过结果缓存"""
+    if x_cache_bypass and x_cache_bypass.lower() in ("1", "true", "yes"):
+        return False
+    return not (cache_control and "no-cache" in cache_control.lower())
 
 @app.post("/ai-modules/run/{module_id}")
-async def run_ai_module(module_id: int, input_data: dict):
+async def run_ai_module(module_id: int, input_data: dict,
+                        cache_control: Optional[str] = Header(None),
+                        x_cache_bypass: Optional[str] = Header(None)):
     try:
-        result = ai_service.run_ai_module(module_id, input_data)
+        with request_context(f"module:{module_id}"):
+            result = await ai_service.run_ai_module_async(
+                module_id, input_data, use_cache=should_use_cache(cache_control, x_cache_bypass))
         return {"result": result}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/ai-modules/run/{module_id}/batch")
+async def run_ai_module_batch(module_id: int, batch_request: ModuleBatchRunRequest,
+                              cache_control: Optional[str] = Header(None),
+                              x_cache_bypass: Optional[str] = Header(None)):
+    max_items = get_setting("execution.batch_max_items", 256)
+    if len(batch_request.inputs) > max_items:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {max_items} inputs")
+    try:
+        # 批量运行不是用户在逐条等待的交互请求，走 OpenAI 调度器的 batch 通道
+        with request_context(f"module:{module_id}", lane="batch"):
+            results = await ai_service.run_ai_module_batch_async(
+                module_id, batch_request.inputs, use_cache=should_use_cache(cache_control, x_cache_bypass))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"results": results}
+
+@app.post("/ai-modules/run/{module_id}/stream")
+async def stream_ai_module(module_id: int, input_data: dict, request: Request):
+    if ai_service.get_ai_module(module_id) is None:
+        raise HTTPException(status_code=400, detail=f"AI 模块 ID '{module_id}' 未找到")
+
+    async def event_stream():
+        # 客户端断开时退出循环，aclosing 关闭上游生成器并取消生成
+        try:
+            async with aclosing(ai_service.stream_ai_module(module_id, input_data)) as chunks:
+                async for chunk in chunks:
+                    if await request.is_disconnected():
+                        break
+                    yield f"data: {json.dumps({'token': chunk}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error in stream_ai_module: {e}")  # 添加日志
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ------ 异步任务 ------
+async def run_module_job(job: Job) -> Any:
+    with request_context(f"module:{job.target_id}", lane="batch"):
+        return await ai_service.run_ai_module_async(job.target_id, job.input_data)
+
+async def run_workflow_job(job: Job) -> Any:
+    workflow_data = workflow_service.get_workflow_data_by_id(job.target_id)
+    if workflow_data is None:
+        raise ValueError(f"Workflow data for workflow id {job.target_id} not found")
+    with request_context(f"workflow:{job.target_id}", lane="batch"):
+        return await workflow_engine.run(workflow_data, job.input_data)
+
+@app.post("/jobs", status_code=202)
+async def create_job(job_create: JobCreate):
+    """提交任务后立即返回任务 ID，结果通过 GET /jobs/{id} 轮询或 /jobs/{id}/events 订阅"""
+    if job_create.kind == "module" and ai_service.get_ai_module(job_create.target_id) is None:
+        raise HTTPException(status_code=404, detail=f"AI 模块 ID '{job_create.target_id}' 未找到")
+    if job_create.kind == "workflow" and workflow_service.get_workflow_data_by_id(job_create.target_id) is None:
+        raise HTTPException(status_code=404, detail=f"Workflow data for workflow id {job_create.target_id} not found")
+    try:
+        job = new_job(job_create.kind, job_create.target_id, job_create.input_data, job_create.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = await get_job_queue().enqueue(job)
+    return {"id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    job = await get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """以 SSE 推送任务状态变化，任务结束后关闭"""
+    queue = get_job_queue()
+    if await queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def event_stream():
+        async with aclosing(queue.watch(job_id)) as updates:
+            async for job in updates:
+                if await request.is_disconnected():
+                    break
+                yield f"event: status\ndata: {job.json()}\n\n"
+                if job.status in TERMINAL_STATUSES:
+                    yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # 多 worker 时 uvicorn 需要以导入字符串加载应用
+    uvicorn.run("main:app", host=get_setting("server.host", "0.0.0.0"), port=get_setting("server.port", 8000),
+                workers=get_worker_count())
\ No newline at end of file
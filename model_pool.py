@@ -0,0 +1,177 @@
+# ai_model_integration/model_pool.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config import get_setting
+from services.metrics import MODEL_LOAD_DURATION
+
+
+def estimate_model_bytes(model_object: Any) -> int:
+    """
+    估算模型占用的内存 (参数 + buffer 的字节数).
+
+    Args:
+        model_object: transformers pipeline 或 torch 模型.
+
+    Returns:
+        int: 估算的字节数，无法估算时返回 0.
+    """
+    model = getattr(model_object, "model", model_object)
+    # 量化或导出的模型 (见 hf_inference) 自带估算值
+    footprint = getattr(model, "footprint_bytes", None)
+    if footprint is not None:
+        return footprint
+    total = 0
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(model, attr, None)
+        if not callable(tensors):
+            continue
+        try:
+            for tensor in tensors():
+                total += tensor.numel() * tensor.element_size()
+        except Exception:
+            return total
+    return total
+
+
+class _LoadSlot:
+    """正在加载中的模型占位，用于让并发请求等待同一次加载"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ModelPool:
+    """
+    进程级模型池: 按键缓存已加载的模型，受内存预算约束的 LRU 淘汰。
+
+    同一个键的并发请求只会触发一次加载，其余请求等待加载结果。
+    """
+
+    def __init__(self, max_memory_bytes: int, size_estimator: Callable[[Any], int] = estimate_model_bytes,
+                 load_duration: Any = MODEL_LOAD_DURATION):
+        self.max_memory_bytes = max_memory_bytes
+        self.size_estimator = size_estimator
+        self.load_duration = load_duration
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._loading: Dict[Hashable, _LoadSlot] = {}
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_errors = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        获取模型，未命中时调用 loader 加载 (同一个键只加载一次).
+
+        Args:
+            key: 模型键，例如 (model_name, task, dtype).
+            loader: 无参加载函数.
+
+        Returns:
+            已加载的模型对象.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            slot = self._loading.get(key)
+            is_loader = slot is None
+            if is_loader:
+                self.misses += 1
+                slot = self._loading[key] = _LoadSlot()
+            else:
+                self.hits += 1
+
+        if not is_loader:
+            slot.done.wait()
+            if slot.error is not None:
+                raise slot.error
+            return slot.value
+
+        try:
+            start = time.perf_counter()
+            value = loader()
+            self.load_duration.labels(key[0] if isinstance(key, tuple) else key).observe(time.perf_counter() - start)
+            size = self.size_estimator(value)
+        except BaseException as e:
+            with self._lock:
+                self.load_errors += 1
+                del self._loading[key]
+            slot.error = e
+            slot.done.set()
+            raise
+
+        with self._lock:
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._memory_bytes += size
+            del self._loading[key]
+            self._evict_locked(keep=key)
+        slot.value = value
+        slot.done.set()
+        return value
+
+    def _evict_locked(self, keep: Hashable) -> None:
+        """淘汰最久未使用的模型，直到满足内存预算 (刚加载的模型不会被淘汰)"""
+        while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._entries.pop(oldest)
+            self._memory_bytes -= self._sizes.pop(oldest)
+            self.evictions += 1
+
+    def evict(self, key: Hashable) -> bool:
+        """手动移除指定模型"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.pop(key)
+            self._memory_bytes -= self._sizes.pop(key)
+            self.evictions += 1
+            return True
+
+    def clear(self) -> None:
+        """清空模型池 (不计入淘汰次数)"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中/淘汰计数以及当前占用"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "models": [list(key) if isinstance(key, tuple) else key for key in self._entries],
+            }
+
+
+_model_pool: Optional[ModelPool] = None
+_model_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """返回进程级共享的模型池 (内存预算来自 ai_models.model_pool.max_memory_mb)"""
+    global _model_pool
+    if _model_pool is None:
+        with _model_pool_lock:
+            if _model_pool is None:
+                max_memory_mb = get_setting("ai_models.model_pool.max_memory_mb", 4096)
+                _model_pool = ModelPool(int(max_memory_mb * 1024 * 1024))
+    return _model_pool
@@ -1,39 +1,261 @@
 # ai_model_integration/openai_api.py
-import openai
+import asyncio
+import json
 import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
 
-def generate_text_openai(api_key, model_name="gpt-3.5-turbo-instruct", prompt_text="Write a short story about a robot learning to love."):
+import httpx
+
+from config import get_setting
+from openai_scheduler import RateLimitScheduler, close_openai_scheduler, get_openai_scheduler
+from services.metrics import OPENAI_REQUEST_DURATION, OPENAI_RETRIES
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OpenAIAPIError(Exception):
+    """OpenAI API 返回错误或重试耗尽"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncOpenAIBackend:
+    """
+    基于共享 httpx.AsyncClient 的异步 OpenAI 后端。
+
+    长连接 (HTTP keep-alive) 和连接池在所有请求之间复用；API 密钥只保存在本实例的请求头中，
+    不会修改任何全局状态。429/5xx 和网络错误会按带抖动的指数退避重试。
+    配置了 scheduler 时，每次尝试 (包括重试) 都先在限流调度器中排队。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 scheduler: Optional[RateLimitScheduler] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.scheduler = scheduler
+        api_key = api_key or get_setting("api_keys.openai") or os.environ.get("OPENAI_API_KEY", "")
+        self.max_retries = max_retries if max_retries is not None else get_setting("openai.max_retries", 3)
+        self.timeout = timeout or get_setting("openai.timeout_seconds", 30)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = httpx.AsyncClient(
+            base_url=base_url or get_setting("openai.base_url", "https://api.openai.com/v1"),
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            limits=httpx.Limits(
+                max_connections=max_connections or get_setting("openai.max_connections", 200),
+                max_keepalive_connections=max_keepalive_connections or get_setting("openai.max_keepalive_connections", 50),
+            ),
+            timeout=self.timeout,
+            transport=transport,  # 测试中替换为 httpx.MockTransport
+        )
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """优先使用 Retry-After，否则使用 full jitter 指数退避"""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _acquire(self, payload: Dict[str, Any]) -> Any:
+        """在限流调度器中排队 (未配置调度器时直接返回 None)"""
+        if self.scheduler is None:
+            return None
+        tokens = self.scheduler.estimate(str(payload.get("prompt", "")), payload.get("max_tokens", 16))
+        return await self.scheduler.acquire(tokens)
+
+    def _on_rate_limited(self, delay: float) -> None:
+        """429 时让调度器暂停出队，排队中的请求不再继续撞上限流"""
+        if self.scheduler is not None:
+            self.scheduler.pause(delay)
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """发送 POST 请求，对 429/5xx 和网络错误进行重试，返回解析后的 JSON"""
+        request_timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            reservation = await self._acquire(payload)
+            start = time.perf_counter()
+            try:
+                try:
+                    response = await self._client.post(path, json=payload, timeout=request_timeout)
+                except httpx.TransportError as e:
+                    OPENAI_REQUEST_DURATION.labels(path, "error").observe(time.perf_counter() - start)
+                    if is_last_attempt:
+                        raise OpenAIAPIError(f"OpenAI API 请求失败: {e}") from e
+                    delay = self._retry_delay(attempt)
+                else:
+                    OPENAI_REQUEST_DURATION.labels(path, response.status_code).observe(time.perf_counter() - start)
+                    if response.status_code in RETRYABLE_STATUS_CODES and not is_last_attempt:
+                        delay = self._retry_delay(attempt, response)
+                        if response.status_code == 429:
+                            self._on_rate_limited(delay)
+                    elif response.status_code >= 400:
+                        raise OpenAIAPIError(f"OpenAI API 错误 ({response.status_code}): {_error_detail(response)}",
+                                             status_code=response.status_code)
+                    else:
+                        data = response.json()
+                        if reservation is not None:
+                            reservation.settle(data.get("usage", {}).get("total_tokens"))
+                        return data
+            finally:
+                # 没有拿到用量的尝试 (重试、出错、被取消) 在退避之前退还预留的 token
+                if reservation is not None:
+                    reservation.refund()
+            OPENAI_RETRIES.labels(path).inc()
+            await asyncio.sleep(delay)
+        raise OpenAIAPIError("OpenAI API 重试次数耗尽")  # 不会执行到这里，循环内总会返回或抛出
+
+    async def complete(self, prompt: str, model: str = "gpt-3.5-turbo-instruct", max_tokens: int = 100,
+                       temperature: float = 0.7, timeout: Optional[float] = None) -> str:
+        """调用 completions 接口并返回生成的文本"""
+        response = await self.post("/completions", {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "n": 1,
+            "temperature": temperature,
+        }, timeout=timeout)
+        return response["choices"][0]["text"].strip()
+
+    async def stream_complete(self, prompt: str, model: str = "gpt-3.5-turbo-instruct", max_tokens: int = 100,
+                              temperature: float = 0.7, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        以流式方式调用 completions 接口，逐段产出生成的文本。
+
+        只在收到第一个字节之前对 429/5xx 和网络错误重试；调用方关闭生成器时上游连接随之关闭。
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "n": 1,
+            "temperature": temperature,
+            "stream": True,
+        }
+        request_timeout = timeout or self.timeout
+        started = False
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            reservation = await self._acquire(payload)
+            start = time.perf_counter()
+            try:
+                async with self._client.stream("POST", "/completions", json=payload, timeout=request_timeout) as response:
+                    OPENAI_REQUEST_DURATION.labels("/completions:stream", response.status_code).observe(
+                        time.perf_counter() - start)
+                    if response.status_code in RETRYABLE_STATUS_CODES and not is_last_attempt:
+                        delay = self._retry_delay(attempt, response)
+                        if response.status_code == 429:
+                            self._on_rate_limited(delay)
+                    elif response.status_code >= 400:
+                        await response.aread()
+                        raise OpenAIAPIError(f"OpenAI API 错误 ({response.status_code}): {_error_detail(response)}",
+                                             status_code=response.status_code)
+                    else:
+                        # 流式响应不返回用量: 开始读取后按估算值结算
+                        if reservation is not None:
+                            reservation.settle(None)
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                return
+                            text = json.loads(data)["choices"][0].get("text", "")
+                            if text:
+                                started = True
+                                yield text
+                        return
+            except httpx.TransportError as e:
+                if not started:
+                    OPENAI_REQUEST_DURATION.labels("/completions:stream", "error").observe(time.perf_counter() - start)
+                if is_last_attempt or started:
+                    raise OpenAIAPIError(f"OpenAI API 请求失败: {e}") from e
+                delay = self._retry_delay(attempt)
+            finally:
+                if reservation is not None:
+                    reservation.refund()
+            OPENAI_RETRIES.labels("/completions:stream").inc()
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return response.text
+
+
+_openai_backend: Optional[AsyncOpenAIBackend] = None
+# 共享后端所在的事件循环: 连接池和调度协程都属于这个循环，其他线程的同步调用提交到这里执行
+_openai_backend_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_openai_backend() -> AsyncOpenAIBackend:
+    """
+    返回进程级共享的异步 OpenAI 后端 (首次调用时创建，启用 openai.scheduler 时经过限流调度器)。
+
+    应用启动时在事件循环中调用一次，之后工作线程中的 generate_text_openai 也复用这个后端。
+    """
+    global _openai_backend, _openai_backend_loop
+    if _openai_backend is None:
+        _openai_backend = AsyncOpenAIBackend(scheduler=get_openai_scheduler())
+        _openai_backend_loop = _running_loop()
+    return _openai_backend
+
+
+async def close_openai_backend() -> None:
+    """关闭共享后端的连接池和限流调度器 (应用关闭时调用)"""
+    global _openai_backend, _openai_backend_loop
+    if _openai_backend is not None:
+        backend, _openai_backend, _openai_backend_loop = _openai_backend, None, None
+        await backend.aclose()
+    await close_openai_scheduler()
+
+
+async def generate_text_openai_async(model_name="gpt-3.5-turbo-instruct", prompt_text="Write a short story about a robot learning to love.",
+                                     max_tokens=100, temperature=0.7, timeout=None, backend=None):
     """
-    使用 OpenAI API 生成文本。
+    使用共享的异步 OpenAI 后端生成文本，不阻塞事件循环。
 
     Args:
-        api_key (str): 您的 OpenAI API 密钥。
-        model_name (str, optional): OpenAI 模型名称. 默认为 "gpt-3.5-turbo-instruct" (一个快速且经济的模型).
-        prompt_text (str, optional): 生成文本的起始提示文本. 默认为 "Write a short story about a robot learning to love.".
+        model_name (str, optional): OpenAI 模型名称. 默认为 "gpt-3.5-turbo-instruct".
+        prompt_text (str, optional): 生成文本的起始提示文本.
+        max_tokens (int, optional): 生成文本的最大 token 数量. 默认为 100.
+        temperature (float, optional): 控制生成文本的随机性. 默认为 0.7.
+        timeout (float, optional): 本次调用的超时时间 (秒). 默认读取 openai.timeout_seconds.
+        backend (AsyncOpenAIBackend, optional): 使用的后端. 默认为进程级共享后端.
 
     Returns:
         str: 生成的文本结果.
         str: 错误信息，如果生成过程中发生错误，否则为 None.
     """
+    backend = backend or get_openai_backend()
     try:
-        openai.api_key = api_key  # 设置 OpenAI API 密钥
-
-        response = openai.completions.create(
-            model=model_name,
-            prompt=prompt_text,
-            max_tokens=100,      # 生成文本的最大 token 数量
-            n=1,                # 返回的文本序列数量
-            stop=None,           # 设置停止生成文本的 token (None 表示不设置)
-            temperature=0.7,     # 控制生成文本的随机性 (0.0 - 1.0, 值越大越随机)
-        )
-
-        # 从 API 响应中提取生成的文本
-        generated_text = response.choices[0].text.strip()
-
-        return generated_text, None  # 返回生成的文本和无错误信息
-
-    except openai.APIError as e:
-        error_message = f"OpenAI API 错误: {str(e)}"
+        generated_text = await backend.complete(prompt_text, model=model_name, max_tokens=max_tokens,
+                                                temperature=temperature, timeout=timeout)
+        return generated_text, None
+    except OpenAIAPIError as e:
+        error_message = str(e)
         print(error_message)
         return None, error_message
     except Exception as e:
@@ -42,6 +264,41 @@ def generate_text_openai(api_key, model_name="gpt-3.5-turbo-instruct", prompt_te
         return None, error_message
 
 
+def generate_text_openai(api_key, model_name="gpt-3.5-turbo-instruct", prompt_text="Write a short story about a robot learning to love.", **options):
+    """
+    使用 OpenAI API 生成文本 (阻塞版本，用于脚本和工作线程；在事件循环中请使用 generate_text_openai_async)。
+
+    共享后端所在的事件循环正在运行时 (应用的工作线程)，请求提交到该循环执行，
+    与异步请求共用连接池和限流调度器；否则 (脚本) 在新的事件循环中执行，仍然经过限流调度器。
+
+    Args:
+        api_key (str): 您的 OpenAI API 密钥。为 None 时读取配置或 OPENAI_API_KEY 环境变量.
+        model_name (str, optional): OpenAI 模型名称. 默认为 "gpt-3.5-turbo-instruct" (一个快速且经济的模型).
+        prompt_text (str, optional): 生成文本的起始提示文本. 默认为 "Write a short story about a robot learning to love.".
+        **options: 传给 generate_text_openai_async 的其他参数 (max_tokens, temperature, timeout).
+
+    Returns:
+        str: 生成的文本结果.
+        str: 错误信息，如果生成过程中发生错误，否则为 None.
+    """
+    loop = _openai_backend_loop
+    shared = loop is not None and loop.is_running() and _running_loop() is not loop
+
+    async def run():
+        if shared and api_key is None:
+            return await generate_text_openai_async(model_name, prompt_text, **options)
+        # 指定了其他密钥或没有运行中的共享后端: 使用临时连接池，限流调度器仍然共享
+        backend = AsyncOpenAIBackend(api_key=api_key, scheduler=get_openai_scheduler())
+        try:
+            return await generate_text_openai_async(model_name, prompt_text, backend=backend, **options)
+        finally:
+            await backend.aclose()
+
+    if shared:
+        return asyncio.run_coroutine_threadsafe(run(), loop).result()
+    return asyncio.run(run())
+
+
 # 示例用法 (可选，但推荐用于测试模块)
 if __name__ == "__main__":
     # --- !!! 重要安全提示 !!! ---
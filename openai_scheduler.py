@@ -0,0 +1,364 @@
+# ai_model_integration/openai_scheduler.py
+"""
+OpenAI 请求的客户端限流调度器。
+
+- RPM / TPM 两个令牌桶: 每个请求消耗 1 个请求令牌和 "提示长度估算 + max_tokens" 个 token 令牌，
+  响应返回实际用量后多退少补。
+- 两条优先级通道: interactive (用户正在等待的请求) 总是先于 batch (异步任务、批量运行) 出队。
+- 同一通道内按租户 (工作流/模块) 做加权公平排队 (start-time fair queuing)，
+  一个租户的突发请求不会饿死其他租户。
+- 收到 429 时暂停出队，避免所有排队请求同时撞上限流。
+
+时钟可替换 (FakeClock)，便于在不真正等待的情况下测试限流行为。
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import get_setting
+from services.metrics import OPENAI_SCHEDULER_WAIT
+
+# 优先级从高到低
+LANES = ("interactive", "batch")
+DEFAULT_TENANT = "default"
+
+_request_context: contextvars.ContextVar = contextvars.ContextVar(
+    "openai_request_context", default=(DEFAULT_TENANT, "interactive"))
+
+
+@contextmanager
+def request_context(tenant: str, lane: str = "interactive") -> Iterator[None]:
+    """为当前上下文 (及其中创建的任务) 中的 OpenAI 请求指定租户和优先级通道"""
+    if lane not in LANES:
+        raise ValueError(f"未知的优先级通道 '{lane}'，可选值: {', '.join(LANES)}")
+    token = _request_context.set((tenant, lane))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+def current_request_context() -> Tuple[str, str]:
+    """返回当前上下文的 (租户, 通道)"""
+    return _request_context.get()
+
+
+def estimate_tokens(prompt: str, max_tokens: int, chars_per_token: float = 4) -> int:
+    """估算一次 completions 请求消耗的 token 数: 提示长度 / 每 token 字符数 + max_tokens"""
+    return math.ceil(len(prompt) / chars_per_token) + max_tokens
+
+
+class MonotonicClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class FakeClock:
+    """测试用时钟: 时间只在 advance() 时前进，sleep() 在时间到达后返回"""
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._sleepers: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def now(self) -> float:
+        return self._now
+
+    async def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self._now + seconds, next(self._seq), future))
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        """推进时间，唤醒到期的 sleep，并让出事件循环使被唤醒的协程运行"""
+        self._now += seconds
+        while self._sleepers and self._sleepers[0][0] <= self._now:
+            _, _, future = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+
+class TokenBucket:
+    """
+    令牌桶: 以 refill_per_second 的速率补充，最多积累 capacity 个令牌。
+
+    大于 capacity 的请求在桶满时放行并把余额扣成负数，之后的请求需要等待补足这部分欠额。
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, clock: Any):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock.now()
+
+    def _refill(self) -> None:
+        now = self.clock.now()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def time_until(self, amount: float) -> float:
+        """距离可以消耗 amount 个令牌还需等待的秒数"""
+        deficit = min(amount, self.capacity) - self.available()
+        return deficit / self.refill_per_second if deficit > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class _Request:
+    __slots__ = ("tenant", "lane", "tokens", "future", "enqueued_at")
+
+    def __init__(self, tenant: str, lane: str, tokens: int, future: asyncio.Future, enqueued_at: float):
+        self.tenant = tenant
+        self.lane = lane
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class Reservation:
+    """
+    一次已放行请求的 token 预留: 拿到实际用量后调用 settle 多退少补 (用量未知时保留估算值)，
+    请求出错、需要重试或被取消时调用 refund 退还全部预留。两者只有第一次调用生效。
+    """
+
+    def __init__(self, scheduler: "RateLimitScheduler", tokens: int):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.settled = False
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if self.settled:
+            return
+        self.settled = True
+        if actual_tokens is not None:
+            self.scheduler.adjust_tokens(self.tokens - actual_tokens)
+            self.tokens = actual_tokens
+
+    def refund(self) -> None:
+        """退还预留的 token (请求令牌不退还，失败的请求同样计入上游的 RPM)"""
+        if self.settled:
+            return
+        self.settled = True
+        self.scheduler.adjust_tokens(self.tokens)
+
+
+class RateLimitScheduler:
+    """
+    在 OpenAI 后端前面排队的限流调度器 (见模块文档)。
+
+    桶容量为 burst_seconds 秒的配额，避免一分钟的配额在一瞬间被用完后长时间空等。
+    出队由单个调度协程完成，它只在令牌不足时睡眠到令牌补足或有新请求到达。
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, burst_seconds: float = 10,
+                 tenant_weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0,
+                 chars_per_token: float = 4, clock: Optional[Any] = None):
+        self.clock = clock or MonotonicClock()
+        self.requests_bucket = TokenBucket(max(1.0, requests_per_minute * burst_seconds / 60),
+                                           requests_per_minute / 60, self.clock)
+        self.tokens_bucket = TokenBucket(max(1.0, tokens_per_minute * burst_seconds / 60),
+                                         tokens_per_minute / 60, self.clock)
+        self.tenant_weights = tenant_weights or {}
+        self.default_weight = default_weight
+        self.chars_per_token = chars_per_token
+        # 每条通道一个按 start tag 排序的堆: (start_tag, 序号, 请求)
+        self._queues: Dict[str, List[Tuple[float, int, _Request]]] = {lane: [] for lane in LANES}
+        self._virtual_time: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        # 每条通道按完成时间排序的 (finish_tag, 租户)，用于清理已经落后于虚拟时间的 _last_finish
+        self._finish_tags: Dict[str, List[Tuple[float, str]]] = {lane: [] for lane in LANES}
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.dispatched: Dict[str, int] = {lane: 0 for lane in LANES}
+
+    def weight(self, tenant: str) -> float:
+        return float(self.tenant_weights.get(tenant, self.default_weight))
+
+    def estimate(self, prompt: str, max_tokens: int) -> int:
+        return estimate_tokens(prompt, max_tokens, self.chars_per_token)
+
+    async def acquire(self, tokens: int, tenant: Optional[str] = None, lane: Optional[str] = None) -> Reservation:
+        """
+        排队等待 1 个请求令牌和 tokens 个 token 令牌，租户和通道默认取自 request_context。
+
+        等待期间被取消时请求被丢弃；放行后才被取消时退还预留的令牌。
+        """
+        context_tenant, context_lane = current_request_context()
+        tenant, lane = tenant or context_tenant, lane or context_lane
+        if lane not in LANES:
+            raise ValueError(f"未知的优先级通道 '{lane}'，可选值: {', '.join(LANES)}")
+        self._ensure_dispatcher()
+
+        request = _Request(tenant, lane, tokens, asyncio.get_running_loop().create_future(), self.clock.now())
+        # start-time fair queuing: 租户的下一个请求排在它上一个请求的虚拟完成时间之后
+        start_tag = max(self._virtual_time[lane], self._last_finish.get((lane, tenant), 0.0))
+        finish_tag = start_tag + tokens / self.weight(tenant)
+        self._last_finish[(lane, tenant)] = finish_tag
+        heapq.heappush(self._finish_tags[lane], (finish_tag, tenant))
+        heapq.heappush(self._queues[lane], (start_tag, next(self._seq), request))
+        self._wakeup.set()
+
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            if request.future.done() and not request.future.cancelled():
+                self.adjust_tokens(tokens, requests=1)
+            else:
+                # 让调度协程跳过这个请求，而不是继续为它等待令牌
+                request.future.cancel()
+                self._wakeup.set()
+            raise
+        OPENAI_SCHEDULER_WAIT.labels(lane).observe(self.clock.now() - request.enqueued_at)
+        return Reservation(self, tokens)
+
+    def adjust_tokens(self, tokens: float, requests: float = 0) -> None:
+        """退还 (正数) 或追加扣除 (负数) 令牌"""
+        if tokens > 0:
+            self.tokens_bucket.refund(tokens)
+        elif tokens < 0:
+            self.tokens_bucket.consume(-tokens)
+        if requests:
+            self.requests_bucket.refund(requests)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pause(self, seconds: float) -> None:
+        """上游返回 429 时调用: seconds 秒内不再放行任何请求"""
+        self._paused_until = max(self._paused_until, self.clock.now() + seconds)
+
+    def _advance_virtual_time(self, lane: str, start_tag: float) -> None:
+        """
+        放行请求后推进通道的虚拟时间，并删除不再影响排队顺序的 _last_finish 记录
+        (完成时间不晚于虚拟时间的租户，下一个请求的 start tag 就是虚拟时间本身)。
+        通道排空时虚拟时间推进到最大的完成时间 (空闲时重置)，否则租户数会无限增长。
+        """
+        finish_tags = self._finish_tags[lane]
+        if not self._queues[lane] and finish_tags:
+            start_tag = max(start_tag, max(finish for finish, _ in finish_tags))
+        self._virtual_time[lane] = start_tag
+        while finish_tags and finish_tags[0][0] <= start_tag:
+            finish, tenant = heapq.heappop(finish_tags)
+            if self._last_finish.get((lane, tenant)) == finish:
+                del self._last_finish[(lane, tenant)]
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch_loop())
+
+    def _head(self) -> Optional[Tuple[str, float, _Request]]:
+        """按通道优先级返回下一个待放行的请求 (跳过已取消的请求)"""
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and queue[0][2].future.done():
+                heapq.heappop(queue)
+            if queue:
+                return lane, queue[0][0], queue[0][2]
+        return None
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            head = self._head()
+            if head is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            lane, start_tag, request = head
+            delay = max(self._paused_until - self.clock.now(),
+                        self.requests_bucket.time_until(1),
+                        self.tokens_bucket.time_until(request.tokens))
+            if delay <= 0:
+                heapq.heappop(self._queues[lane])
+                self.requests_bucket.consume(1)
+                self.tokens_bucket.consume(request.tokens)
+                self._advance_virtual_time(lane, start_tag)
+                self.dispatched[lane] += 1
+                request.future.set_result(None)
+                continue
+            # 睡眠到令牌补足，期间有新请求到达 (可能优先级更高或更小) 时提前醒来重新选择
+            self._wakeup.clear()
+            sleeper = asyncio.ensure_future(self.clock.sleep(delay))
+            waker = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({sleeper, waker}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sleeper.cancel()
+                waker.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": {lane: sum(1 for _, _, r in self._queues[lane] if not r.future.done()) for lane in LANES},
+            "dispatched": dict(self.dispatched),
+            "requests_available": self.requests_bucket.available(),
+            "tokens_available": self.tokens_bucket.available(),
+            "paused_seconds": max(0.0, self._paused_until - self.clock.now()),
+        }
+
+    async def aclose(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._dispatcher = None
+
+
+_scheduler: Optional[RateLimitScheduler] = None
+
+
+def get_openai_scheduler() -> Optional[RateLimitScheduler]:
+    """返回进程级共享的 OpenAI 限流调度器，openai.scheduler.enabled 为 False 时返回 None"""
+    global _scheduler
+    settings = get_setting("openai.scheduler", {})
+    if not settings.get("enabled", False):
+        return None
+    if _scheduler is None:
+        _scheduler = RateLimitScheduler(
+            requests_per_minute=settings.get("requests_per_minute", 3500),
+            tokens_per_minute=settings.get("tokens_per_minute", 90000),
+            burst_seconds=settings.get("burst_seconds", 10),
+            tenant_weights=settings.get("tenant_weights", {}),
+            default_weight=settings.get("default_weight", 1.0),
+            chars_per_token=settings.get("chars_per_token", 4),
+        )
+    return _scheduler
+
+
+def get_scheduler_stats() -> Optional[Dict[str, Any]]:
+    """返回共享调度器的统计信息，尚未创建时返回 None"""
+    return _scheduler.stats() if _scheduler is not None else None
+
+
+async def close_openai_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        scheduler, _scheduler = _scheduler, None
+        await scheduler.aclose()
@@ -20,9 +20,17 @@ CREATE TABLE ai_modules (
     -- You can add more fields as needed, e.g., creation time, modification time, category, etc.
 );
 
+-- Workflow Canvas Data Table
+CREATE TABLE workflow_data (
+    workflow_id INTEGER PRIMARY KEY REFERENCES workflows (id) ON DELETE CASCADE, -- One canvas document per workflow
+    data JSONB NOT NULL,                   -- WorkflowData document (canvasItems + connections)
+    version INTEGER NOT NULL DEFAULT 1,    -- Incremented on every save, used for optimistic concurrency and ETags
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now() -- Last save time
+);
+
 -- Indexes to optimize query performance, e.g., on name or type fields
--- CREATE INDEX idx_workflows_name ON workflows (name);
--- CREATE INDEX idx_ai_modules_type ON ai_modules (type);
+CREATE INDEX idx_workflows_name ON workflows (name);
+CREATE INDEX idx_ai_modules_type ON ai_modules (type);
 
 -- Comments to improve readability
 COMMENT ON TABLE workflows IS 'Table storing workflow definitions';
@@ -36,4 +44,10 @@ COMMENT ON COLUMN ai_modules.id IS 'AI Module ID, primary key, auto-incrementing
 COMMENT ON COLUMN ai_modules.name IS 'AI Module Name';
 COMMENT ON COLUMN ai_modules.type IS 'AI Module Type, e.g., text_generation, image_classification';
 COMMENT ON COLUMN ai_modules.description IS 'AI Module Description';
-COMMENT ON COLUMN ai_modules.config IS 'AI module configuration parameters, JSONB type';
\ No newline at end of file
+COMMENT ON COLUMN ai_modules.config IS 'AI module configuration parameters, JSONB type';
+
+COMMENT ON TABLE workflow_data IS 'Table storing the canvas data (WorkflowData) of each workflow';
+COMMENT ON COLUMN workflow_data.workflow_id IS 'Workflow ID, primary key, references workflows.id';
+COMMENT ON COLUMN workflow_data.data IS 'Canvas items and connections, JSONB type';
+COMMENT ON COLUMN workflow_data.version IS 'Document version, incremented on every save';
+COMMENT ON COLUMN workflow_data.updated_at IS 'Last save time';
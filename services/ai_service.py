@@ -1,36 +1,51 @@
 # services/ai_service.py
-from typing import List, Dict, Any
+import asyncio
+import time
+from functools import partial
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
+from config import get_setting
 from models.workflow_models import AIModule, AIModuleCreate, AIModuleUpdate
+from services.metrics import MODULE_RUN_DURATION, MODULE_RUN_ERRORS, MODULE_RUNS_COALESCED
+from services.module_executor import get_module_executor
+from services.plugin_registry import get_plugin_registry
+from services.result_cache import canonical_key, get_result_cache, is_result_cache_enabled
+from services.singleflight import get_single_flight
+from services.storage import create_repository
 
-# 假设我们使用一个简单的列表作为内存数据库来存储 AI 模块
-ai_modules_db: List[AIModule] = []
-ai_module_id_counter = 1
+# 按 id 哈希索引并在模块类型上建立二级索引，存储后端由 database.type 决定
+ai_module_repository = create_repository("ai_modules", AIModule, indexed_fields=("type",))
 
 class AIService:
     def get_all_ai_modules(self) -> List[AIModule]:
         """获取所有 AI 模块"""
-        return ai_modules_db
+        return ai_module_repository.list()
+
+    def list_ai_modules(self, limit: int, after_id: Optional[int] = None,
+                        module_type: Optional[str] = None, name: Optional[str] = None) -> List[AIModule]:
+        """按 id 游标分页获取 AI 模块，可按类型 (走类型索引) 和名称过滤"""
+        return ai_module_repository.page(after_id, limit, {"type": module_type, "name": name})
+
+    def iter_ai_modules(self, batch_size: int = 500, module_type: Optional[str] = None,
+                        name: Optional[str] = None) -> Iterator[AIModule]:
+        """分批遍历全部 AI 模块 (用于流式导出)"""
+        return ai_module_repository.iter_all(batch_size, {"type": module_type, "name": name})
 
     def create_ai_module(self, ai_module_create: AIModuleCreate) -> AIModule:
         """创建新的 AI 模块"""
-        global ai_module_id_counter
-        new_ai_module = AIModule(
-            id=ai_module_id_counter,
-            name=ai_module_create.name,
-            type=ai_module_create.type,
-            description=ai_module_create.description,
-            config=ai_module_create.config
-        )
-        ai_modules_db.append(new_ai_module)
-        ai_module_id_counter += 1
-        return new_ai_module
+        return ai_module_repository.create({
+            "name": ai_module_create.name,
+            "type": ai_module_create.type,
+            "description": ai_module_create.description,
+            "config": ai_module_create.config,
+        })
 
     def get_ai_module(self, ai_module_id: int) -> AIModule | None:
         """根据ID获取 AI 模块"""
-        for ai_module in ai_modules_db:
-            if ai_module.id == ai_module_id:
-                return ai_module
-        return None
+        return ai_module_repository.get(ai_module_id)
+
+    def get_ai_modules_by_type(self, module_type: str) -> List[AIModule]:
+        """根据模块类型获取 AI 模块 (使用类型索引)"""
+        return ai_module_repository.find_by("type", module_type)
 
     def run_ai_module(self, module_id: int, input_data: Dict[str, Any]) -> Any:
         """运行 AI 模块 (这里只是一个示例，实际需要根据模块类型和配置执行不同的 AI 逻辑)"""
@@ -38,28 +53,176 @@ class AIService:
         if not ai_module:
             raise ValueError(f"AI 模块 ID '{module_id}' 未找到")
 
-        module_type = ai_module.type
-        config = ai_module.config
+        return self.run_module(ai_module.type, ai_module.config, input_data)
 
-        if module_type == "text_generation":
-            model_name = config.get("model", "default-model")  # 从配置中获取模型名，如果没有则使用默认模型
-            input_text = input_data.get("input_text", "")
+    def run_module(self, module_type: str, config: Dict[str, Any] | None, input_data: Dict[str, Any]) -> Any:
+        """
+        按模块类型和配置运行 AI 逻辑 (不依赖已注册的模块，供工作流引擎直接执行画布节点)。
 
-            # 模拟文本生成逻辑 (实际中会调用 AI 模型 API 或库)
-            if model_name == "gpt-2":
-                generated_text = f"使用 GPT-2 模型生成文本: {input_text} ... (generated)"
-            else:
-                generated_text = f"使用默认模型生成文本: {input_text} ... (default generated)"
-            return generated_text
-
-        elif module_type == "image_classification":
-            image_path = input_data.get("image_path")
-            # 模拟图像分类逻辑 (实际中会调用图像分类模型)
-            if image_path:
-                classification_result = f"对图像 '{image_path}' 进行分类... (classified as 'cat')"
+        处理函数从插件注册表中按模块类型查找，首次使用时才导入对应的后端。
+        """
+        handler = get_plugin_registry().resolve(module_type)
+        if handler is None:
+            return f"AI 模块类型 '{module_type}' 的运行逻辑尚未实现"
+        return handler(config or {}, input_data)
+
+    async def run_ai_module_async(self, module_id: int, input_data: Dict[str, Any], use_cache: bool = True) -> Any:
+        """
+        异步运行 AI 模块，供 async 路由调用 (不阻塞事件循环)。
+
+        启用 result_cache 时，确定性的运行结果按 (模块 ID, 配置, 输入) 缓存；use_cache=False 跳过缓存。
+        """
+        ai_module = self.get_ai_module(module_id)
+        if not ai_module:
+            raise ValueError(f"AI 模块 ID '{module_id}' 未找到")
+
+        if not is_result_cache_enabled():
+            return await self.run_module_async(ai_module.type, ai_module.config, input_data)
+
+        cache = get_result_cache()
+        ttl_seconds = cache.ttl_for(ai_module.type, ai_module.config)
+        if not use_cache:
+            cache.record_bypass()
+        if not use_cache or ttl_seconds <= 0:
+            return await self.run_module_async(ai_module.type, ai_module.config, input_data)
+
+        cache_key = canonical_key(module_id, ai_module.type, ai_module.config, input_data)
+        found, result = await cache.get(cache_key)
+        if found:
+            return result
+        result = await self.run_module_async(ai_module.type, ai_module.config, input_data)
+        await cache.set(cache_key, result, ttl_seconds)
+        return result
+
+    async def run_ai_module_batch_async(self, module_id: int, inputs: List[Any], use_cache: bool = True) -> List[Dict[str, Any]]:
+        """
+        对同一个 AI 模块批量运行多条输入，模块只查找一次。
+
+        返回与 inputs 顺序一致的列表，每项为 {"result": ...} 或 {"error": "..."}，
+        单条输入失败不影响其他输入。启用 result_cache 时逐条命中缓存，只运行未命中的输入。
+        """
+        ai_module = self.get_ai_module(module_id)
+        if not ai_module:
+            raise ValueError(f"AI 模块 ID '{module_id}' 未找到")
+
+        outcomes: List[Dict[str, Any] | None] = [None] * len(inputs)
+        pending: List[int] = []
+        for position, input_data in enumerate(inputs):
+            if isinstance(input_data, dict):
+                pending.append(position)
             else:
-                classification_result = "未提供图像路径，无法分类"
-            return classification_result
+                outcomes[position] = {"error": "input_data 必须是 JSON 对象"}
+
+        cache = get_result_cache() if is_result_cache_enabled() else None
+        ttl_seconds = cache.ttl_for(ai_module.type, ai_module.config) if cache else 0
+        if cache and not use_cache:
+            cache.record_bypass()
+        cache_keys: Dict[int, str] = {}
+        if cache and use_cache and ttl_seconds > 0:
+            misses = []
+            for position in pending:
+                cache_keys[position] = canonical_key(module_id, ai_module.type, ai_module.config, inputs[position])
+                found, result = await cache.get(cache_keys[position])
+                if found:
+                    outcomes[position] = {"result": result}
+                else:
+                    misses.append(position)
+            pending = misses
 
+        results = await self.run_module_batch_async(ai_module.type, ai_module.config, [inputs[position] for position in pending])
+        for position, outcome in zip(pending, results):
+            outcomes[position] = outcome
+            if position in cache_keys and "result" in outcome:
+                await cache.set(cache_keys[position], outcome["result"], ttl_seconds)
+        return outcomes
+
+    async def run_module_batch_async(self, module_type: str, config: Dict[str, Any] | None,
+                                     inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量运行 AI 逻辑: 模块类型注册了 run_batch 处理函数时整批交给它 (例如 Hugging Face 微批调度器)，
+        否则逐条并发运行，同时在途的数量受 execution.batch_max_concurrency 限制。
+        """
+        config = config or {}
+        if not inputs:
+            return []
+
+        run_batch = get_plugin_registry().resolve_handler(module_type, "run_batch")
+        if run_batch is None:
+            results = await self._run_each(module_type, config, inputs)
         else:
-            return f"AI 模块类型 '{module_type}' 的运行逻辑尚未实现"
\ No newline at end of file
+            results = await run_batch(config, inputs,
+                                      lambda input_data: self.run_module_async(module_type, config, input_data),
+                                      lambda items: self._run_each(module_type, config, items))
+
+        return [{"error": str(result)} if isinstance(result, Exception) else {"result": result} for result in results]
+
+    async def _run_each(self, module_type: str, config: Dict[str, Any], inputs: List[Dict[str, Any]]) -> List[Any]:
+        """逐条并发运行，返回与 inputs 顺序一致的结果或异常"""
+        semaphore = asyncio.Semaphore(get_setting("execution.batch_max_concurrency", 16))
+
+        async def run_one(input_data: Dict[str, Any]) -> Any:
+            async with semaphore:
+                return await self.run_module_async(module_type, config, input_data)
+
+        return await asyncio.gather(*(run_one(input_data) for input_data in inputs), return_exceptions=True)
+
+    async def run_module_async(self, module_type: str, config: Dict[str, Any] | None, input_data: Dict[str, Any]) -> Any:
+        """
+        异步运行 AI 逻辑: 模块类型注册了 run_async 处理函数时在事件循环中等待它 (例如 OpenAI、Hugging Face 微批调度器)，
+        其余阻塞或 CPU 密集的模块交给执行层按模块类型配置的线程池/进程池运行。
+
+        (类型, 配置, 输入) 相同的并发调用只执行一次，其余调用等待同一个结果 (execution.coalesce_identical_runs)。
+        """
+        config = config or {}
+        if not get_setting("execution.coalesce_identical_runs", True):
+            return await self._execute_module(module_type, config, input_data)
+        return await get_single_flight().do(
+            canonical_key(None, module_type, config, input_data),
+            lambda: self._execute_module(module_type, config, input_data),
+            on_coalesced=MODULE_RUNS_COALESCED.labels(module_type).inc,
+        )
+
+    async def _execute_module(self, module_type: str, config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+        backend = config.get("backend", "builtin")
+        start = time.perf_counter()
+        try:
+            run_async = get_plugin_registry().resolve_handler(module_type, "run_async")
+            if run_async is None:
+                return await self._run_in_executor(module_type, config, input_data)
+            return await run_async(config, input_data, partial(self._run_in_executor, module_type))
+        except Exception:
+            MODULE_RUN_ERRORS.labels(module_type, backend).inc()
+            raise
+        finally:
+            MODULE_RUN_DURATION.labels(module_type, backend).observe(time.perf_counter() - start)
+
+    async def _run_in_executor(self, module_type: str, config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+        return await get_module_executor().run(module_type, run_module_in_worker, module_type, config, input_data)
+
+    async def stream_ai_module(self, module_id: int, input_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """流式运行 AI 模块，逐段产出生成的文本"""
+        ai_module = self.get_ai_module(module_id)
+        if not ai_module:
+            raise ValueError(f"AI 模块 ID '{module_id}' 未找到")
+
+        async for chunk in self.stream_module(ai_module.type, ai_module.config, input_data):
+            yield chunk
+
+    async def stream_module(self, module_type: str, config: Dict[str, Any] | None, input_data: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        流式运行 AI 逻辑: 模块类型注册了 stream 处理函数时逐段产出 (例如 OpenAI 流式 completions、
+        Hugging Face TextIteratorStreamer)，否则一次性产出完整结果。调用方关闭生成器 (例如客户端断开) 时取消生成。
+        """
+        config = config or {}
+        stream = get_plugin_registry().resolve_handler(module_type, "stream")
+        if stream is None:
+            yield str(await self.run_module_async(module_type, config, input_data))
+            return
+        async for chunk in stream(config, input_data,
+                                  lambda input_data: self.run_module_async(module_type, config, input_data)):
+            yield chunk
+
+
+def run_module_in_worker(module_type: str, config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+    """执行池中的入口 (模块级函数，便于进程池 pickle)"""
+    return AIService().run_module(module_type, config, input_data)
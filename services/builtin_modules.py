@@ -0,0 +1,224 @@
+# services/builtin_modules.py
+"""
+内置模块类型的处理函数，由插件注册表 (services/plugin_registry.py) 在首次使用时导入。
+
+run_* 处理函数签名为 handler(config, input_data) -> Any，在执行层的线程池/进程池中同步运行；
+*_async / *_batch / stream_* 在事件循环中运行，签名见 services/plugin_registry.py 的 HANDLER_KINDS。
+各后端 (transformers、OpenAI、NumPy 工具) 只在函数内部导入，未用到的后端不会被加载。
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+from config import get_setting
+from services.metrics import MODULE_RUN_DURATION, MODULE_RUN_ERRORS
+
+
+def openai_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """从模块配置中提取 OpenAI 调用参数"""
+    return {key: config[key] for key in ("max_tokens", "temperature", "timeout") if key in config}
+
+
+def raise_on_error(result: tuple) -> Any:
+    """把后端返回的 (结果, 错误信息) 转换为返回值或异常"""
+    generated_text, error = result
+    if error:
+        raise RuntimeError(error)
+    return generated_text
+
+
+def uses_hf_batcher(config: Dict[str, Any]) -> bool:
+    """Hugging Face 文本生成是否走微批调度器 (带 prompt_prefix 的请求逐条运行，以复用前缀的 KV 缓存)"""
+    return not config.get("prompt_prefix") and get_setting("ai_models.batching.enabled", True)
+
+
+def run_text_generation(config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+    model_name = config.get("model", "default-model")  # 从配置中获取模型名，如果没有则使用默认模型
+    input_text = input_data.get("input_text", "")
+    backend = config.get("backend")  # "huggingface" / "openai"，未配置时使用模拟逻辑
+    # 固定的提示前缀 (系统指令、少样本示例)，本地模型会缓存它的 KV，只对 input_text 做预填充
+    prompt_prefix = config.get("prompt_prefix", "")
+
+    if backend == "huggingface":
+        if prompt_prefix:
+            from hf_transformers import generate_text_hf_prefixed
+            return raise_on_error(generate_text_hf_prefixed(model_name, prompt_prefix, input_text,
+                                                            max_new_tokens=config.get("max_new_tokens", 50)))
+        from hf_batching import generate_text_hf_batched
+        return raise_on_error(generate_text_hf_batched(model_name, input_text))
+    input_text = prompt_prefix + input_text
+    if backend == "openai":
+        from openai_api import generate_text_openai
+        return raise_on_error(generate_text_openai(None, model_name, input_text, **openai_options(config)))
+
+    # 模拟文本生成逻辑 (实际中会调用 AI 模型 API 或库)
+    if model_name == "gpt-2":
+        generated_text = f"使用 GPT-2 模型生成文本: {input_text} ... (generated)"
+    else:
+        generated_text = f"使用默认模型生成文本: {input_text} ... (default generated)"
+    return generated_text
+
+
+async def run_text_generation_async(config: Dict[str, Any], input_data: Dict[str, Any],
+                                    run_sync: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]) -> Any:
+    """原生异步的后端 (OpenAI) 和 Hugging Face 微批调度器直接在事件循环中等待，其余交给执行层"""
+    backend = config.get("backend")
+    if backend == "openai":
+        from openai_api import generate_text_openai_async
+        return raise_on_error(await generate_text_openai_async(
+            config.get("model", "gpt-3.5-turbo-instruct"),
+            config.get("prompt_prefix", "") + input_data.get("input_text", ""),
+            **openai_options(config)))
+    if backend == "huggingface" and uses_hf_batcher(config):
+        from hf_batching import generate_text_hf_batched_async
+        return raise_on_error(await generate_text_hf_batched_async(
+            config.get("model", "default-model"), input_data.get("input_text", "")))
+    return await run_sync(config, input_data)
+
+
+async def run_text_generation_batch(config: Dict[str, Any], inputs: List[Dict[str, Any]],
+                                    run_one: Callable[[Dict[str, Any]], Awaitable[Any]],
+                                    run_each: Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]) -> List[Any]:
+    """Hugging Face 文本生成把整批输入一次性交给微批调度器，其他后端逐条并发运行"""
+    if config.get("backend") != "huggingface" or not uses_hf_batcher(config):
+        return await run_each(inputs)
+
+    from hf_batching import get_text_generation_batcher
+    batcher = get_text_generation_batcher(config.get("model", "default-model"))
+    start = time.perf_counter()
+    futures = batcher.submit_many([input_data.get("input_text", "") for input_data in inputs], max_length=50)
+    results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+    # 整批一起完成，每条输入记录同一个耗时
+    duration = time.perf_counter() - start
+    for result in results:
+        MODULE_RUN_DURATION.labels("text_generation", "huggingface").observe(duration)
+        if isinstance(result, Exception):
+            MODULE_RUN_ERRORS.labels("text_generation", "huggingface").inc()
+    return results
+
+
+async def stream_text_generation(config: Dict[str, Any], input_data: Dict[str, Any],
+                                 run_one: Callable[[Dict[str, Any]], Awaitable[Any]]) -> AsyncIterator[str]:
+    """OpenAI 使用流式 completions，Hugging Face 使用 TextIteratorStreamer，模拟逻辑一次性产出完整结果"""
+    prompt_text = config.get("prompt_prefix", "") + input_data.get("input_text", "")
+    if config.get("backend") == "openai":
+        from openai_api import get_openai_backend
+        async for chunk in get_openai_backend().stream_complete(
+                prompt_text, model=config.get("model", "gpt-3.5-turbo-instruct"), **openai_options(config)):
+            yield chunk
+        return
+    if config.get("backend") == "huggingface":
+        async for chunk in _stream_hf(config.get("model", "gpt2"), prompt_text):
+            yield chunk
+        return
+    yield str(await run_one(input_data))
+
+
+async def _stream_hf(model_name: str, prompt_text: str) -> AsyncIterator[str]:
+    """
+    在模块执行层的 text_generation 线程池中运行 stream_text_hf 的生成，并把文本片段转交给事件循环。
+
+    生成出错或超时时异常在这里重新抛出 (SSE 接口以 error 事件返回给客户端)。
+    """
+    from hf_transformers import stream_text_hf
+    from services.module_executor import get_module_executor
+
+    loop = asyncio.get_running_loop()
+    stop_event = threading.Event()
+    pool = get_module_executor().get_pool("text_generation")
+    if not isinstance(pool, ThreadPoolExecutor):
+        pool = None  # streamer 只能在同一进程内消费，进程池配置下退回到后台线程
+    chunks = stream_text_hf(model_name, prompt_text, stop_event=stop_event, executor=pool)
+    finished = object()
+    try:
+        while True:
+            # 等待下一个片段会阻塞 (至多 stream_timeout_seconds)，放到默认执行器中
+            chunk = await loop.run_in_executor(None, next, chunks, finished)
+            if chunk is finished:
+                return
+            yield chunk
+    finally:
+        stop_event.set()
+
+
+def run_image_classification(config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+    image_path = input_data.get("image_path")
+    if config.get("backend") == "huggingface":
+        from hf_vision import classify_image_hf, classify_images_hf, expand_image_paths, get_image_root, resolve_image_path
+        settings = get_setting("ai_models.image_classification", {})
+        model_name = config.get("model", settings.get("default_model", "google/vit-base-patch16-224"))
+        top_k = config.get("top_k", 1)
+        # 客户端提供的路径只能指向 image_root 之下的文件，越界时返回 400
+        image_root = get_image_root()
+        # image_paths (列表) 或 image_dir (目录) 时整批解码和推理，返回与输入顺序一致的结果列表
+        if "image_paths" in input_data or "image_dir" in input_data:
+            image_paths = expand_image_paths(input_data.get("image_paths", ()), input_data.get("image_dir"),
+                                             max_images=settings.get("max_images", 10000), image_root=image_root)
+            return classify_images_hf(model_name, image_paths, top_k=top_k)
+        if not image_path:
+            raise ValueError("未提供图像路径，无法分类")
+        return raise_on_error(classify_image_hf(model_name, resolve_image_path(image_path, image_root), top_k=top_k))
+
+    # 模拟图像分类逻辑 (实际中会调用图像分类模型)
+    if image_path:
+        classification_result = f"对图像 '{image_path}' 进行分类... (classified as 'cat')"
+    else:
+        classification_result = "未提供图像路径，无法分类"
+    return classification_result
+
+
+async def run_image_classification_batch(config: Dict[str, Any], inputs: List[Dict[str, Any]],
+                                         run_one: Callable[[Dict[str, Any]], Awaitable[Any]],
+                                         run_each: Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]) -> List[Any]:
+    """
+    Hugging Face 图像分类把整批图像合并为一次运行: 并行解码，按 ai_models.image_classification.batch_size 分批前向。
+    路径和解码错误逐条返回，只有加载模型等整批共用的步骤失败时整批失败；其他后端逐条并发运行。
+    """
+    if config.get("backend") != "huggingface":
+        return await run_each(inputs)
+
+    from hf_vision import get_image_root, resolve_image_path
+    image_root = get_image_root()
+    results: List[Any] = [None] * len(inputs)
+    valid: List[int] = []
+    image_paths: List[str] = []
+    # 缺少路径或路径越界只影响这一条输入，解码失败由 classify_images_hf 逐张返回
+    for index, input_data in enumerate(inputs):
+        try:
+            if not input_data.get("image_path"):
+                raise ValueError("未提供图像路径，无法分类")
+            image_paths.append(resolve_image_path(input_data["image_path"], image_root))
+            valid.append(index)
+        except ValueError as e:
+            results[index] = e
+    if valid:
+        try:
+            classified = await run_one({"image_paths": image_paths})
+        except Exception as e:
+            # 整批共用的步骤 (例如加载模型) 失败时，这一批的每张图像都返回同一个错误
+            classified = [{"error": str(e)}] * len(valid)
+        for index, outcome in zip(valid, classified):
+            results[index] = RuntimeError(outcome["error"]) if "error" in outcome else outcome
+    return results
+
+
+def run_data_processing(config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+    from ai_utils import clean_texts, extract_keywords, get_corpus_index, normalize_data
+    operation = config.get("operation", "clean_text")  # "clean_text" / "normalize" / "extract_keywords"
+    if operation == "clean_text":
+        if "texts" in input_data:
+            return list(clean_texts(input_data["texts"]))
+        return next(clean_texts([input_data.get("input_text", "")]))
+    if operation == "normalize":
+        return normalize_data(list(input_data.get("data", [])), config.get("normalization_type", "min-max"))
+    if operation == "extract_keywords":
+        num_keywords = config.get("num_keywords", 5)
+        method = config.get("method", "tfidf")
+        if "texts" in input_data and method == "tfidf":
+            return get_corpus_index().extract_batch(input_data["texts"], num_keywords)
+        if "texts" in input_data:
+            return [extract_keywords(text, num_keywords, method) for text in input_data["texts"]]
+        return extract_keywords(input_data.get("input_text", ""), num_keywords, method)
+    raise ValueError(f"未知的数据处理操作 '{operation}'")
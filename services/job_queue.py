@@ -0,0 +1,481 @@
+# services/job_queue.py
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from config import get_setting
+
+JOB_KINDS = ("module", "workflow")
+TERMINAL_STATUSES = ("succeeded", "failed")
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+
+
+class Job(BaseModel):
+    """异步任务: 运行一个 AI 模块或整个工作流"""
+    id: str
+    kind: str  # "module" / "workflow"
+    target_id: int  # 模块 ID 或工作流 ID
+    input_data: Dict[str, Any] = {}
+    priority: int = MIN_PRIORITY  # 数值越大越先执行
+    status: str = "queued"  # queued / running / succeeded / failed
+    attempts: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+def new_job(kind: str, target_id: int, input_data: Optional[Dict[str, Any]] = None, priority: int = MIN_PRIORITY) -> Job:
+    if kind not in JOB_KINDS:
+        raise ValueError(f"未知的任务类型 '{kind}'，可选值: {', '.join(JOB_KINDS)}")
+    if not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+        raise ValueError(f"priority 必须在 {MIN_PRIORITY} 到 {MAX_PRIORITY} 之间")
+    return Job(id=uuid.uuid4().hex, kind=kind, target_id=target_id, input_data=input_data or {},
+               priority=priority, created_at=time.time())
+
+
+class InMemoryJobQueue:
+    """
+    进程内任务队列 (测试和单进程部署使用)。
+
+    就绪任务保存在按 (优先级, 入队顺序) 排序的堆中；被领取的任务持有租约，
+    租约到期仍未完成 (例如 worker 崩溃) 时重新入队，超过 max_attempts 次后标记为失败。
+    已结束的任务保留 result_ttl_seconds 秒，最多保留 max_finished_jobs 个 (超出时先淘汰最早结束的)。
+    """
+
+    def __init__(self, visibility_timeout: float = 300, max_attempts: int = 3, result_ttl_seconds: float = 86400,
+                 max_finished_jobs: int = 10000):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, Job] = {}
+        self._ready: List[Tuple[int, int, str]] = []
+        self._leases: Dict[str, float] = {}
+        # 已结束的任务 id -> 结束时间 (按结束顺序)
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._seq = itertools.count()
+        self._work_available = asyncio.Event()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def _publish(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        for subscriber in self._subscribers.get(job.id, ()):
+            subscriber.put_nowait(job)
+        if job.status in TERMINAL_STATUSES:
+            self._finished[job.id] = time.monotonic()
+            self._evict_finished()
+
+    def _evict_finished(self) -> None:
+        expire_before = time.monotonic() - self.result_ttl_seconds
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > expire_before and len(self._finished) <= self.max_finished_jobs:
+                return
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def _push_ready(self, job: Job) -> None:
+        heapq.heappush(self._ready, (-job.priority, next(self._seq), job.id))
+        self._work_available.set()
+
+    async def enqueue(self, job: Job) -> Job:
+        self._publish(job)
+        self._push_ready(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        self._evict_finished()
+        return self._jobs.get(job_id)
+
+    async def claim(self) -> Optional[Job]:
+        """领取优先级最高的就绪任务并加上租约，没有任务时返回 None"""
+        while self._ready:
+            _, _, job_id = heapq.heappop(self._ready)
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue  # 已被淘汰，或重新入队后又由原来的 worker 结束
+            self._leases[job_id] = time.monotonic() + self.visibility_timeout
+            job = _start_attempt(job, self.max_attempts)
+            self._publish(job)
+            if job.status == "running":
+                return job
+            self._leases.pop(job_id, None)
+        self._work_available.clear()
+        return None
+
+    async def extend_lease(self, job_id: str) -> None:
+        if job_id in self._leases:
+            self._leases[job_id] = time.monotonic() + self.visibility_timeout
+
+    async def complete(self, job_id: str, result: Any, attempt: Optional[int] = None) -> bool:
+        return await self._finish(job_id, attempt, status="succeeded", result=result)
+
+    async def fail(self, job_id: str, error: str, attempt: Optional[int] = None) -> bool:
+        return await self._finish(job_id, attempt, status="failed", error=error)
+
+    async def _finish(self, job_id: str, attempt: Optional[int], **changes: Any) -> bool:
+        """
+        结束任务。attempt 为 worker 领取时的尝试次数: 租约已过期 (任务已重新入队或被其他 worker 领取) 时
+        忽略这次结束，返回 False。
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status != "running" or job_id not in self._leases:
+            return False
+        if attempt is not None and job.attempts != attempt:
+            return False
+        del self._leases[job_id]
+        self._publish(job.copy(update={**changes, "finished_at": time.time()}))
+        return True
+
+    async def requeue_expired(self) -> List[str]:
+        """把租约已过期的任务放回就绪队列"""
+        now = time.monotonic()
+        expired = [job_id for job_id, deadline in self._leases.items() if deadline <= now]
+        for job_id in expired:
+            del self._leases[job_id]
+            job = self._jobs[job_id].copy(update={"status": "queued"})
+            self._publish(job)
+            self._push_ready(job)
+        return expired
+
+    async def wait_for_work(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._work_available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def watch(self, job_id: str) -> AsyncIterator[Job]:
+        """依次产出任务的状态变化 (首先产出当前状态)，任务结束后停止"""
+        subscriber: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(subscriber)
+        try:
+            job = self._jobs.get(job_id)
+            while job is not None:
+                yield job
+                if job.status in TERMINAL_STATUSES:
+                    return
+                job = await subscriber.get()
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def aclose(self) -> None:
+        pass
+
+
+# ZPOPMIN 取出分数最小 (优先级最高、最早入队) 的任务，同时写入租约，保证多个 worker 不会领取同一个任务
+_CLAIM_SCRIPT = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then return false end
+redis.call('ZADD', KEYS[2], ARGV[1], item[1])
+return item[1]
+"""
+
+# 结束任务: 租约仍然属于这次尝试时，在同一个脚本中删除租约并保存结果，
+# 中途不会被 requeue_expired 放回就绪队列 (KEYS: leases, scores, lease_attempts, job; ARGV: id, 尝试次数, 任务 JSON, TTL, 频道)
+_FINISH_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('SET', KEYS[4], ARGV[3], 'EX', ARGV[4])
+redis.call('PUBLISH', ARGV[5], ARGV[3])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """
+    基于 Redis 的任务队列，多个进程/实例共享。
+
+    - {prefix}ready: 就绪任务 ZSET，分数 = -优先级 * 1e13 + 入队毫秒时间戳
+    - {prefix}leases: 租约 ZSET，分数 = 租约到期的毫秒时间戳
+    - {prefix}lease_attempts: 任务 id -> 持有租约的尝试次数，结束任务时据此拒绝过期 worker 的结果
+    - {prefix}scores: 任务 id -> 就绪分数，用于租约过期后重新入队
+    - {prefix}job:{id}: 任务 JSON；状态变化发布到频道 {prefix}events:{id}
+
+    结束任务 (Lua 脚本) 和重新入队 (WATCH 事务) 都把租约检查、租约删除和任务保存放在一次原子操作中。
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, visibility_timeout: float = 300, max_attempts: int = 3,
+                 result_ttl_seconds: int = 86400, key_prefix: str = "aiflow:jobs:", client: Any = None):
+        import redis.asyncio as redis_asyncio
+
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.result_ttl_seconds = result_ttl_seconds
+        self.key_prefix = key_prefix
+        self._redis = client if client is not None else redis_asyncio.from_url(redis_url)
+        self._claim = self._redis.register_script(_CLAIM_SCRIPT)
+        self._finish_script = self._redis.register_script(_FINISH_SCRIPT)
+        self._ready_key = key_prefix + "ready"
+        self._leases_key = key_prefix + "leases"
+        self._lease_attempts_key = key_prefix + "lease_attempts"
+        self._scores_key = key_prefix + "scores"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.key_prefix}job:{job_id}"
+
+    def _channel(self, job_id: str) -> str:
+        return f"{self.key_prefix}events:{job_id}"
+
+    def _lease_deadline_ms(self) -> int:
+        return int((time.time() + self.visibility_timeout) * 1000)
+
+    async def _save(self, job: Job, pipe: Any = None) -> None:
+        raw = job.json()
+        target = pipe if pipe is not None else self._redis.pipeline(transaction=False)
+        target.set(self._job_key(job.id), raw, ex=self.result_ttl_seconds)
+        target.publish(self._channel(job.id), raw)
+        if pipe is None:
+            await target.execute()
+
+    async def enqueue(self, job: Job) -> Job:
+        score = -job.priority * 1e13 + int(job.created_at * 1000)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            await self._save(job, pipe)
+            pipe.hset(self._scores_key, job.id, score)
+            pipe.zadd(self._ready_key, {job.id: score})
+            await pipe.execute()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raw = await self._redis.get(self._job_key(job_id))
+        return Job.parse_raw(raw) if raw is not None else None
+
+    async def claim(self) -> Optional[Job]:
+        while True:
+            job_id = await self._claim(keys=[self._ready_key, self._leases_key], args=[self._lease_deadline_ms()])
+            if job_id is None:
+                return None
+            job = await self.get(job_id.decode())
+            if job is None or job.status != "queued":
+                # 任务记录已过期，或已经结束 (与 InMemoryJobQueue 一样跳过)
+                await self._forget(job_id.decode())
+                continue
+            job = _start_attempt(job, self.max_attempts)
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await self._save(job, pipe)
+                if job.status == "running":
+                    pipe.hset(self._lease_attempts_key, job.id, job.attempts)
+                await pipe.execute()
+            if job.status == "running":
+                return job
+            await self._forget(job.id)
+
+    async def extend_lease(self, job_id: str) -> None:
+        await self._redis.zadd(self._leases_key, {job_id: self._lease_deadline_ms()}, xx=True)
+
+    async def _forget(self, job_id: str) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._leases_key, job_id)
+            pipe.hdel(self._lease_attempts_key, job_id)
+            pipe.hdel(self._scores_key, job_id)
+            await pipe.execute()
+
+    async def complete(self, job_id: str, result: Any, attempt: Optional[int] = None) -> bool:
+        return await self._finish(job_id, attempt, status="succeeded", result=result)
+
+    async def fail(self, job_id: str, error: str, attempt: Optional[int] = None) -> bool:
+        return await self._finish(job_id, attempt, status="failed", error=error)
+
+    async def _finish(self, job_id: str, attempt: Optional[int], **changes: Any) -> bool:
+        """
+        与 InMemoryJobQueue 相同: 租约已过期或尝试次数不一致时忽略这次结束。
+
+        租约是否仍属于读到的这次尝试由 Lua 脚本在保存结果的同时检查，读取之后任务被重新入队或被其他 worker
+        领取时脚本不做任何修改。
+        """
+        job = await self.get(job_id)
+        if job is None or job.status != "running":
+            return False
+        if attempt is not None and job.attempts != attempt:
+            return False
+        finished = job.copy(update={**changes, "finished_at": time.time()})
+        applied = await self._finish_script(
+            keys=[self._leases_key, self._scores_key, self._lease_attempts_key, self._job_key(job_id)],
+            args=[job_id, job.attempts, finished.json(), self.result_ttl_seconds, self._channel(job_id)])
+        return bool(applied)
+
+    async def requeue_expired(self) -> List[str]:
+        """把租约已过期的任务放回就绪队列，返回重新入队的任务 id"""
+        now_ms = int(time.time() * 1000)
+        expired = await self._redis.zrangebyscore(self._leases_key, "-inf", now_ms)
+        return [job_id.decode() for job_id in expired if await self._requeue_one(job_id.decode(), now_ms)]
+
+    async def _requeue_one(self, job_id: str, now_ms: int) -> bool:
+        """在 WATCH 事务中确认租约仍然过期，然后删除租约、放回就绪队列并把状态改回 queued"""
+        async def apply(pipe: Any) -> bool:
+            deadline = await pipe.zscore(self._leases_key, job_id)
+            if deadline is None or deadline > now_ms:
+                return False  # 已经结束、续约或被其他 worker 重新入队
+            raw = await pipe.get(self._job_key(job_id))
+            score = await pipe.hget(self._scores_key, job_id)
+            pipe.multi()
+            pipe.zrem(self._leases_key, job_id)
+            pipe.hdel(self._lease_attempts_key, job_id)
+            if raw is None or score is None:  # 任务记录已过期
+                pipe.hdel(self._scores_key, job_id)
+                return False
+            pipe.zadd(self._ready_key, {job_id: float(score)})
+            await self._save(Job.parse_raw(raw).copy(update={"status": "queued"}), pipe)
+            return True
+
+        return await self._redis.transaction(apply, self._leases_key, self._job_key(job_id), value_from_callable=True)
+
+    async def wait_for_work(self, timeout: float) -> None:
+        await asyncio.sleep(timeout)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Job]:
+        """先订阅事件频道再读取当前状态，避免漏掉两者之间发生的变化"""
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel(job_id))
+        try:
+            job = await self.get(job_id)
+            while job is not None:
+                yield job
+                if job.status in TERMINAL_STATUSES:
+                    return
+                message = None
+                while message is None:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                job = Job.parse_raw(message["data"])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+def _start_attempt(job: Job, max_attempts: int) -> Job:
+    """领取任务时增加尝试次数，超过上限的任务直接标记为失败"""
+    attempts = job.attempts + 1
+    if attempts > max_attempts:
+        return job.copy(update={"attempts": job.attempts, "status": "failed", "finished_at": time.time(),
+                                "error": f"任务已尝试 {job.attempts} 次仍未完成 (worker 可能已崩溃)"})
+    return job.copy(update={"attempts": attempts, "status": "running", "started_at": time.time()})
+
+
+JobHandler = Callable[[Job], Awaitable[Any]]
+
+
+class JobWorkerPool:
+    """在当前进程的事件循环中运行若干个 worker 协程，循环领取并执行任务"""
+
+    def __init__(self, queue: Any, handlers: Dict[str, JobHandler], workers: int = 2, poll_interval: float = 0.2):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._last_requeue = 0.0
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work(), name=f"job-worker-{index}") for index in range(self.workers)]
+
+    async def stop(self) -> None:
+        """取消所有 worker; 正在执行的任务租约到期后由其他 worker 重新执行"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                now = time.monotonic()
+                if now - self._last_requeue >= self.queue.visibility_timeout / 4:
+                    self._last_requeue = now
+                    await self.queue.requeue_expired()
+                job = await self.queue.claim()
+                if job is None:
+                    await self.queue.wait_for_work(self.poll_interval)
+                    continue
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in job worker: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, job: Job) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            result = await self.handlers[job.kind](job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error running job {job.id}: {e}")
+            await self.queue.fail(job.id, str(e), attempt=job.attempts)
+        else:
+            await self.queue.complete(job.id, result, attempt=job.attempts)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """执行期间定期续约，长时间运行的任务不会被误判为 worker 崩溃"""
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout / 3)
+            await self.queue.extend_lease(job_id)
+
+
+_job_queue: Optional[Any] = None
+_job_workers: Optional[JobWorkerPool] = None
+
+
+def get_job_queue() -> Any:
+    """返回进程级共享的任务队列 (jobs.backend 为 redis 时使用 Redis，否则使用进程内队列)"""
+    global _job_queue
+    if _job_queue is None:
+        visibility_timeout = get_setting("jobs.visibility_timeout_seconds", 300)
+        max_attempts = get_setting("jobs.max_attempts", 3)
+        if get_setting("jobs.backend", "inmemory") == "redis":
+            _job_queue = RedisJobQueue(
+                get_setting("jobs.redis_url") or os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+                visibility_timeout=visibility_timeout,
+                max_attempts=max_attempts,
+                result_ttl_seconds=get_setting("jobs.result_ttl_seconds", 86400),
+            )
+        else:
+            _job_queue = InMemoryJobQueue(visibility_timeout=visibility_timeout, max_attempts=max_attempts,
+                                          result_ttl_seconds=get_setting("jobs.result_ttl_seconds", 86400),
+                                          max_finished_jobs=get_setting("jobs.max_finished_jobs", 10000))
+    return _job_queue
+
+
+def start_job_workers(handlers: Dict[str, JobHandler]) -> Optional[JobWorkerPool]:
+    """按 jobs.workers 启动本进程的 worker (0 表示本进程只接收任务、不执行)"""
+    global _job_workers
+    workers = get_setting("jobs.workers", 2)
+    if workers <= 0:
+        return None
+    _job_workers = JobWorkerPool(get_job_queue(), handlers, workers=workers,
+                                 poll_interval=get_setting("jobs.poll_interval_ms", 200) / 1000)
+    _job_workers.start()
+    return _job_workers
+
+
+async def close_job_queue() -> None:
+    """停止 worker 并关闭队列连接 (应用关闭时调用)"""
+    global _job_queue, _job_workers
+    if _job_workers is not None:
+        workers, _job_workers = _job_workers, None
+        await workers.stop()
+    if _job_queue is not None:
+        queue, _job_queue = _job_queue, None
+        await queue.aclose()
@@ -0,0 +1,421 @@
+# services/metrics.py
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 请求/模块运行延迟的默认分桶 (秒)
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 模型加载耗时分桶 (秒)
+MODEL_LOAD_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 微批调度器的批大小和排队等待时间 (秒) 分桶
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BATCH_QUEUE_WAIT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """用作上下文管理器，退出时记录耗时"""
+        return _Timer(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各桶的计数 (非累计)、总数和总和，供 JSON 统计接口使用"""
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        labels = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        return {"buckets": dict(zip(labels, counts)), "count": sum(counts), "sum": total}
+
+
+class _Timer:
+    def __init__(self, histogram: _HistogramChild):
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _Metric:
+    """指标族: 按标签值缓存子指标，热路径上只有一次字典查找和一次加锁的累加"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            children = list(self._children.items())
+        return [(self.name, dict(zip(self.labelnames, key)), child.value) for key, child in children]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            children = list(self._children.items())
+        samples: List[Sample] = []
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+class MetricFamily:
+    """采集时临时生成的指标 (例如从模型池、缓存的 stats() 读取的当前值)"""
+
+    def __init__(self, name: str, type_name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]] = ()):
+        self.name = name
+        self.type_name = type_name
+        self.documentation = documentation
+        self._samples = [(name, labels, value) for labels, value in samples]
+
+    def add(self, labels: Dict[str, str], value: float) -> "MetricFamily":
+        self._samples.append((self.name, labels, value))
+        return self
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+
+Collector = Callable[[], Iterable[MetricFamily]]
+
+
+class Registry:
+    """指标注册表，render() 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            families: List[Any] = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        lines: List[str] = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.type_name}")
+            for name, labels, value in family.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ------ 应用指标 ------
+HTTP_REQUESTS = counter("aiflow_http_requests_total", "HTTP requests by route and status code",
+                        ("method", "route", "status"))
+HTTP_REQUEST_DURATION = histogram("aiflow_http_request_duration_seconds", "HTTP request latency by route",
+                                  ("method", "route"))
+HTTP_IN_FLIGHT = gauge("aiflow_http_requests_in_flight", "HTTP requests currently being served")
+MODULE_RUN_DURATION = histogram("aiflow_module_run_duration_seconds", "AI module run duration by module type and backend",
+                                ("module_type", "backend"))
+MODULE_RUN_ERRORS = counter("aiflow_module_run_errors_total", "Failed AI module runs by module type and backend",
+                            ("module_type", "backend"))
+MODULE_RUNS_COALESCED = counter("aiflow_module_runs_coalesced_total",
+                                "Module runs that awaited an identical in-flight run instead of executing",
+                                ("module_type",))
+MODEL_LOAD_DURATION = histogram("aiflow_model_load_duration_seconds", "Model load time of the Hugging Face model pool",
+                                ("model",), buckets=MODEL_LOAD_BUCKETS)
+HF_PREFIX_PREFILL_DURATION = histogram("aiflow_hf_prefix_prefill_duration_seconds",
+                                       "Forward pass time to build a cached prompt prefix", ("model",))
+HF_ARTIFACT_REBUILDS = counter("aiflow_hf_artifact_rebuilds_total",
+                               "Cached inference artifacts rebuilt because they failed to load", ("mode",))
+HF_BATCH_SIZE = histogram("aiflow_hf_batch_size", "Requests per batch executed by the Hugging Face micro-batcher",
+                          ("model",), buckets=BATCH_SIZE_BUCKETS)
+HF_BATCH_QUEUE_WAIT = histogram("aiflow_hf_batch_queue_wait_seconds",
+                                "Time requests waited in the Hugging Face micro-batcher before their batch started",
+                                ("model",), buckets=BATCH_QUEUE_WAIT_BUCKETS)
+OPENAI_REQUEST_DURATION = histogram("aiflow_openai_request_duration_seconds",
+                                    "OpenAI upstream latency per attempt (time to response headers for streams)",
+                                    ("endpoint", "status"))
+OPENAI_SCHEDULER_WAIT = histogram("aiflow_openai_scheduler_wait_seconds",
+                                  "Time OpenAI requests waited in the rate limit scheduler by lane", ("lane",))
+OPENAI_RETRIES = counter("aiflow_openai_retries_total", "Retried OpenAI upstream requests", ("endpoint",))
+# ------ 应用指标结束 ------
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件: 记录每个路由的请求数、延迟和在途请求数。
+
+    路由标签使用路由模板 (例如 /workflows/{workflow_id}) 而不是原始路径，未匹配的请求归入 "unmatched"，
+    避免标签基数随 URL 增长。流式响应的延迟计到响应体发送完毕为止。
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, route_path).observe(duration)
+            HTTP_REQUESTS.labels(method, route_path, status_code).inc()
+
+
+def _model_pool_metrics() -> Iterable[MetricFamily]:
+    from model_pool import get_model_pool
+
+    stats = get_model_pool().stats()
+    yield MetricFamily("aiflow_model_pool_entries", "gauge", "Models currently loaded in the pool", [({}, stats["entries"])])
+    yield MetricFamily("aiflow_model_pool_memory_bytes", "gauge", "Estimated memory held by loaded models",
+                       [({}, stats["memory_bytes"])])
+    yield MetricFamily("aiflow_model_pool_max_memory_bytes", "gauge", "Memory budget of the model pool",
+                       [({}, stats["max_memory_bytes"])])
+    for name in ("hits", "misses", "evictions", "load_errors"):
+        yield MetricFamily(f"aiflow_model_pool_{name}_total", "counter", f"Model pool {name.replace('_', ' ')}",
+                           [({}, stats[name])])
+
+
+def _prefix_cache_metrics() -> Iterable[MetricFamily]:
+    from hf_transformers import get_prefix_cache_stats
+
+    stats = get_prefix_cache_stats()
+    if stats is None:
+        return []
+    lookups = MetricFamily("aiflow_hf_prefix_cache_lookups_total", "counter", "Prompt prefix KV cache lookups by outcome")
+    for outcome in ("hits", "misses"):
+        lookups.add({"outcome": outcome}, stats[outcome])
+    return [lookups,
+            MetricFamily("aiflow_hf_prefix_cache_memory_bytes", "gauge", "Memory held by cached prompt prefix KV tensors",
+                         [({}, stats["memory_bytes"])]),
+            MetricFamily("aiflow_hf_prefix_cache_evictions_total", "counter", "Prompt prefixes evicted from the KV cache",
+                         [({}, stats["evictions"])])]
+
+
+def _openai_scheduler_metrics() -> Iterable[MetricFamily]:
+    from openai_scheduler import get_scheduler_stats
+
+    stats = get_scheduler_stats()
+    if stats is None:
+        return []
+    queue_depth = MetricFamily("aiflow_openai_scheduler_queue_depth", "gauge",
+                               "OpenAI requests waiting in the rate limit scheduler by lane")
+    dispatched = MetricFamily("aiflow_openai_scheduler_dispatched_total", "counter",
+                              "OpenAI requests released by the rate limit scheduler by lane")
+    for lane, depth in stats["queue_depth"].items():
+        queue_depth.add({"lane": lane}, depth)
+        dispatched.add({"lane": lane}, stats["dispatched"][lane])
+    available = MetricFamily("aiflow_openai_scheduler_available", "gauge", "Tokens left in the rate limit buckets",
+                             [({"bucket": "requests"}, stats["requests_available"]),
+                              ({"bucket": "tokens"}, stats["tokens_available"])])
+    return [queue_depth, dispatched, available]
+
+
+def _batching_metrics() -> Iterable[MetricFamily]:
+    from hf_batching import get_batching_stats
+
+    # 批大小和排队等待时间由 HF_BATCH_SIZE / HF_BATCH_QUEUE_WAIT 直方图记录，这里只有当前队列深度
+    queue_depth = MetricFamily("aiflow_hf_batch_queue_depth", "gauge", "Requests waiting in the Hugging Face micro-batcher")
+    for model, stats in get_batching_stats().items():
+        queue_depth.add({"model": model}, stats["queue_depth"])
+    return [queue_depth]
+
+
+def _result_cache_metrics() -> Iterable[MetricFamily]:
+    from services.result_cache import get_result_cache, is_result_cache_enabled
+
+    if not is_result_cache_enabled():
+        return []
+    stats = get_result_cache().stats()
+    lookups = MetricFamily("aiflow_result_cache_lookups_total", "counter", "Result cache lookups by outcome")
+    for outcome in ("l1_hits", "l2_hits", "misses", "bypassed"):
+        lookups.add({"outcome": outcome}, stats[outcome])
+    return [lookups, MetricFamily("aiflow_result_cache_l1_entries", "gauge", "Entries in the in-process result cache",
+                                  [({}, stats["l1_entries"])])]
+
+
+def _node_memo_metrics() -> Iterable[MetricFamily]:
+    from services.node_memo import get_node_memo, is_node_memo_enabled
+
+    if not is_node_memo_enabled():
+        return []
+    stats = get_node_memo().stats()
+    lookups = MetricFamily("aiflow_node_memo_lookups_total", "counter", "Workflow node memo lookups by outcome")
+    for outcome in ("hits", "misses"):
+        lookups.add({"outcome": outcome}, stats[outcome])
+    return [lookups,
+            MetricFamily("aiflow_node_memo_evictions_total", "counter", "Workflow node outputs evicted from the memo",
+                         [({}, stats["evictions"])]),
+            MetricFamily("aiflow_node_memo_bytes", "gauge", "Serialized size of memoized workflow node outputs",
+                         [({}, stats["bytes"])])]
+
+
+def register_default_collectors() -> None:
+    """注册从模型池、KV 缓存、微批调度器、各类缓存和 OpenAI 调度器的 stats() 读取的指标 (采集时才计算，热路径没有额外开销)"""
+    for collector in (_model_pool_metrics, _prefix_cache_metrics, _batching_metrics, _result_cache_metrics,
+                      _node_memo_metrics, _openai_scheduler_metrics):
+        REGISTRY.register_collector(collector)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
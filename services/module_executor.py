@@ -0,0 +1,89 @@
+# services/module_executor.py
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from config import get_setting
+
+DEFAULT_POOL_CONFIG: Dict[str, Any] = {"kind": "thread", "max_workers": 8}
+
+
+class ModuleExecutor:
+    """
+    模块执行层: 把阻塞的模块逻辑从事件循环中移出。
+
+    每种模块类型按 execution.module_types 配置使用线程池 (阻塞 I/O、释放 GIL 的推理)
+    或进程池 (纯 Python 的 CPU 密集型计算，以 spawn 方式启动)，未配置的类型使用 execution.default。
+    同一配置的池按需创建并在类型之间共享。
+    """
+
+    def __init__(self, module_types: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default: Optional[Dict[str, Any]] = None):
+        self.module_types = module_types if module_types is not None else get_setting("execution.module_types", {})
+        self.default = default or get_setting("execution.default", DEFAULT_POOL_CONFIG)
+        self._pools: Dict[str, Executor] = {}
+        self._lock = threading.Lock()
+
+    def pool_config(self, module_type: str) -> Dict[str, Any]:
+        return self.module_types.get(module_type, self.default)
+
+    def get_pool(self, module_type: str) -> Executor:
+        """返回模块类型对应的池 (首次使用时创建)"""
+        pool_config = self.pool_config(module_type)
+        kind = pool_config.get("kind", "thread")
+        max_workers = pool_config.get("max_workers", DEFAULT_POOL_CONFIG["max_workers"])
+        pool_name = f"{module_type}:{kind}" if module_type in self.module_types else f"default:{kind}"
+        with self._lock:
+            pool = self._pools.get(pool_name)
+            if pool is None:
+                if kind == "process":
+                    # fork 会复制已经运行着 uvicorn、httpx 连接池和调度线程的进程 (子进程中锁的状态不确定)，
+                    # 使用 spawn 启动干净的解释器
+                    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+                elif kind == "thread":
+                    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"module-{pool_name}")
+                else:
+                    raise ValueError(f"未知的执行池类型 '{kind}' (模块类型 '{module_type}')")
+                self._pools[pool_name] = pool
+            return pool
+
+    async def run(self, module_type: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在模块类型对应的池中运行 fn 并等待结果，事件循环在此期间可以继续处理其他请求。
+
+        进程池要求 fn 及其参数可以被 pickle (使用模块级函数)。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_pool(module_type), partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_module_executor: Optional[ModuleExecutor] = None
+_module_executor_lock = threading.Lock()
+
+
+def get_module_executor() -> ModuleExecutor:
+    """返回进程级共享的模块执行层"""
+    global _module_executor
+    if _module_executor is None:
+        with _module_executor_lock:
+            if _module_executor is None:
+                _module_executor = ModuleExecutor()
+    return _module_executor
+
+
+def shutdown_module_executor() -> None:
+    """关闭所有执行池 (应用关闭时调用)"""
+    global _module_executor
+    with _module_executor_lock:
+        executor, _module_executor = _module_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
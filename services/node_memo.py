@@ -0,0 +1,120 @@
+# services/node_memo.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from config import get_setting
+
+
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def node_fingerprint(node_type: str, config: Optional[Dict[str, Any]], inputs: Dict[str, Any],
+                     upstream_digests: Sequence[Tuple[str, str]]) -> str:
+    """
+    计算节点的 Merkle 指纹: (类型, 配置, 调用方提供的输入, [(上游节点 ID, 上游输出哈希)]) 的 SHA-256。
+
+    上游按连接顺序参与计算 (拼接 input_text 时的顺序)。使用上游 "输出" 的哈希而不是上游指纹，
+    上游重新执行但输出不变时，下游仍然可以命中。
+    """
+    payload = _canonical_json([node_type, config or {}, inputs, [list(pair) for pair in upstream_digests]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def output_digest(output: Any) -> str:
+    """节点输出的内容哈希 (参与下游节点的指纹计算)"""
+    return hashlib.sha256(_canonical_json(output).encode("utf-8")).hexdigest()
+
+
+class NodeOutputMemo:
+    """
+    节点输出的记忆化存储: 指纹 -> (输出, 输出哈希)。
+
+    按最近最少使用淘汰，同时限制条目数和序列化后的总字节数，超过 max_item_bytes 的输出不缓存。
+    """
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024,
+                 max_item_bytes: int = 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, fingerprint: str) -> Optional[Tuple[Any, str]]:
+        """命中时返回 (输出, 输出哈希)"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, fingerprint: str, output: Any) -> str:
+        """保存节点输出并返回其内容哈希 (输出过大时只计算哈希，不保存)"""
+        serialized = _canonical_json(output).encode("utf-8")
+        digest = hashlib.sha256(serialized).hexdigest()
+        size = len(serialized)
+        if size > self.max_item_bytes:
+            return digest
+        with self._lock:
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[fingerprint] = (output, digest, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return digest
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_node_memo: Optional[NodeOutputMemo] = None
+_node_memo_lock = threading.Lock()
+
+
+def is_node_memo_enabled() -> bool:
+    return bool(get_setting("workflow_engine.node_memo", {}).get("enabled", True))
+
+
+def get_node_memo() -> NodeOutputMemo:
+    """返回进程级共享的节点输出记忆化存储"""
+    global _node_memo
+    if _node_memo is None:
+        with _node_memo_lock:
+            if _node_memo is None:
+                settings = get_setting("workflow_engine.node_memo", {})
+                _node_memo = NodeOutputMemo(
+                    max_entries=settings.get("max_entries", 4096),
+                    max_bytes=settings.get("max_bytes", 64 * 1024 * 1024),
+                    max_item_bytes=settings.get("max_item_bytes", 1024 * 1024),
+                )
+    return _node_memo
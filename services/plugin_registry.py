@@ -0,0 +1,145 @@
+# services/plugin_registry.py
+import importlib
+import threading
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from config import get_setting
+
+# 第三方包通过该入口点组注册模块类型，例如 pyproject.toml 中:
+# [project.entry-points."aiflow.module_types"]
+# sentiment_analysis = "my_package.handlers:run_sentiment"
+# 入口点也可以指向一个字典 {"run": ..., "run_async": ..., "run_batch": ..., "stream": ...}
+ENTRY_POINT_GROUP = "aiflow.module_types"
+
+# 一个模块类型可以注册的处理函数:
+#   run(config, input_data) -> Any                         在执行层的线程池/进程池中同步运行 (必需)
+#   run_async(config, input_data, run_sync) -> Any          在事件循环中运行，run_sync 把输入交给执行层运行 run
+#   run_batch(config, inputs, run_one, run_each) -> list    整批运行，返回与 inputs 顺序一致的结果或异常
+#   stream(config, input_data, run_one) -> AsyncIterator    逐段产出文本
+HANDLER_KINDS = ("run", "run_async", "run_batch", "stream")
+
+BUILTIN_MODULE_TYPES: Dict[str, Union[str, Dict[str, str]]] = {
+    "text_generation": {
+        "run": "services.builtin_modules:run_text_generation",
+        "run_async": "services.builtin_modules:run_text_generation_async",
+        "run_batch": "services.builtin_modules:run_text_generation_batch",
+        "stream": "services.builtin_modules:stream_text_generation",
+    },
+    "image_classification": {
+        "run": "services.builtin_modules:run_image_classification",
+        "run_batch": "services.builtin_modules:run_image_classification_batch",
+    },
+    "data_processing": "services.builtin_modules:run_data_processing",
+}
+
+ModuleHandler = Callable[[Dict[str, Any], Dict[str, Any]], Any]
+
+
+def load_object(spec: str) -> Any:
+    """按 "package.module:attribute" 导入对象"""
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"无效的处理函数路径 '{spec}'，格式应为 'package.module:function'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def load_handler(spec: Any) -> Any:
+    """把处理函数、"module:function" 路径或入口点解析为对象"""
+    if hasattr(spec, "load"):
+        return spec.load()
+    if isinstance(spec, str):
+        return load_object(spec)
+    return spec
+
+
+def load_handlers(spec: Any) -> Dict[str, Callable]:
+    """把注册项解析为 {处理函数种类: 处理函数}，单个处理函数视为 run"""
+    loaded = load_handler(spec)
+    if not isinstance(loaded, dict):
+        loaded = {"run": loaded}
+    unknown = set(loaded) - set(HANDLER_KINDS)
+    if unknown:
+        raise ValueError(f"未知的处理函数种类 {sorted(unknown)}，可用的种类为 {list(HANDLER_KINDS)}")
+    if "run" not in loaded:
+        raise ValueError("模块类型必须注册 run 处理函数")
+    return {kind: load_handler(handler) for kind, handler in loaded.items()}
+
+
+class PluginRegistry:
+    """
+    模块类型注册表: 模块类型 -> 处理函数 (run，以及可选的 run_async / run_batch / stream)。
+
+    注册时只记录导入路径 (或入口点)，处理函数在该类型第一次运行时才导入并缓存，
+    之后的分发是一次字典查找。
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, Any] = {}
+        self._handlers: Dict[str, Dict[str, Callable]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, module_type: str, handler: Union[str, ModuleHandler, Dict[str, Any], Any]) -> None:
+        """
+        注册模块类型。handler 可以是处理函数、"module:function" 路径、入口点，
+        或按种类给出这些值的字典 {"run": ..., "run_async": ..., ...}
+        """
+        with self._lock:
+            self._handlers.pop(module_type, None)
+            self._specs[module_type] = handler
+
+    def resolve_handler(self, module_type: str, kind: str) -> Optional[Callable]:
+        """返回模块类型某一种类的处理函数，模块类型未注册或没有提供该种类时返回 None"""
+        handlers = self._handlers.get(module_type)
+        if handlers is None:
+            spec = self._specs.get(module_type)
+            if spec is None:
+                return None
+            with self._lock:
+                handlers = self._handlers.get(module_type)
+                if handlers is None:
+                    handlers = load_handlers(spec)
+                    self._handlers[module_type] = handlers
+        return handlers.get(kind)
+
+    def resolve(self, module_type: str) -> Optional[ModuleHandler]:
+        """返回模块类型的 run 处理函数，未注册时返回 None"""
+        return self.resolve_handler(module_type, "run")
+
+    def discover_entry_points(self, group: str = ENTRY_POINT_GROUP) -> List[str]:
+        """登记已安装包声明的入口点 (只读取元数据，不导入插件代码)"""
+        discovered = []
+        for entry_point in entry_points(group=group):
+            self.register(entry_point.name, entry_point)
+            discovered.append(entry_point.name)
+        return discovered
+
+    def module_types(self) -> List[str]:
+        return sorted(self._specs)
+
+    def is_loaded(self, module_type: str) -> bool:
+        return module_type in self._handlers
+
+
+_plugin_registry: Optional[PluginRegistry] = None
+_plugin_registry_lock = threading.Lock()
+
+
+def get_plugin_registry() -> PluginRegistry:
+    """
+    返回进程级共享的注册表: 内置模块类型 + plugins.module_types 配置的类型，
+    feature_flags.enable_plugin_system 开启时再加上已安装包的入口点。
+    """
+    global _plugin_registry
+    if _plugin_registry is None:
+        with _plugin_registry_lock:
+            if _plugin_registry is None:
+                registry = PluginRegistry()
+                for module_type, spec in BUILTIN_MODULE_TYPES.items():
+                    registry.register(module_type, spec)
+                if get_setting("feature_flags.enable_plugin_system", False):
+                    registry.discover_entry_points()
+                    for module_type, spec in get_setting("plugins.module_types", {}).items():
+                        registry.register(module_type, spec)
+                _plugin_registry = registry
+    return _plugin_registry
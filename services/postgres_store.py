@@ -0,0 +1,329 @@
+# services/postgres_store.py
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+from psycopg2 import sql
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from services.repository import ModelT, VersionConflictError
+
+# 表名 -> ((列名, PostgreSQL 类型), ...)，不含自增主键 id
+TABLE_COLUMNS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "workflows": (("name", "varchar"), ("description", "text"), ("steps", "text[]")),
+    "ai_modules": (("name", "varchar"), ("type", "varchar"), ("description", "text"), ("config", "jsonb")),
+}
+
+
+class PostgresConnectionPool:
+    """
+    有界的 PostgreSQL 连接池。
+
+    连接耗尽时调用方阻塞等待 (而不是像 ThreadedConnectionPool 那样直接抛出 PoolError)。
+    每个连接记录自己已经 PREPARE 过的语句，热点查询只在每个连接上解析一次。
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self._pool = ThreadedConnectionPool(min_size, max_size, dsn)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._prepared: Dict[int, set] = {}
+        self._prepared_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """借出一个连接，正常结束时提交事务，异常时回滚"""
+        self._slots.acquire()
+        conn = self._pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._reset_prepared(conn)
+            raise
+        finally:
+            self._pool.putconn(conn)
+            self._slots.release()
+
+    def _reset_prepared(self, conn: Any) -> None:
+        """事务出错后丢弃该连接上的预编译语句，下次使用时重新 PREPARE"""
+        with self._prepared_lock:
+            self._prepared.pop(conn.get_backend_pid(), None)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DEALLOCATE ALL")
+            conn.commit()
+        except Exception:
+            pass  # 连接已损坏时由连接池丢弃
+
+    def execute_prepared(self, cursor: Any, name: str, statement: str, params: Sequence[Any] = ()) -> None:
+        """在当前连接上执行预编译语句 (首次使用时 PREPARE)"""
+        conn_key = cursor.connection.get_backend_pid()
+        with self._prepared_lock:
+            prepared = self._prepared.setdefault(conn_key, set())
+            needs_prepare = name not in prepared
+        if needs_prepare:
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            with self._prepared_lock:
+                prepared.add(name)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+def _adapt(column_type: str, value: Any) -> Any:
+    """把 Python 值转换为 psycopg2 参数"""
+    if column_type == "jsonb" and value is not None:
+        return Json(value)
+    return value
+
+
+class PostgresRepository(Generic[ModelT]):
+    """
+    PostgreSQL 仓储，接口与 InMemoryRepository 一致。
+
+    单条读写使用预编译语句，批量写入使用 execute_values 一次往返完成。
+    """
+
+    def __init__(self, pool: PostgresConnectionPool, table: str, model_cls: Type[ModelT],
+                 indexed_fields: Iterable[str] = ()):
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"未知的数据表 '{table}'")
+        self.pool = pool
+        self.table = table
+        self.model_cls = model_cls
+        self.indexed_fields = tuple(indexed_fields)
+        self.columns = TABLE_COLUMNS[table]
+        self.column_names = [name for name, _ in self.columns]
+        column_list = ", ".join(["id"] + self.column_names)
+        placeholders = ", ".join(f"${i}::{column_type}" for i, (_, column_type) in enumerate(self.columns, start=1))
+        self._statements = {
+            "get": f"SELECT {column_list} FROM {table} WHERE id = $1",
+            "exists": f"SELECT 1 FROM {table} WHERE id = $1",
+            "insert": f"INSERT INTO {table} ({', '.join(self.column_names)}) VALUES ({placeholders}) RETURNING {column_list}",
+            "delete": f"DELETE FROM {table} WHERE id = $1",
+            "list": f"SELECT {column_list} FROM {table} ORDER BY id",
+            "count": f"SELECT count(*) AS count FROM {table}",
+        }
+        for field in self.indexed_fields:
+            self._statements[f"find_by_{field}"] = f"SELECT {column_list} FROM {table} WHERE {field} = $1 ORDER BY id"
+
+    def _execute(self, cursor: Any, statement: str, params: Sequence[Any] = ()) -> None:
+        self.pool.execute_prepared(cursor, f"{self.table}_{statement}", self._statements[statement], params)
+
+    def _to_model(self, row: Optional[Dict[str, Any]]) -> Optional[ModelT]:
+        if row is None:
+            return None
+        data = dict(row)
+        if "steps" in data and data["steps"] is None:
+            data["steps"] = []
+        if "config" in data and data["config"] is None:
+            data["config"] = {}
+        return self.model_cls(**data)
+
+    def _values(self, data: Dict[str, Any]) -> List[Any]:
+        return [_adapt(column_type, data.get(name)) for name, column_type in self.columns]
+
+    def create(self, data: Dict[str, Any]) -> ModelT:
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute(cursor, "insert", self._values(data))
+            return self._to_model(cursor.fetchone())
+
+    def get(self, item_id: int) -> Optional[ModelT]:
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute(cursor, "get", (item_id,))
+            return self._to_model(cursor.fetchone())
+
+    def exists(self, item_id: int) -> bool:
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, "exists", (item_id,))
+            return cursor.fetchone() is not None
+
+    def update(self, item_id: int, changes: Dict[str, Any]) -> Optional[ModelT]:
+        columns = [(name, column_type) for name, column_type in self.columns if name in changes]
+        if not columns:
+            return self.get(item_id)
+        query = sql.SQL("UPDATE {table} SET {assignments} WHERE id = %s RETURNING {columns}").format(
+            table=sql.Identifier(self.table),
+            assignments=sql.SQL(", ").join(
+                sql.SQL("{} = %s").format(sql.Identifier(name)) for name, _ in columns),
+            columns=sql.SQL(", ").join(map(sql.Identifier, ["id"] + self.column_names)),
+        )
+        params = [_adapt(column_type, changes[name]) for name, column_type in columns] + [item_id]
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            return self._to_model(cursor.fetchone())
+
+    def delete(self, item_id: int) -> bool:
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, "delete", (item_id,))
+            return cursor.rowcount > 0
+
+    def list(self) -> List[ModelT]:
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute(cursor, "list")
+            return [self._to_model(row) for row in cursor.fetchall()]
+
+    def find_by(self, field: str, value: Any) -> List[ModelT]:
+        if field not in self.indexed_fields:
+            raise ValueError(f"字段 '{field}' 没有建立索引")
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute(cursor, f"find_by_{field}", (value,))
+            return [self._to_model(row) for row in cursor.fetchall()]
+
+    def count(self) -> int:
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            self._execute(cursor, "count")
+            return cursor.fetchone()["count"]
+
+    def _filtered_select(self, filters: Dict[str, Any], after_id: Optional[int]) -> Tuple[Any, List[Any]]:
+        conditions = [sql.SQL("TRUE")]
+        params: List[Any] = []
+        if after_id is not None:
+            conditions.append(sql.SQL("id > %s"))
+            params.append(after_id)
+        for field, value in filters.items():
+            if field not in self.column_names:
+                raise ValueError(f"不支持按字段 '{field}' 过滤")
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(field)))
+            params.append(value)
+        query = sql.SQL("SELECT {columns} FROM {table} WHERE {conditions} ORDER BY id").format(
+            columns=sql.SQL(", ").join(map(sql.Identifier, ["id"] + self.column_names)),
+            table=sql.Identifier(self.table),
+            conditions=sql.SQL(" AND ").join(conditions),
+        )
+        return query, params
+
+    def page(self, after_id: Optional[int] = None, limit: int = 100,
+             filters: Optional[Dict[str, Any]] = None) -> List[ModelT]:
+        """按 id 升序返回 after_id 之后的至多 limit 条记录 (主键索引上的 keyset 分页)"""
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+        query, params = self._filtered_select(filters, after_id)
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query + sql.SQL(" LIMIT %s"), params + [limit])
+            return [self._to_model(row) for row in cursor.fetchall()]
+
+    def iter_all(self, batch_size: int = 500, filters: Optional[Dict[str, Any]] = None) -> Iterator[ModelT]:
+        """通过服务端游标分批读取全部记录，内存占用与总记录数无关"""
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+        query, params = self._filtered_select(filters, None)
+        with self.pool.connection() as conn:
+            with conn.cursor(name=f"{self.table}_export", cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield self._to_model(row)
+
+    def bulk_create(self, records: Iterable[Dict[str, Any]]) -> List[ModelT]:
+        """一次往返批量插入"""
+        rows = [self._values(data) for data in records]
+        if not rows:
+            return []
+        template = "(" + ", ".join(f"%s::{column_type}" for _, column_type in self.columns) + ")"
+        query = (f"INSERT INTO {self.table} ({', '.join(self.column_names)}) VALUES %s "
+                 f"RETURNING {', '.join(['id'] + self.column_names)}")
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            created = execute_values(cursor, query, rows, template=template, fetch=True)
+            return [self._to_model(row) for row in created]
+
+    def bulk_update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> List[ModelT]:
+        """
+        一次往返批量更新 (UPDATE ... FROM (VALUES ...))。
+
+        未在 changes 中出现的列保持原值。
+        """
+        if not changes_by_id:
+            return []
+        rows = []
+        for item_id, changes in changes_by_id.items():
+            row = [item_id]
+            for name, column_type in self.columns:
+                row += [name in changes, _adapt(column_type, changes.get(name))]
+            rows.append(row)
+        template = "(%s::integer, " + ", ".join(
+            f"%s::boolean, %s::{column_type}" for _, column_type in self.columns) + ")"
+        value_columns = ", ".join(["id"] + [f"set_{name}, {name}" for name in self.column_names])
+        assignments = ", ".join(
+            f"{name} = CASE WHEN v.set_{name} THEN v.{name} ELSE t.{name} END" for name in self.column_names)
+        query = (f"UPDATE {self.table} AS t SET {assignments} FROM (VALUES %s) AS v ({value_columns}) "
+                 f"WHERE t.id = v.id RETURNING {', '.join('t.' + name for name in ['id'] + self.column_names)}")
+        with self.pool.connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            updated = execute_values(cursor, query, rows, template=template, fetch=True)
+            return [self._to_model(row) for row in updated]
+
+
+class PostgresDocumentStore(Generic[ModelT]):
+    """
+    PostgreSQL 文档存储: 整份文档以 JSONB 保存在 workflow_data 表中。
+
+    version 列在每次写入时加 1，带 expected_version 的写入只在版本匹配时生效。
+    """
+
+    _statements = {
+        "get": "SELECT data, version FROM workflow_data WHERE workflow_id = $1",
+        "put": ("INSERT INTO workflow_data (workflow_id, data) VALUES ($1, $2::jsonb) "
+                "ON CONFLICT (workflow_id) DO UPDATE SET data = EXCLUDED.data, "
+                "version = workflow_data.version + 1, updated_at = now() RETURNING version"),
+        "put_if_version": ("UPDATE workflow_data SET data = $2::jsonb, version = version + 1, updated_at = now() "
+                           "WHERE workflow_id = $1 AND version = $3 RETURNING version"),
+        "insert_if_absent": ("INSERT INTO workflow_data (workflow_id, data) VALUES ($1, $2::jsonb) "
+                             "ON CONFLICT (workflow_id) DO NOTHING RETURNING version"),
+        "version": "SELECT version FROM workflow_data WHERE workflow_id = $1",
+        "delete": "DELETE FROM workflow_data WHERE workflow_id = $1",
+    }
+
+    def __init__(self, pool: PostgresConnectionPool, model_cls: Type[ModelT]):
+        self.pool = pool
+        self.model_cls = model_cls
+
+    def _execute(self, cursor: Any, statement: str, params: Sequence[Any]) -> None:
+        self.pool.execute_prepared(cursor, f"workflow_data_{statement}", self._statements[statement], params)
+
+    def get(self, document_id: int) -> Optional[ModelT]:
+        versioned = self.get_versioned(document_id)
+        return versioned[0] if versioned else None
+
+    def get_versioned(self, document_id: int) -> Optional[Tuple[ModelT, int]]:
+        """返回 (文档, 版本号)，不存在时返回 None"""
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, "get", (document_id,))
+            row = cursor.fetchone()
+            return (self.model_cls(**row[0]), row[1]) if row else None
+
+    def put(self, document_id: int, document: ModelT, expected_version: Optional[int] = None) -> int:
+        """写入文档并返回新的版本号，版本不匹配时抛出 VersionConflictError"""
+        data = Json(document.dict())
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            if expected_version is None:
+                self._execute(cursor, "put", (document_id, data))
+            elif expected_version == 0:
+                self._execute(cursor, "insert_if_absent", (document_id, data))
+            else:
+                self._execute(cursor, "put_if_version", (document_id, data, expected_version))
+            row = cursor.fetchone()
+            if row is None:
+                self._execute(cursor, "version", (document_id,))
+                current = cursor.fetchone()
+                raise VersionConflictError(document_id, expected_version, current[0] if current else 0)
+            return row[0]
+
+    def bulk_put(self, documents: Dict[int, ModelT]) -> None:
+        """一次往返批量写入多份文档"""
+        if not documents:
+            return
+        rows = [(document_id, Json(document.dict())) for document_id, document in documents.items()]
+        query = ("INSERT INTO workflow_data (workflow_id, data) VALUES %s "
+                 "ON CONFLICT (workflow_id) DO UPDATE SET data = EXCLUDED.data, "
+                 "version = workflow_data.version + 1, updated_at = now()")
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            execute_values(cursor, query, rows, template="(%s, %s::jsonb)")
+
+    def delete(self, document_id: int) -> bool:
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            self._execute(cursor, "delete", (document_id,))
+            return cursor.rowcount > 0
@@ -0,0 +1,228 @@
+# services/redis_store.py
+import json
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, Type
+
+from services.repository import ModelT, VersionConflictError
+
+# 带版本检查的文档写入: ARGV[2] 为空表示不检查版本，"0" 表示期望文档尚不存在
+_PUT_DOCUMENT_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+local visible = current
+if redis.call('HEXISTS', KEYS[1], 'data') == 0 then
+    visible = 0
+end
+if ARGV[2] ~= '' and tonumber(ARGV[2]) ~= visible then
+    return {0, visible}
+end
+redis.call('HSET', KEYS[1], 'version', current + 1, 'data', ARGV[1])
+return {1, current + 1}
+"""
+
+
+class RedisRepository(Generic[ModelT]):
+    """
+    Redis 仓储，接口与 InMemoryRepository 一致，多个进程/实例共享同一份数据。
+
+    键布局 (prefix 默认为 "aiflow:"):
+        {prefix}{table}:seq                    INCR 原子分配 id
+        {prefix}{table}:items                  HASH  id -> 记录 JSON
+        {prefix}{table}:ids                    ZSET  以 id 为分数，用于按 id 排序的游标分页
+        {prefix}{table}:idx:{field}:{value}    ZSET  二级索引
+
+    更新和删除使用 WATCH 乐观事务，保证记录与索引一起变更。
+    """
+
+    def __init__(self, client: Any, table: str, model_cls: Type[ModelT], indexed_fields: Iterable[str] = (),
+                 key_prefix: str = "aiflow:"):
+        self.client = client
+        self.table = table
+        self.model_cls = model_cls
+        self.indexed_fields = tuple(indexed_fields)
+        self._prefix = f"{key_prefix}{table}:"
+        self._seq_key = self._prefix + "seq"
+        self._items_key = self._prefix + "items"
+        self._ids_key = self._prefix + "ids"
+
+    def _index_key(self, field: str, value: Any) -> str:
+        return f"{self._prefix}idx:{field}:{value}"
+
+    def _to_model(self, raw: Optional[bytes]) -> Optional[ModelT]:
+        return self.model_cls.parse_raw(raw) if raw is not None else None
+
+    def _write(self, pipe: Any, item: ModelT, previous: Optional[ModelT] = None) -> None:
+        """在事务中写入记录并维护索引"""
+        if previous is not None:
+            for field in self.indexed_fields:
+                pipe.zrem(self._index_key(field, getattr(previous, field)), previous.id)
+        pipe.hset(self._items_key, item.id, item.json())
+        pipe.zadd(self._ids_key, {item.id: item.id})
+        for field in self.indexed_fields:
+            pipe.zadd(self._index_key(field, getattr(item, field)), {item.id: item.id})
+
+    def allocate_id(self) -> int:
+        """分配一个新的 id (所有进程共享同一个计数器)"""
+        return int(self.client.incr(self._seq_key))
+
+    def create(self, data: Dict[str, Any]) -> ModelT:
+        """分配 id 并保存新记录"""
+        return self.bulk_create([data])[0]
+
+    def get(self, item_id: int) -> Optional[ModelT]:
+        return self._to_model(self.client.hget(self._items_key, item_id))
+
+    def exists(self, item_id: int) -> bool:
+        return bool(self.client.hexists(self._items_key, item_id))
+
+    def update(self, item_id: int, changes: Dict[str, Any]) -> Optional[ModelT]:
+        """合并字段修改并重建索引，记录不存在时返回 None"""
+        def apply(pipe: Any) -> Optional[ModelT]:
+            current = self._to_model(pipe.hget(self._items_key, item_id))
+            if current is None:
+                return None
+            updated = self.model_cls(**{**current.dict(), **changes, "id": item_id})
+            pipe.multi()
+            self._write(pipe, updated, previous=current)
+            return updated
+
+        return self.client.transaction(apply, self._items_key, value_from_callable=True)
+
+    def delete(self, item_id: int) -> bool:
+        def apply(pipe: Any) -> bool:
+            current = self._to_model(pipe.hget(self._items_key, item_id))
+            if current is None:
+                return False
+            pipe.multi()
+            pipe.hdel(self._items_key, item_id)
+            pipe.zrem(self._ids_key, item_id)
+            for field in self.indexed_fields:
+                pipe.zrem(self._index_key(field, getattr(current, field)), item_id)
+            return True
+
+        return self.client.transaction(apply, self._items_key, value_from_callable=True)
+
+    def list(self) -> List[ModelT]:
+        return list(self.iter_all())
+
+    def find_by(self, field: str, value: Any) -> List[ModelT]:
+        """按二级索引字段查询"""
+        if field not in self.indexed_fields:
+            raise ValueError(f"字段 '{field}' 没有建立索引")
+        ids = self.client.zrange(self._index_key(field, value), 0, -1)
+        return self._get_many(ids)
+
+    def count(self) -> int:
+        return int(self.client.hlen(self._items_key))
+
+    def _get_many(self, ids: List[Any]) -> List[ModelT]:
+        if not ids:
+            return []
+        return [item for item in map(self._to_model, self.client.hmget(self._items_key, ids)) if item is not None]
+
+    def page(self, after_id: Optional[int] = None, limit: int = 100,
+             filters: Optional[Dict[str, Any]] = None) -> List[ModelT]:
+        """
+        按 id 升序返回 after_id 之后的至多 limit 条记录。
+
+        过滤条件中的索引字段通过索引 ZSET 定位，其余字段取回后逐条比较。
+        """
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+        indexed = [field for field in filters if field in self.indexed_fields]
+        key = self._index_key(indexed[0], filters[indexed[0]]) if indexed else self._ids_key
+        result: List[ModelT] = []
+        lower = f"({after_id}" if after_id is not None else "-inf"
+        while len(result) < limit:
+            ids = self.client.zrangebyscore(key, lower, "+inf", start=0, num=limit)
+            if not ids:
+                break
+            for item in self._get_many(ids):
+                if all(getattr(item, field) == value for field, value in filters.items()):
+                    result.append(item)
+                    if len(result) >= limit:
+                        break
+            if len(ids) < limit:
+                break
+            lower = f"({int(ids[-1])}"
+        return result
+
+    def iter_all(self, batch_size: int = 500, filters: Optional[Dict[str, Any]] = None) -> Iterator[ModelT]:
+        """分批遍历全部记录"""
+        after_id = None
+        while True:
+            batch = self.page(after_id, batch_size, filters)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after_id = batch[-1].id
+
+    def bulk_create(self, records: Iterable[Dict[str, Any]]) -> List[ModelT]:
+        """一次 INCRBY 分配一段连续 id，再用一个事务写入全部记录"""
+        records = list(records)
+        if not records:
+            return []
+        last_id = int(self.client.incrby(self._seq_key, len(records)))
+        items = [self.model_cls(id=item_id, **data)
+                 for item_id, data in zip(range(last_id - len(records) + 1, last_id + 1), records)]
+        with self.client.pipeline(transaction=True) as pipe:
+            for item in items:
+                self._write(pipe, item)
+            pipe.execute()
+        return items
+
+    def bulk_update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> List[ModelT]:
+        """批量更新记录，返回实际更新的记录 (不存在的 id 被忽略)"""
+        updated = (self.update(item_id, changes) for item_id, changes in changes_by_id.items())
+        return [item for item in updated if item is not None]
+
+    def clear(self) -> None:
+        keys = [self._items_key, self._ids_key, self._seq_key]
+        keys.extend(self.client.scan_iter(match=self._prefix + "idx:*"))
+        self.client.delete(*keys)
+
+
+class RedisDocumentStore(Generic[ModelT]):
+    """
+    Redis 文档存储: 每份文档保存在 {prefix}workflow_data:{id} 哈希中 (version, data)。
+
+    带 expected_version 的写入由 Lua 脚本原子地比较并设置版本号。
+    删除只移除 data 字段并保留 version，重新创建的文档从删除前的版本继续递增 (ETag 不会重复)。
+    """
+
+    def __init__(self, client: Any, model_cls: Type[ModelT], key_prefix: str = "aiflow:"):
+        self.client = client
+        self.model_cls = model_cls
+        self._prefix = f"{key_prefix}workflow_data:"
+        self._put_script = client.register_script(_PUT_DOCUMENT_SCRIPT)
+
+    def _key(self, document_id: int) -> str:
+        return f"{self._prefix}{document_id}"
+
+    def get(self, document_id: int) -> Optional[ModelT]:
+        versioned = self.get_versioned(document_id)
+        return versioned[0] if versioned else None
+
+    def get_versioned(self, document_id: int) -> Optional[Tuple[ModelT, int]]:
+        """返回 (文档, 版本号)，不存在时返回 None"""
+        version, data = self.client.hmget(self._key(document_id), "version", "data")
+        if data is None:
+            return None
+        return self.model_cls(**json.loads(data)), int(version)
+
+    def put(self, document_id: int, document: ModelT, expected_version: Optional[int] = None) -> int:
+        """写入文档并返回新的版本号，版本不匹配时抛出 VersionConflictError"""
+        expected = "" if expected_version is None else str(expected_version)
+        applied, version = self._put_script(keys=[self._key(document_id)], args=[document.json(), expected])
+        if not applied:
+            raise VersionConflictError(document_id, expected_version, int(version))
+        return int(version)
+
+    def bulk_put(self, documents: Dict[int, ModelT]) -> None:
+        """一次往返批量写入多份文档"""
+        if not documents:
+            return
+        with self.client.pipeline(transaction=False) as pipe:
+            for document_id, document in documents.items():
+                self._put_script(keys=[self._key(document_id)], args=[document.json(), ""], client=pipe)
+            pipe.execute()
+
+    def delete(self, document_id: int) -> bool:
+        return bool(self.client.hdel(self._key(document_id), "data"))
@@ -0,0 +1,233 @@
+# services/repository.py
+import bisect
+import itertools
+import threading
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class InMemoryRepository(Generic[ModelT]):
+    """
+    内存仓储: 以 id 为键的哈希索引 + 可选的二级索引 (字段值 -> 升序 id 列表)。
+
+    get/update/delete 均为 O(1) (二级索引的维护与该字段值下的记录数成正比)，按索引字段查询只访问匹配的记录。
+    游标分页在有序的 id 列表上二分定位后直接切片，不需要排序。
+    所有操作在同一把锁内完成，id 分配是线程安全的。
+    """
+
+    def __init__(self, model_cls: Type[ModelT], indexed_fields: Iterable[str] = ()):
+        self.model_cls = model_cls
+        self.indexed_fields = tuple(indexed_fields)
+        self._items: Dict[int, ModelT] = {}
+        # 字段名 -> 字段值 -> 升序 id 列表 (插入时保持有序，分页时可以直接二分定位)
+        self._indexes: Dict[str, Dict[Any, List[int]]] = {field: {} for field in self.indexed_fields}
+        self._id_counter = itertools.count(1)
+        # 升序 id 列表，用于游标分页时二分定位。删除时只记录墓碑数 (已删除的 id 暂时留在列表中，
+        # 读取时跳过)，墓碑超过一半时再整体压缩，避免每次删除都移动整个列表
+        self._ordered_ids: List[int] = []
+        self._tombstones = 0
+        self._lock = threading.RLock()
+
+    def allocate_id(self) -> int:
+        """分配一个新的 id"""
+        with self._lock:
+            return next(self._id_counter)
+
+    def _index(self, item: ModelT) -> None:
+        for field, index in self._indexes.items():
+            ids = index.setdefault(getattr(item, field), [])
+            if not ids or ids[-1] < item.id:
+                ids.append(item.id)  # 新记录的 id 最大，直接追加
+            else:
+                bisect.insort(ids, item.id)
+
+    def _unindex(self, item: ModelT) -> None:
+        for field, index in self._indexes.items():
+            value = getattr(item, field)
+            ids = index.get(value)
+            if ids is not None:
+                position = bisect.bisect_left(ids, item.id)
+                if position < len(ids) and ids[position] == item.id:
+                    del ids[position]
+                if not ids:
+                    del index[value]
+
+    def create(self, data: Dict[str, Any]) -> ModelT:
+        """分配 id 并保存新记录"""
+        with self._lock:
+            item = self.model_cls(id=self.allocate_id(), **data)
+            self._items[item.id] = item
+            self._ordered_ids.append(item.id)  # id 单调递增，追加后仍然有序
+            self._index(item)
+            return item
+
+    def get(self, item_id: int) -> Optional[ModelT]:
+        return self._items.get(item_id)
+
+    def exists(self, item_id: int) -> bool:
+        return item_id in self._items
+
+    def update(self, item_id: int, changes: Dict[str, Any]) -> Optional[ModelT]:
+        """合并字段修改并重建索引，记录不存在时返回 None"""
+        with self._lock:
+            current = self._items.get(item_id)
+            if current is None:
+                return None
+            updated = self.model_cls(**{**current.dict(), **changes, "id": item_id})
+            self._unindex(current)
+            self._items[item_id] = updated
+            self._index(updated)
+            return updated
+
+    def delete(self, item_id: int) -> bool:
+        with self._lock:
+            item = self._items.pop(item_id, None)
+            if item is None:
+                return False
+            self._unindex(item)
+            self._tombstones += 1
+            if self._tombstones > len(self._ordered_ids) // 2:
+                self._compact()
+            return True
+
+    def _compact(self) -> None:
+        """从有序 id 列表中移除已删除的 id"""
+        self._ordered_ids = [item_id for item_id in self._ordered_ids if item_id in self._items]
+        self._tombstones = 0
+
+    def list(self) -> List[ModelT]:
+        with self._lock:
+            return list(self._items.values())
+
+    def find_by(self, field: str, value: Any) -> List[ModelT]:
+        """按二级索引字段查询"""
+        if field not in self._indexes:
+            raise ValueError(f"字段 '{field}' 没有建立索引")
+        with self._lock:
+            return [self._items[item_id] for item_id in self._indexes[field].get(value, {})]
+
+    def count(self) -> int:
+        return len(self._items)
+
+    def page(self, after_id: Optional[int] = None, limit: int = 100,
+             filters: Optional[Dict[str, Any]] = None) -> List[ModelT]:
+        """
+        按 id 升序返回 after_id 之后的至多 limit 条记录。
+
+        过滤条件中的索引字段通过二级索引定位，其余字段逐条比较。
+        """
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+        indexed = [field for field in filters if field in self._indexes]
+        with self._lock:
+            if indexed:
+                candidates = self._indexes[indexed[0]].get(filters[indexed[0]], [])
+            else:
+                candidates = self._ordered_ids
+            position = bisect.bisect_right(candidates, after_id) if after_id is not None else 0
+            result: List[ModelT] = []
+            # 按页大小切片扫描: 没有墓碑和非索引过滤条件时一次切片即可
+            while len(result) < limit and position < len(candidates):
+                chunk = candidates[position:position + limit]
+                position += len(chunk)
+                for item_id in chunk:
+                    item = self._items.get(item_id)
+                    if item is not None and all(getattr(item, field) == value for field, value in filters.items()):
+                        result.append(item)
+                        if len(result) >= limit:
+                            break
+            return result
+
+    def iter_all(self, batch_size: int = 500, filters: Optional[Dict[str, Any]] = None) -> Iterator[ModelT]:
+        """分批遍历全部记录，每批单独加锁，不会一次性复制整个仓储"""
+        after_id = None
+        while True:
+            batch = self.page(after_id, batch_size, filters)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after_id = batch[-1].id
+
+    def bulk_create(self, records: Iterable[Dict[str, Any]]) -> List[ModelT]:
+        """批量创建记录"""
+        with self._lock:
+            return [self.create(data) for data in records]
+
+    def bulk_update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> List[ModelT]:
+        """批量更新记录，返回实际更新的记录 (不存在的 id 被忽略)"""
+        with self._lock:
+            updated = (self.update(item_id, changes) for item_id, changes in changes_by_id.items())
+            return [item for item in updated if item is not None]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._ordered_ids.clear()
+            self._tombstones = 0
+            for index in self._indexes.values():
+                index.clear()
+
+
+class VersionConflictError(Exception):
+    """乐观并发冲突: 文档已被其他请求修改"""
+
+    def __init__(self, document_id: int, expected_version: int, current_version: int):
+        self.document_id = document_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(f"文档 {document_id} 的版本为 {current_version}，与期望的版本 {expected_version} 不一致")
+
+
+class InMemoryDocumentStore(Generic[ModelT]):
+    """
+    内存文档存储: 以 id 为键保存整份文档 (例如画布数据 WorkflowData)。
+
+    每次写入版本号加 1 (从 1 开始)，写入时可以指定 expected_version 做乐观并发控制
+    (0 表示期望文档尚不存在)。删除后版本号不会重置: 重新创建的文档从删除前的版本继续递增，
+    持有删除前 ETag 的客户端不会得到错误的 304 或 If-Match 成功。
+    """
+
+    def __init__(self, model_cls: Type[ModelT]):
+        self.model_cls = model_cls
+        self._documents: Dict[int, Tuple[int, ModelT]] = {}
+        # 已删除文档的最后版本号
+        self._deleted_versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, document_id: int) -> Optional[ModelT]:
+        entry = self._documents.get(document_id)
+        return entry[1] if entry else None
+
+    def get_versioned(self, document_id: int) -> Optional[Tuple[ModelT, int]]:
+        """返回 (文档, 版本号)，不存在时返回 None"""
+        entry = self._documents.get(document_id)
+        return (entry[1], entry[0]) if entry else None
+
+    def _next_version(self, document_id: int) -> int:
+        entry = self._documents.get(document_id)
+        return (entry[0] if entry else self._deleted_versions.pop(document_id, 0)) + 1
+
+    def put(self, document_id: int, document: ModelT, expected_version: Optional[int] = None) -> int:
+        """写入文档并返回新的版本号，版本不匹配时抛出 VersionConflictError"""
+        with self._lock:
+            current_version = self._documents.get(document_id, (0, None))[0]
+            if expected_version is not None and expected_version != current_version:
+                raise VersionConflictError(document_id, expected_version, current_version)
+            version = self._next_version(document_id)
+            self._documents[document_id] = (version, document)
+            return version
+
+    def bulk_put(self, documents: Dict[int, ModelT]) -> None:
+        with self._lock:
+            for document_id, document in documents.items():
+                self._documents[document_id] = (self._next_version(document_id), document)
+
+    def delete(self, document_id: int) -> bool:
+        with self._lock:
+            entry = self._documents.pop(document_id, None)
+            if entry is None:
+                return False
+            self._deleted_versions[document_id] = entry[0]
+            return True
@@ -0,0 +1,199 @@
+# services/result_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import get_setting
+
+DEFAULT_TTL_SECONDS: Dict[str, int] = {
+    "text_generation": 3600,
+    "image_classification": 86400,
+    "data_processing": 3600,
+}
+
+
+def canonical_key(module_id: Any, module_type: str, config: Optional[Dict[str, Any]], input_data: Dict[str, Any]) -> str:
+    """
+    计算模块运行的规范化缓存键: (模块 ID, 模块类型, 配置, 输入) 的 SHA-256。
+
+    字典按键排序后序列化，字段顺序不同但内容相同的请求得到同一个键。
+    """
+    payload = json.dumps([module_id, module_type, config or {}, input_data],
+                         sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def result_ttl(module_type: str, config: Optional[Dict[str, Any]],
+               ttl_seconds: Optional[Dict[str, int]] = None) -> int:
+    """
+    返回模块运行结果可以复用的时长 (秒)，0 表示结果不确定 (temperature 不为 0 的 OpenAI 生成) 或该类型不缓存。
+
+    结果缓存和工作流节点记忆共用这条规则。ttl_seconds 默认读取 result_cache.ttl_seconds。
+    """
+    config = config or {}
+    if config.get("backend") == "openai" and config.get("temperature", 0.7) != 0:
+        return 0
+    if ttl_seconds is None:
+        ttl_seconds = get_setting("result_cache.ttl_seconds", DEFAULT_TTL_SECONDS)
+    return int(ttl_seconds.get(module_type, 0))
+
+
+class LRUCache:
+    """带 TTL 的进程内 LRU 缓存 (线程安全)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResultCache:
+    """
+    模块运行结果缓存: 进程内 L1 (LRU) + Redis L2。
+
+    只缓存确定性的运行 (按模块类型配置 TTL，OpenAI 后端只在 temperature 为 0 时缓存)。
+    Redis 不可用时自动退化为仅使用 L1。
+    """
+
+    def __init__(self, ttl_seconds: Optional[Dict[str, int]] = None, l1_max_entries: int = 1024,
+                 max_item_bytes: int = 256 * 1024, redis_url: Optional[str] = None, key_prefix: str = "aiflow:result:"):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else DEFAULT_TTL_SECONDS
+        self.max_item_bytes = max_item_bytes
+        self.key_prefix = key_prefix
+        self.l1 = LRUCache(l1_max_entries)
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis_asyncio
+            self._redis = redis_asyncio.from_url(redis_url)
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.skipped_oversize = 0
+        self.l2_errors = 0
+
+    def ttl_for(self, module_type: str, config: Optional[Dict[str, Any]]) -> int:
+        """返回该次运行的缓存 TTL，0 表示不可缓存"""
+        return result_ttl(module_type, config, self.ttl_seconds)
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        found, value = self.l1.get(key)
+        if found:
+            self.l1_hits += 1
+            return True, value
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.get(self.key_prefix + key)
+                    pipe.ttl(self.key_prefix + key)
+                    raw, ttl = await pipe.execute()
+            except Exception as e:
+                self.l2_errors += 1
+                print(f"Error reading result cache from Redis: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                if ttl > 0:
+                    self.l1.set(key, value, ttl)
+                self.l2_hits += 1
+                return True, value
+        self.misses += 1
+        return False, None
+
+    async def set(self, key: str, value: Any, ttl_seconds: int) -> bool:
+        """写入两级缓存，超过 max_item_bytes 的结果不缓存"""
+        raw = json.dumps(value, ensure_ascii=False, default=str)
+        if len(raw.encode("utf-8")) > self.max_item_bytes:
+            self.skipped_oversize += 1
+            return False
+        self.l1.set(key, value, ttl_seconds)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.key_prefix + key, raw, ex=ttl_seconds)
+            except Exception as e:
+                self.l2_errors += 1
+                print(f"Error writing result cache to Redis: {e}")
+        return True
+
+    def record_bypass(self) -> None:
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "skipped_oversize": self.skipped_oversize,
+            "l2_errors": self.l2_errors,
+            "hit_ratio": (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+            "l1_hit_ratio": self.l1_hits / lookups if lookups else 0.0,
+            "l1_entries": len(self.l1),
+            "l2_enabled": self._redis is not None,
+        }
+
+    async def aclose(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def is_result_cache_enabled() -> bool:
+    return bool(get_setting("result_cache.enabled", False))
+
+
+def get_result_cache() -> ResultCache:
+    """返回进程级共享的结果缓存 (Redis 地址来自 result_cache.redis_url 或 REDIS_URL 环境变量)"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            ttl_seconds=get_setting("result_cache.ttl_seconds", DEFAULT_TTL_SECONDS),
+            l1_max_entries=get_setting("result_cache.l1_max_entries", 1024),
+            max_item_bytes=get_setting("result_cache.max_item_bytes", 256 * 1024),
+            redis_url=get_setting("result_cache.redis_url") or os.environ.get("REDIS_URL"),
+        )
+    return _result_cache
+
+
+async def close_result_cache() -> None:
+    global _result_cache
+    if _result_cache is not None:
+        cache, _result_cache = _result_cache, None
+        await cache.aclose()
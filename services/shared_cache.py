@@ -0,0 +1,166 @@
+# services/shared_cache.py
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.result_cache import LRUCache
+
+
+class InvalidationBus:
+    """
+    跨进程缓存失效通知: 通过 Redis pub/sub 广播 "命名空间 + 键"，每个进程在后台线程中接收并清除本地缓存。
+
+    pub/sub 不保证送达 (断线期间的消息会丢失)，因此本地缓存仍需设置较短的 TTL 作为兜底。
+    """
+
+    def __init__(self, client: Any, channel: str = "aiflow:invalidate"):
+        self.client = client
+        self.channel = channel
+        self.sender_id = uuid.uuid4().hex
+        self._handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{channel: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def register(self, namespace: str, handler: Callable[[Optional[str]], None]) -> None:
+        """注册命名空间的失效回调，回调参数为失效的键 (None 表示整个命名空间)"""
+        self._handlers[namespace] = handler
+
+    def publish(self, namespace: str, key: Optional[str] = None) -> None:
+        try:
+            self.client.publish(self.channel, f"{self.sender_id}|{namespace}|{'' if key is None else key}")
+        except Exception as e:
+            print(f"Error publishing cache invalidation: {e}")
+
+    def _on_message(self, message: Dict[str, Any]) -> None:
+        data = message["data"]
+        sender, namespace, key = (data.decode() if isinstance(data, bytes) else data).split("|", 2)
+        handler = self._handlers.get(namespace)
+        # 本进程发出的消息在写入时已经清除过本地缓存
+        if handler is not None and sender != self.sender_id:
+            handler(key or None)
+
+    def close(self) -> None:
+        self._thread.stop()
+        self._pubsub.close()
+
+
+class _LocalReadCache:
+    """
+    本地读缓存的公共部分: 失效时递增代数，读取期间发生过失效的结果不写入缓存，
+    避免并发的 "读到旧值 -> 收到失效 -> 写入旧值" 把过期数据留在缓存里。
+    """
+
+    def __init__(self, namespace: str, bus: Optional[InvalidationBus], max_entries: int, ttl_seconds: float):
+        self.namespace = namespace
+        self.bus = bus
+        self.ttl_seconds = ttl_seconds
+        self._cache = LRUCache(max_entries)
+        self._generation = 0
+        self._lock = threading.Lock()
+        if bus is not None:
+            bus.register(namespace, self._evict)
+
+    def _evict(self, key: Optional[str]) -> None:
+        with self._lock:
+            self._generation += 1
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.delete(key)
+
+    def _invalidate(self, key: Optional[Any] = None) -> None:
+        """清除本进程缓存并通知其他进程"""
+        key = None if key is None else str(key)
+        self._evict(key)
+        if self.bus is not None:
+            self.bus.publish(self.namespace, key)
+
+    def _cached(self, key: Any, load: Callable[[], Any]) -> Any:
+        hit, value = self._cache.get(str(key))
+        if hit:
+            return value
+        with self._lock:
+            generation = self._generation
+        value = load()
+        with self._lock:
+            if generation == self._generation and value is not None:
+                self._cache.set(str(key), value, self.ttl_seconds)
+        return value
+
+
+class CachedRepository(_LocalReadCache):
+    """
+    在共享仓储 (postgresql / redis) 前面加一层进程内读缓存，只缓存按 id 的 get()。
+
+    写操作透传给底层仓储后清除对应的键并广播失效；列表、分页等查询直接访问底层仓储。
+    """
+
+    def __init__(self, inner: Any, namespace: str, bus: Optional[InvalidationBus] = None,
+                 max_entries: int = 10000, ttl_seconds: float = 30):
+        super().__init__(namespace, bus, max_entries, ttl_seconds)
+        self.inner = inner
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    def get(self, item_id: int) -> Optional[Any]:
+        return self._cached(item_id, lambda: self.inner.get(item_id))
+
+    def update(self, item_id: int, changes: Dict[str, Any]) -> Optional[Any]:
+        try:
+            return self.inner.update(item_id, changes)
+        finally:
+            self._invalidate(item_id)
+
+    def delete(self, item_id: int) -> bool:
+        try:
+            return self.inner.delete(item_id)
+        finally:
+            self._invalidate(item_id)
+
+    def bulk_update(self, changes_by_id: Dict[int, Dict[str, Any]]) -> List[Any]:
+        try:
+            return self.inner.bulk_update(changes_by_id)
+        finally:
+            self._invalidate()
+
+    def clear(self) -> None:
+        try:
+            self.inner.clear()
+        finally:
+            self._invalidate()
+
+
+class CachedDocumentStore(_LocalReadCache):
+    """文档存储的进程内读缓存，缓存 (文档, 版本号)，写入后清除并广播失效"""
+
+    def __init__(self, inner: Any, namespace: str, bus: Optional[InvalidationBus] = None,
+                 max_entries: int = 1000, ttl_seconds: float = 30):
+        super().__init__(namespace, bus, max_entries, ttl_seconds)
+        self.inner = inner
+
+    def get(self, document_id: int) -> Optional[Any]:
+        versioned = self.get_versioned(document_id)
+        return versioned[0] if versioned else None
+
+    def get_versioned(self, document_id: int) -> Optional[Tuple[Any, int]]:
+        return self._cached(document_id, lambda: self.inner.get_versioned(document_id))
+
+    def put(self, document_id: int, document: Any, expected_version: Optional[int] = None) -> int:
+        try:
+            return self.inner.put(document_id, document, expected_version)
+        finally:
+            self._invalidate(document_id)
+
+    def bulk_put(self, documents: Dict[int, Any]) -> None:
+        try:
+            self.inner.bulk_put(documents)
+        finally:
+            self._invalidate()
+
+    def delete(self, document_id: int) -> bool:
+        try:
+            return self.inner.delete(document_id)
+        finally:
+            self._invalidate(document_id)
@@ -0,0 +1,78 @@
+# services/singleflight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class _Call:
+    """一次进行中的调用: 共享的任务 + 正在等待它的调用方数量"""
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同键的并发异步调用: 第一个调用方 (leader) 启动任务，之后到达的调用方等待同一个任务的结果。
+
+    任务独立于任何一个调用方运行，调用方被取消 (例如客户端断开) 时只是停止等待，
+    不会取消仍有其他调用方在等的任务；最后一个调用方离开时才取消任务，避免做无人需要的工作。
+    任务结束后立即移除键，后续调用会重新执行 (这里只合并 "同时在途" 的调用，不是结果缓存)。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 on_coalesced: Optional[Callable[[], None]] = None) -> Any:
+        """
+        执行 fn 或等待相同键的进行中调用。
+
+        Args:
+            key: 调用的规范化键.
+            fn: 无参的协程工厂，只有 leader 会调用.
+            on_coalesced: 可选，调用被合并时的回调 (用于计数).
+
+        Returns:
+            任务的结果，任务抛出的异常会传播给所有调用方.
+        """
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        # 属于其他 (可能已关闭的) 事件循环的任务不能复用
+        if call is None or call.task.get_loop() is not loop:
+            call = self._calls[key] = _Call(loop.create_task(fn()))
+            call.task.add_done_callback(lambda _, call=call: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            if on_coalesced is not None:
+                on_coalesced()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """返回进程级共享的调用合并器 (只在事件循环线程中使用，无需加锁)"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,205 @@
+# services/storage.py
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable, Optional, Type
+
+from config import get_setting
+from services.repository import InMemoryDocumentStore, InMemoryRepository
+
+_postgres_pool: Optional[Any] = None
+_postgres_pool_lock = threading.Lock()
+_redis_client: Optional[Any] = None
+_invalidation_bus: Optional[Any] = None
+_shared_lock = threading.Lock()
+
+# 这些后端的状态保存在进程外，多个 worker 进程/副本可以共享
+SHARED_DATABASE_TYPES = ("postgresql", "redis")
+
+
+def get_database_type() -> str:
+    return get_setting("database.type", "inmemory")
+
+
+def get_worker_count() -> int:
+    """每个实例的 worker 进程数: WEB_CONCURRENCY 环境变量 (uvicorn/gunicorn 约定) 优先于 server.workers"""
+    return int(os.environ.get("WEB_CONCURRENCY") or get_setting("server.workers", 1))
+
+
+def check_shared_state() -> None:
+    """
+    多 worker 部署的启动检查: 进程内存储在每个 worker 中各有一份，
+    id 会重复、数据互不可见，因此 worker 数大于 1 时必须使用共享后端。
+    """
+    workers = get_worker_count()
+    if workers <= 1:
+        return
+    if get_database_type() not in SHARED_DATABASE_TYPES:
+        raise RuntimeError(f"{workers} 个 worker 进程不能使用 database.type='{get_database_type()}'，"
+                           f"请改用 {' / '.join(SHARED_DATABASE_TYPES)}")
+    if get_setting("jobs.backend", "inmemory") != "redis":
+        raise RuntimeError(f"{workers} 个 worker 进程不能使用 jobs.backend='inmemory'，请改用 redis")
+
+
+def get_redis_client() -> Any:
+    """返回进程级共享的同步 Redis 客户端 (连接 URL 来自 database.redis_url 或 REDIS_URL 环境变量)"""
+    global _redis_client
+    if _redis_client is None:
+        with _shared_lock:
+            if _redis_client is None:
+                import redis
+                url = get_setting("database.redis_url") or os.environ.get("REDIS_URL")
+                if not url:
+                    raise ValueError("database.type 为 redis 或启用本地读缓存时必须配置 database.redis_url 或 REDIS_URL")
+                _redis_client = redis.Redis.from_url(url)
+    return _redis_client
+
+
+def get_invalidation_bus() -> Any:
+    """返回进程级共享的跨 worker 缓存失效通道"""
+    global _invalidation_bus
+    if _invalidation_bus is None:
+        client = get_redis_client()
+        with _shared_lock:
+            if _invalidation_bus is None:
+                from services.shared_cache import InvalidationBus
+                _invalidation_bus = InvalidationBus(client, channel=get_key_prefix() + "invalidate")
+    return _invalidation_bus
+
+
+def get_key_prefix() -> str:
+    return get_setting("database.key_prefix", "aiflow:")
+
+
+def _local_cache_settings() -> Optional[Dict[str, Any]]:
+    """本地读缓存只对共享后端有意义 (进程内存储本身就是本地的)"""
+    settings = get_setting("database.local_cache", {})
+    if not settings.get("enabled", False) or get_database_type() not in SHARED_DATABASE_TYPES:
+        return None
+    return settings
+
+
+def get_postgres_pool() -> Any:
+    """返回进程级共享的 PostgreSQL 连接池 (连接 URL 来自 database.url 或 DATABASE_URL 环境变量)"""
+    global _postgres_pool
+    if _postgres_pool is None:
+        with _postgres_pool_lock:
+            if _postgres_pool is None:
+                from services.postgres_store import PostgresConnectionPool
+                dsn = get_setting("database.url") or os.environ.get("DATABASE_URL")
+                if not dsn:
+                    raise ValueError("database.type 为 postgresql 时必须配置 database.url 或 DATABASE_URL")
+                _postgres_pool = PostgresConnectionPool(
+                    dsn,
+                    min_size=get_setting("database.pool_min_size", 1),
+                    max_size=get_setting("database.pool_max_size", 10),
+                )
+    return _postgres_pool
+
+
+class StorageProxy:
+    """
+    仓储/文档存储的延迟代理: 首次使用时才按 database.type 创建真正的后端 (导入模块时不连接数据库)。
+
+    close_storage 关闭连接池和 Redis 客户端之后会重置所有代理，下次使用时用新的连接重新创建，
+    模块级的仓储不会继续持有已关闭的连接池 (例如应用 lifespan 重启之后)。
+    进程内存储不持有外部连接，重置时保留，数据不会因此丢失。
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._target: Optional[Any] = None
+        self._lock = threading.Lock()
+        _proxies.add(self)
+
+    def resolve(self) -> Any:
+        target = self._target
+        if target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+                target = self._target
+        return target
+
+    def reset(self) -> None:
+        with self._lock:
+            if not isinstance(self._target, (InMemoryRepository, InMemoryDocumentStore)):
+                self._target = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.resolve(), name)
+
+
+_proxies: "weakref.WeakSet[StorageProxy]" = weakref.WeakSet()
+
+
+def create_repository(table: str, model_cls: Type[Any], indexed_fields: Iterable[str] = ()) -> StorageProxy:
+    """按 database.type 创建仓储 (inmemory / postgresql / redis) 的延迟代理，按需包一层本地读缓存"""
+    indexed_fields = tuple(indexed_fields)
+    return StorageProxy(lambda: _build_repository(table, model_cls, indexed_fields))
+
+
+def create_document_store(model_cls: Type[Any]) -> StorageProxy:
+    """按 database.type 创建画布数据 (WorkflowData) 文档存储的延迟代理"""
+    return StorageProxy(lambda: _build_document_store(model_cls))
+
+
+def _build_repository(table: str, model_cls: Type[Any], indexed_fields: Iterable[str]) -> Any:
+    database_type = get_database_type()
+    if database_type == "inmemory":
+        return InMemoryRepository(model_cls, indexed_fields=indexed_fields)
+    if database_type == "postgresql":
+        from services.postgres_store import PostgresRepository
+        repository = PostgresRepository(get_postgres_pool(), table, model_cls, indexed_fields=indexed_fields)
+    elif database_type == "redis":
+        from services.redis_store import RedisRepository
+        repository = RedisRepository(get_redis_client(), table, model_cls, indexed_fields=indexed_fields,
+                                     key_prefix=get_key_prefix())
+    else:
+        raise ValueError(f"不支持的数据库类型 '{database_type}'")
+    cache_settings = _local_cache_settings()
+    if cache_settings is None:
+        return repository
+    from services.shared_cache import CachedRepository
+    return CachedRepository(repository, table, get_invalidation_bus(),
+                            max_entries=cache_settings.get("max_entries", 10000),
+                            ttl_seconds=cache_settings.get("ttl_seconds", 30))
+
+
+def _build_document_store(model_cls: Type[Any]) -> Any:
+    database_type = get_database_type()
+    if database_type == "inmemory":
+        return InMemoryDocumentStore(model_cls)
+    if database_type == "postgresql":
+        from services.postgres_store import PostgresDocumentStore
+        store = PostgresDocumentStore(get_postgres_pool(), model_cls)
+    elif database_type == "redis":
+        from services.redis_store import RedisDocumentStore
+        store = RedisDocumentStore(get_redis_client(), model_cls, key_prefix=get_key_prefix())
+    else:
+        raise ValueError(f"不支持的数据库类型 '{database_type}'")
+    cache_settings = _local_cache_settings()
+    if cache_settings is None:
+        return store
+    from services.shared_cache import CachedDocumentStore
+    return CachedDocumentStore(store, "workflow_data", get_invalidation_bus(),
+                               max_entries=cache_settings.get("max_entries", 10000),
+                               ttl_seconds=cache_settings.get("ttl_seconds", 30))
+
+
+def close_storage() -> None:
+    """关闭数据库连接池、Redis 客户端和失效通道 (应用关闭时调用)，并重置使用它们的仓储"""
+    global _postgres_pool, _redis_client, _invalidation_bus
+    with _postgres_pool_lock:
+        pool, _postgres_pool = _postgres_pool, None
+    if pool is not None:
+        pool.close()
+    with _shared_lock:
+        bus, _invalidation_bus = _invalidation_bus, None
+        client, _redis_client = _redis_client, None
+    if bus is not None:
+        bus.close()
+    if client is not None:
+        client.close()
+    for proxy in list(_proxies):
+        proxy.reset()
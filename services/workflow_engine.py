@@ -0,0 +1,176 @@
+# services/workflow_engine.py
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_setting
+from services.ai_service import AIService
+from services.node_memo import NodeOutputMemo, get_node_memo, is_node_memo_enabled, node_fingerprint, output_digest
+from services.result_cache import result_ttl
+
+
+class WorkflowCycleError(ValueError):
+    """工作流中存在循环依赖，无法编译为 DAG"""
+
+
+class WorkflowNodeError(Exception):
+    """工作流中某个节点执行失败"""
+
+    def __init__(self, node_id: str, error: Exception):
+        self.node_id = node_id
+        self.error = error
+        super().__init__(f"节点 '{node_id}' 执行失败: {error}")
+
+
+class CompiledWorkflow:
+    """编译后的工作流: 节点表、上游依赖以及按层划分的执行计划"""
+
+    def __init__(self, nodes: Dict[str, Any], upstream: Dict[str, List[str]], levels: List[List[str]]):
+        self.nodes = nodes
+        self.upstream = upstream
+        self.levels = levels
+
+
+def compile_workflow(workflow_data: Any) -> CompiledWorkflow:
+    """
+    将 WorkflowData (canvasItems + connections) 编译为按层划分的 DAG (Kahn 算法)。
+
+    同一层中的节点之间没有依赖关系，可以并发执行。
+
+    Args:
+        workflow_data: 由 WorkflowService.save_workflow_data 保存的工作流数据.
+
+    Returns:
+        CompiledWorkflow: 编译结果.
+
+    Raises:
+        ValueError: 连接引用了不存在的节点.
+        WorkflowCycleError: 工作流中存在循环依赖.
+    """
+    nodes = {item.id: item for item in workflow_data.canvasItems}
+    upstream: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    downstream: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+
+    for connection in workflow_data.connections:
+        if connection.source not in nodes or connection.target not in nodes:
+            raise ValueError(f"连接 {connection.source} -> {connection.target} 引用了不存在的节点")
+        upstream[connection.target].append(connection.source)
+        downstream[connection.source].append(connection.target)
+
+    in_degree = {node_id: len(sources) for node_id, sources in upstream.items()}
+    level = [node_id for node_id, degree in in_degree.items() if degree == 0]
+    levels: List[List[str]] = []
+    visited = 0
+
+    while level:
+        levels.append(level)
+        visited += len(level)
+        next_level = []
+        for node_id in level:
+            for neighbor in downstream[node_id]:
+                in_degree[neighbor] -= 1
+                if in_degree[neighbor] == 0:
+                    next_level.append(neighbor)
+        level = next_level
+
+    if visited != len(nodes):
+        raise WorkflowCycleError("工作流中存在循环依赖，无法执行！")
+
+    return CompiledWorkflow(nodes, upstream, levels)
+
+
+class WorkflowEngine:
+    """
+    服务端工作流执行引擎: 逐层并发执行 DAG，并沿连接传递节点输出。
+
+    节点输出按 Merkle 指纹 (类型、配置、初始输入和上游输出哈希) 记忆化，
+    修改某个节点后重新运行时，只有该节点及受影响的下游节点会真正执行。
+    与结果缓存使用同一条确定性规则 (result_ttl)，输出不确定或不可缓存的节点不做记忆化。
+    """
+
+    def __init__(self, ai_service: Optional[AIService] = None, max_concurrency: Optional[int] = None,
+                 memo: Optional[NodeOutputMemo] = None):
+        self.ai_service = ai_service or AIService()
+        self.max_concurrency = max_concurrency or get_setting("workflow_engine.max_concurrency", 8)
+        self._memo = memo
+
+    @property
+    def memo(self) -> Optional[NodeOutputMemo]:
+        if self._memo is not None:
+            return self._memo
+        return get_node_memo() if is_node_memo_enabled() else None
+
+    def build_node_input(self, compiled: CompiledWorkflow, node_id: str,
+                         outputs: Dict[str, Any], inputs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """组装节点输入: 调用方提供的初始输入 + 以上游节点 ID 为键的上游输出"""
+        node_input: Dict[str, Any] = dict(inputs.get(node_id, {}))
+        sources = compiled.upstream[node_id]
+        for source in sources:
+            node_input[source] = outputs[source]
+        # 文本类模块默认读取 input_text，未显式提供时用上游输出拼接
+        if sources and "input_text" not in node_input:
+            node_input["input_text"] = "\n".join(str(outputs[source]) for source in sources)
+        return node_input
+
+    async def run_node(self, node: Any, node_input: Dict[str, Any], semaphore: asyncio.Semaphore) -> Any:
+        """执行单个节点，阻塞的模块逻辑由执行层放到线程池/进程池中运行，避免阻塞事件循环"""
+        async with semaphore:
+            try:
+                return await self.ai_service.run_module_async(node.type, node.config, node_input)
+            except Exception as e:
+                raise WorkflowNodeError(node.id, e) from e
+
+    async def run_node_memoized(self, compiled: CompiledWorkflow, node_id: str, outputs: Dict[str, Any],
+                                digests: Dict[str, Optional[str]], inputs: Dict[str, Dict[str, Any]],
+                                semaphore: asyncio.Semaphore, memo: Optional[NodeOutputMemo],
+                                use_cache: bool) -> Tuple[Any, Optional[str], bool]:
+        """返回 (输出, 输出哈希, 是否命中)，use_cache=False 时跳过查找但仍然刷新记忆"""
+        node = compiled.nodes[node_id]
+        if memo is None:
+            node_input = self.build_node_input(compiled, node_id, outputs, inputs)
+            return await self.run_node(node, node_input, semaphore), None, False
+        if result_ttl(node.type, node.config) <= 0:
+            # 输出不确定的节点 (例如 temperature 不为 0 的 OpenAI 生成) 每次都执行，只计算输出哈希供下游使用
+            output = await self.run_node(node, self.build_node_input(compiled, node_id, outputs, inputs), semaphore)
+            return output, output_digest(output), False
+        fingerprint = node_fingerprint(node.type, node.config, inputs.get(node_id, {}),
+                                       [(source, digests[source]) for source in compiled.upstream[node_id]])
+        if use_cache:
+            cached = memo.get(fingerprint)
+            if cached is not None:
+                return cached[0], cached[1], True
+        output = await self.run_node(node, self.build_node_input(compiled, node_id, outputs, inputs), semaphore)
+        return output, memo.put(fingerprint, output), False
+
+    async def run(self, workflow_data: Any, inputs: Optional[Dict[str, Dict[str, Any]]] = None,
+                  use_cache: bool = True) -> Dict[str, Any]:
+        """
+        执行整个工作流。
+
+        Args:
+            workflow_data: 工作流数据 (canvasItems + connections).
+            inputs: 可选，按节点 ID 提供的初始输入.
+            use_cache: 为 False 时所有节点都重新执行 (结果仍会写入记忆化存储).
+
+        Returns:
+            dict: {"results": {节点 ID: 输出}, "levels": 执行层,
+                   "cache_hits": 复用记忆结果的节点 ID, "executed": 实际执行的节点 ID}.
+        """
+        compiled = compile_workflow(workflow_data)
+        inputs = inputs or {}
+        outputs: Dict[str, Any] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        memo = self.memo
+        digests: Dict[str, Optional[str]] = {}
+        cache_hits: List[str] = []
+        executed: List[str] = []
+        for level in compiled.levels:
+            level_results = await asyncio.gather(*(
+                self.run_node_memoized(compiled, node_id, outputs, digests, inputs, semaphore, memo, use_cache)
+                for node_id in level
+            ))
+            for node_id, (output, digest, hit) in zip(level, level_results):
+                outputs[node_id] = output
+                digests[node_id] = digest
+                (cache_hits if hit else executed).append(node_id)
+
+        return {"results": outputs, "levels": compiled.levels, "cache_hits": cache_hits, "executed": executed}
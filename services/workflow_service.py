@@ -1,7 +1,9 @@
 # services/workflow_service.py
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from models.workflow_models import Workflow, WorkflowCreate, WorkflowUpdate
 from pydantic import BaseModel, ValidationError
+from services.repository import VersionConflictError
+from services.storage import create_document_store, create_repository
 
 # ------ 模型定义 ------
 class CanvasItem(BaseModel):
@@ -26,61 +28,76 @@ class WorkflowData(BaseModel):
     canvasItems: List[CanvasItem]
     connections: List[Connection]
 
+class CanvasItemUpdate(BaseModel):
+    """画布节点的部分更新，只包含发生变化的字段 (例如拖动后的 top/left)"""
+    id: str
+    type: Optional[str] = None
+    name: Optional[str] = None
+    top: Optional[float] = None
+    left: Optional[float] = None
+    width: Optional[float] = None
+    height: Optional[float] = None
+    config: Optional[Dict[str, Any]] = None
+    configSchema: Optional[Dict[str, Any]] = None
+
+class WorkflowDataPatch(BaseModel):
+    """画布增量修改: 节点/连接级别的变更，基于 baseVersion 做乐观并发控制"""
+    baseVersion: Optional[int] = None
+    upsertItems: List[CanvasItem] = []
+    updateItems: List[CanvasItemUpdate] = []
+    removeItemIds: List[str] = []
+    addConnections: List[Connection] = []
+    removeConnections: List[Connection] = []
+
 # ------ 模型定义结束 ------
 
-workflows_db: List[Workflow] = []
-workflow_id_counter = 1
+# 存储后端由 database.type 决定 (inmemory / postgresql)
+workflow_repository = create_repository("workflows", Workflow, indexed_fields=("name",))
 
-workflow_data_db: Dict[int, WorkflowData] = {}
+workflow_data_store = create_document_store(WorkflowData)
 
 class WorkflowService:
     def get_all_workflows(self) -> List[Workflow]:
         """获取所有工作流"""
-        return workflows_db
+        return workflow_repository.list()
+
+    def list_workflows(self, limit: int, after_id: Optional[int] = None, name: Optional[str] = None) -> List[Workflow]:
+        """按 id 游标分页获取工作流，可按名称过滤"""
+        return workflow_repository.page(after_id, limit, {"name": name})
+
+    def iter_workflows(self, batch_size: int = 500, name: Optional[str] = None) -> Iterator[Workflow]:
+        """分批遍历全部工作流 (用于流式导出)"""
+        return workflow_repository.iter_all(batch_size, {"name": name})
 
     def create_workflow(self, workflow_create: WorkflowCreate) -> Workflow:
         """创建新的工作流"""
-        global workflow_id_counter
-        new_workflow = Workflow(
-            id=workflow_id_counter,
-            name=workflow_create.name,
-            description=workflow_create.description,
-            steps=workflow_create.steps,
-        )
-        workflows_db.append(new_workflow)
-        workflow_id_counter += 1
-        return new_workflow
+        return workflow_repository.create({
+            "name": workflow_create.name,
+            "description": workflow_create.description,
+            "steps": workflow_create.steps,
+        })
 
     def get_workflow(self, workflow_id: int) -> Optional[Workflow]:
         """根据ID获取工作流"""
-        for workflow in workflows_db:
-            if workflow.id == workflow_id:
-                return workflow
-        return None
+        return workflow_repository.get(workflow_id)
+
+    def get_workflows_by_name(self, name: str) -> List[Workflow]:
+        """根据名称获取工作流 (使用名称索引)"""
+        return workflow_repository.find_by("name", name)
 
     def update_workflow(self, workflow_id: int, workflow_update: WorkflowUpdate) -> Optional[Workflow]:
         """更新现有工作流"""
-        for index, workflow in enumerate(workflows_db):
-            if workflow.id == workflow_id:
-                updated_workflow_data = workflow.dict()
-                update_data = workflow_update.dict(exclude_unset=True)
-                updated_workflow_data.update(update_data)
-                updated_workflow = Workflow(**updated_workflow_data)
-                workflows_db[index] = updated_workflow
-                return updated_workflow
-        return None
+        return workflow_repository.update(workflow_id, workflow_update.dict(exclude_unset=True))
 
     def delete_workflow(self, workflow_id: int) -> bool:
         """删除工作流"""
-        global workflows_db
-        initial_length = len(workflows_db)
-        workflows_db = [workflow for workflow in workflows_db if workflow.id != workflow_id]
-        return len(workflows_db) < initial_length
+        workflow_data_store.delete(workflow_id)
+        return workflow_repository.delete(workflow_id)
 
     def get_workflow_data_by_id(self, workflow_id: int) -> Optional[WorkflowData]:
         """根据ID获取工作流数据"""
         try:
-            workflow_data = workflow_data_db.get(workflow_id)
+            workflow_data = workflow_data_store.get(workflow_id)
             if workflow_data is None:
                 return None
             return workflow_data
@@ -88,10 +105,65 @@ class WorkflowService:
             print(f"Error in get_workflow_data_by_id: {e}")  # 添加日志
             return None
 
+    def get_workflow_data_versioned(self, workflow_id: int) -> Optional[Tuple[WorkflowData, int]]:
+        """根据ID获取工作流数据及其版本号"""
+        return workflow_data_store.get_versioned(workflow_id)
+
     def save_workflow_data(self, workflow_id: int, workflow_data: WorkflowData) -> WorkflowData:
         """保存工作流数据，使用 workflow_id 作为键"""
+        return self.save_workflow_data_versioned(workflow_id, workflow_data)[0]
+
+    def save_workflow_data_versioned(self, workflow_id: int, workflow_data: WorkflowData,
+                                     expected_version: Optional[int] = None) -> Tuple[WorkflowData, int]:
+        """保存工作流数据并返回新的版本号，expected_version 不匹配时抛出 VersionConflictError"""
         # 检查 workflow_id 对应的 workflow 是否存在
-        if self.get_workflow(workflow_id) is None:
+        if not workflow_repository.exists(workflow_id):
             raise ValueError(f"Workflow with id {workflow_id} not found")
-        workflow_data_db[workflow_id] = workflow_data
-        return workflow_data
\ No newline at end of file
+        version = workflow_data_store.put(workflow_id, workflow_data, expected_version=expected_version)
+        return workflow_data, version
+
+    def patch_workflow_data(self, workflow_id: int, patch: WorkflowDataPatch,
+                            base_version: int) -> Tuple[WorkflowData, int]:
+        """
+        在 base_version 的基础上应用画布增量修改。
+
+        只校验本次变更涉及的节点和连接，未变化的节点直接复用；
+        删除节点时一并删除与之相关的连接。
+
+        Raises:
+            LookupError: 工作流数据不存在.
+            ValueError: 变更引用了不存在的节点，或修改后的节点无效.
+            VersionConflictError: 画布已被其他请求修改.
+        """
+        versioned = workflow_data_store.get_versioned(workflow_id)
+        if versioned is None:
+            raise LookupError(f"Workflow data for workflow id {workflow_id} not found")
+        current, current_version = versioned
+        if current_version != base_version:
+            raise VersionConflictError(workflow_id, base_version, current_version)
+
+        items = {item.id: item for item in current.canvasItems}
+        removed_ids = set(patch.removeItemIds)
+        for item_id in removed_ids:
+            if items.pop(item_id, None) is None:
+                raise ValueError(f"节点 '{item_id}' 不存在")
+        for item in patch.upsertItems:
+            items[item.id] = CanvasItem.construct(**item.dict())
+        for update in patch.updateItems:
+            if update.id not in items:
+                raise ValueError(f"节点 '{update.id}' 不存在")
+            # 合并后重新校验 (copy(update=...) 不做校验，例如 {"top": null} 会写入无效的节点)
+            items[update.id] = CanvasItem(**{**items[update.id].dict(), **update.dict(exclude_unset=True, exclude={"id"})})
+
+        removed_connections = {(c.source, c.target) for c in patch.removeConnections}
+        connections = [c for c in current.connections
+                       if (c.source, c.target) not in removed_connections
+                       and c.source not in removed_ids and c.target not in removed_ids]
+        for connection in patch.addConnections:
+            if connection.source not in items or connection.target not in items:
+                raise ValueError(f"连接 {connection.source} -> {connection.target} 引用了不存在的节点")
+            connections.append(Connection.construct(**connection.dict()))
+
+        workflow_data = WorkflowData.construct(canvasItems=list(items.values()), connections=connections)
+        version = workflow_data_store.put(workflow_id, workflow_data, expected_version=base_version)
+        return workflow_data, version
@@ -0,0 +1,23 @@
+# tests/conftest.py
+from typing import Any, Callable
+
+import pytest
+
+import config
+
+
+@pytest.fixture
+def settings(monkeypatch) -> Callable[[str, Any], None]:
+    """按点分路径临时覆盖配置，例如 settings("result_cache.enabled", True)，测试结束后自动恢复"""
+
+    def override(key_path: str, value: Any) -> None:
+        *parents, leaf = key_path.split(".")
+        node = config.get_config()
+        for key in parents:
+            # 逐层复制，不修改 DEFAULT_CONFIG 中共享的字典
+            child = dict(node.get(key) or {})
+            monkeypatch.setitem(node, key, child)
+            node = child
+        monkeypatch.setitem(node, leaf, value)
+
+    return override
@@ -0,0 +1,92 @@
+# tests/test_ai_utils.py
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_utils
+import main
+from ai_utils import CorpusIndex, normalize_data
+from models.workflow_models import AIModuleCreate
+from services.ai_service import ai_module_repository
+
+
+def test_normalize_list_keeps_missing_values_as_none():
+    assert normalize_data([1, None, 3]) == [0.0, None, 1.0]
+    assert normalize_data([[1, None], [3, 10], [5, 20]]) == [[0.0, None], [0.5, 0.0], [1.0, 1.0]]
+
+
+def test_normalize_array_keeps_nan():
+    result = normalize_data(np.array([1.0, np.nan, 3.0]), "z-score")
+    assert np.isnan(result[1])
+    assert result[0] == pytest.approx(-1.0) and result[2] == pytest.approx(1.0)
+
+
+def test_normalize_rejects_infinite_values():
+    with pytest.raises(ValueError, match="无穷大"):
+        normalize_data([1, float("inf"), 3])
+
+
+@pytest.fixture
+def normalize_module():
+    module = main.ai_service.create_ai_module(AIModuleCreate(
+        name="normalize", type="data_processing", config={"operation": "normalize"}))
+    yield module
+    ai_module_repository.delete(module.id)
+
+
+def test_run_endpoint_serializes_missing_values(normalize_module):
+    with TestClient(main.app) as client:
+        url = f"/ai-modules/run/{normalize_module.id}"
+        response = client.post(url, json={"data": [1, None, 3]})
+        assert response.status_code == 200
+        assert response.json() == {"result": [0.0, None, 1.0]}
+
+        # Python 的 json 模块接受 Infinity 字面量，无穷大的输入返回 400 而不是序列化时出错
+        response = client.post(url, content='{"data": [1, Infinity]}', headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+
+
+DOCUMENT = "python python python database"
+
+
+def test_idf_from_the_corpus_changes_the_ranking():
+    index = CorpusIndex(n_features=4096)
+    # 空语料时 IDF 相同，按词频排序
+    assert index.extract(DOCUMENT, 2) == ["python", "database"]
+    index.add_documents([f"python tutorial {i}" for i in range(50)] + ["database internals"])
+    assert index.extract(DOCUMENT, 2) == ["database", "python"]
+
+
+def test_corpus_index_round_trips_through_disk(tmp_path):
+    index = CorpusIndex(n_features=4096)
+    index.add_documents(["python tutorial", "database internals", None])
+    path = tmp_path / "nested" / "corpus.npz"
+    index.save(str(path))
+    loaded = CorpusIndex.load(str(path))
+    assert loaded.num_docs == 2
+    assert np.array_equal(loaded.doc_freq, index.doc_freq)
+    assert list(path.parent.iterdir()) == [path]
+
+
+@pytest.fixture
+def corpus_index(monkeypatch, settings, tmp_path):
+    path = tmp_path / "corpus.npz"
+    settings("keywords.index_path", str(path))
+    monkeypatch.setattr(ai_utils, "_corpus_index", CorpusIndex(n_features=4096))
+    return path
+
+
+def test_ingest_endpoint_updates_and_persists_the_corpus(corpus_index):
+    module = main.ai_service.create_ai_module(AIModuleCreate(
+        name="keywords", type="data_processing", config={"operation": "extract_keywords", "num_keywords": 1}))
+    try:
+        with TestClient(main.app) as client:
+            run_url = f"/ai-modules/run/{module.id}"
+            assert client.post(run_url, json={"texts": [DOCUMENT]}).json() == {"result": [["python"]]}
+
+            response = client.post("/keywords/corpus", json={"texts": [f"python tutorial {i}" for i in range(50)]})
+            assert response.json() == {"added": 50, "num_docs": 50}
+            assert client.post(run_url, json={"texts": [DOCUMENT]}).json() == {"result": [["database"]]}
+    finally:
+        ai_module_repository.delete(module.id)
+    assert CorpusIndex.load(str(corpus_index)).num_docs == 50
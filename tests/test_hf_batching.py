@@ -0,0 +1,114 @@
+# tests/test_hf_batching.py
+import asyncio
+import threading
+from typing import Any, Dict, List
+
+import pytest
+
+import hf_batching
+from hf_batching import MicroBatcher
+from services.ai_service import AIService
+
+
+class RecordingRunBatch:
+    """记录每个批次大小的 run_batch 替身"""
+
+    def __init__(self):
+        self.batch_sizes: List[int] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompts: List[str], options: Dict[str, Any]) -> List[str]:
+        with self._lock:
+            self.batch_sizes.append(len(prompts))
+        return [f"{prompt}!" for prompt in prompts]
+
+
+def test_micro_batcher_splits_queue_into_full_batches():
+    run_batch = RecordingRunBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=50)
+    futures = batcher.submit_many([f"p{i}" for i in range(10)])
+    assert [future.result(timeout=5) for future in futures] == [f"p{i}!" for i in range(10)]
+    assert run_batch.batch_sizes == [4, 4, 2]
+
+
+def test_micro_batcher_does_not_mix_generation_options():
+    run_batch = RecordingRunBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=50)
+    short = batcher.submit_many(["a", "b"], max_length=10)
+    long = batcher.submit_many(["c"], max_length=50)
+    for future in short + long:
+        future.result(timeout=5)
+    assert sorted(run_batch.batch_sizes) == [1, 2]
+
+
+def test_micro_batcher_propagates_batch_errors():
+    def failing(prompts, options):
+        raise RuntimeError("boom")
+
+    future = MicroBatcher(failing, max_wait_ms=1).submit("x")
+    with pytest.raises(RuntimeError, match="boom"):
+        future.result(timeout=5)
+
+
+def test_missing_batch_results_fail_the_unmatched_requests():
+    futures = MicroBatcher(lambda prompts, options: ["only one"], max_batch_size=3, max_wait_ms=50).submit_many(
+        ["a", "b", "c"])
+    assert futures[0].result(timeout=5) == "only one"
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError, match="返回了 1 个结果"):
+            future.result(timeout=5)
+
+
+def test_interleaved_options_are_batched_per_group_in_arrival_order():
+    batches = []
+
+    def run_batch(prompts, options):
+        batches.append((options["max_length"], prompts))
+        return prompts
+
+    batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait_ms=50)
+    futures = []
+    with batcher._condition:  # 全部入队后调度线程才开始组批
+        for i in range(8):
+            futures += batcher.submit_many([f"p{i}"], max_length=10 if i % 2 == 0 else 50)
+    for future in futures:
+        future.result(timeout=5)
+    assert batches == [(10, ["p0", "p2", "p4"]), (50, ["p1", "p3", "p5"]), (10, ["p6"]), (50, ["p7"])]
+    assert batcher.stats()["queue_depth"] == 0
+
+
+@pytest.fixture
+def stub_batcher(monkeypatch):
+    run_batch = RecordingRunBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=500, name="stub-model")
+    monkeypatch.setitem(hf_batching._batchers, ("stub-model", None), batcher)
+    return run_batch
+
+
+def test_single_runs_fill_batches_beyond_text_generation_pool(stub_batcher, settings):
+    # 执行层的 text_generation 线程池只有 2 个线程，单条运行仍应凑满 max_batch_size
+    settings("execution.module_types", {"text_generation": {"kind": "thread", "max_workers": 2}})
+    config = {"backend": "huggingface", "model": "stub-model"}
+
+    async def run_all():
+        service = AIService()
+        return await asyncio.gather(*(service.run_module_async("text_generation", config, {"input_text": f"p{i}"})
+                                      for i in range(8)))
+
+    assert asyncio.run(run_all()) == [f"p{i}!" for i in range(8)]
+    assert stub_batcher.batch_sizes == [8]
+
+
+def test_batch_histograms_are_exported_on_metrics():
+    from services.metrics import render_metrics
+
+    batcher = MicroBatcher(RecordingRunBatch(), max_batch_size=4, max_wait_ms=50, name="metrics-model:default")
+    for future in batcher.submit_many(["a", "b", "c"]):
+        future.result(timeout=5)
+
+    stats = batcher.stats()
+    assert stats["batch_size"]["count"] == 1 and stats["batch_size"]["sum"] == 3
+    assert stats["queue_wait_seconds"]["count"] == 3
+    text = render_metrics()
+    assert 'aiflow_hf_batch_size_bucket{model="metrics-model:default",le="4"} 1' in text
+    assert 'aiflow_hf_batch_queue_wait_seconds_count{model="metrics-model:default"} 3' in text
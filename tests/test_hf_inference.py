@@ -0,0 +1,165 @@
+# tests/test_hf_inference.py
+import os
+import types
+
+import pytest
+
+import hf_inference
+from services.metrics import HF_ARTIFACT_REBUILDS
+
+
+@pytest.fixture
+def artifact_dir(tmp_path, monkeypatch, settings):
+    """产物目录指向临时目录，库版本固定 (不导入 torch/transformers)"""
+    versions = {"torch": "2.3.0", "transformers": "4.44.0"}
+    monkeypatch.setattr(hf_inference, "_library_versions", lambda mode: [versions["torch"], versions["transformers"]])
+    settings("ai_models.inference", {"artifact_dir": str(tmp_path), "default_mode": "int8"})
+    return tmp_path, versions
+
+
+@pytest.fixture
+def fake_builders(monkeypatch):
+    """替换 int8 的转换/加载函数，记录调用次数"""
+    calls = {"build": 0, "load": 0}
+    state = {"load_error": None, "build_error": None}
+
+    def build(model_name, staging):
+        calls["build"] += 1
+        if state["build_error"]:
+            raise RuntimeError(state["build_error"])
+        with open(os.path.join(staging, hf_inference.INT8_WEIGHTS_FILE), "w") as f:
+            f.write("weights")
+        return types.SimpleNamespace(source="build"), "tokenizer"
+
+    def load(path):
+        calls["load"] += 1
+        if state["load_error"]:
+            raise RuntimeError(state["load_error"])
+        with open(os.path.join(path, hf_inference.INT8_WEIGHTS_FILE)) as f:
+            assert f.read() == "weights"
+        return types.SimpleNamespace(source="load"), "tokenizer"
+
+    monkeypatch.setitem(hf_inference._BUILDERS, "int8", (build, load))
+    return calls, state
+
+
+@pytest.mark.parametrize("inference, model_name, expected", [
+    ({}, "gpt2", "fp32"),
+    ({"default_mode": "onnx"}, "gpt2", "onnx"),
+    ({"default_mode": "onnx", "models": {"gpt2": "int8"}}, "gpt2", "int8"),
+    ({"default_mode": "onnx", "models": {"gpt2": "int8"}}, "distilgpt2", "onnx"),
+])
+def test_inference_mode_prefers_per_model_setting(settings, inference, model_name, expected):
+    settings("ai_models.inference", inference)
+    assert hf_inference.get_inference_mode(model_name) == expected
+
+
+def test_unknown_inference_mode_is_rejected(settings):
+    settings("ai_models.inference", {"models": {"gpt2": "fp16"}})
+    with pytest.raises(ValueError, match="fp16"):
+        hf_inference.get_inference_mode("gpt2")
+    with pytest.raises(ValueError):
+        hf_inference.model_variant("gpt2")
+
+
+def test_model_variant(settings):
+    settings("ai_models.inference", {"models": {"gpt2": "int8"}})
+    settings("ai_models.default_dtype", "bfloat16")
+    assert hf_inference.model_variant("gpt2", "float16") == "int8"
+    assert hf_inference.model_variant("distilgpt2", "float16") == "float16"
+    assert hf_inference.model_variant("distilgpt2") == "bfloat16"
+
+
+def test_artifact_path_changes_with_library_versions(artifact_dir):
+    tmp_path, versions = artifact_dir
+    path = hf_inference.get_artifact_path("org/model name", "int8")
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith("org_model_name-int8-")
+    assert hf_inference.get_artifact_path("org/model name", "int8") == path
+    assert hf_inference.get_artifact_path("org/model name", "onnx") != path
+
+    versions["transformers"] = "4.45.0"
+    assert hf_inference.get_artifact_path("org/model name", "int8") != path
+
+
+def test_build_artifact_renames_staging_directory(tmp_path):
+    path = str(tmp_path / "models" / "gpt2-int8-abc")
+
+    def build(staging):
+        assert staging.startswith(path + ".tmp-")
+        with open(os.path.join(staging, "weights"), "w") as f:
+            f.write("first")
+        return "built"
+
+    assert hf_inference._build_artifact(path, build) == "built"
+    assert os.listdir(tmp_path / "models") == ["gpt2-int8-abc"]
+    assert (tmp_path / "models" / "gpt2-int8-abc" / "weights").read_text() == "first"
+
+
+def test_second_builder_keeps_the_first_artifact(tmp_path):
+    path = str(tmp_path / "gpt2-int8-abc")
+
+    def build(content):
+        def write(staging):
+            with open(os.path.join(staging, "weights"), "w") as f:
+                f.write(content)
+            return content
+        return write
+
+    hf_inference._build_artifact(path, build("first"))
+    # 另一个 worker 转换完成时产物已经存在，重命名失败，使用已有的那份并清理自己的临时目录
+    assert hf_inference._build_artifact(path, build("second")) == "second"
+    assert os.listdir(tmp_path) == ["gpt2-int8-abc"]
+    assert (tmp_path / "gpt2-int8-abc" / "weights").read_text() == "first"
+
+
+def test_failed_build_leaves_nothing_behind(tmp_path):
+    path = str(tmp_path / "gpt2-int8-abc")
+
+    def build(staging):
+        with open(os.path.join(staging, "partial"), "w") as f:
+            f.write("x")
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        hf_inference._build_artifact(path, build)
+    assert os.listdir(tmp_path) == []
+
+
+def test_artifact_is_built_once_then_loaded(artifact_dir, fake_builders):
+    calls, _ = fake_builders
+    model, tokenizer = hf_inference.load_text_generation_model("gpt2", "int8")
+    assert model.source == "build" and tokenizer == "tokenizer"
+    assert model.footprint_bytes == len("weights")
+
+    model, _ = hf_inference.load_text_generation_model("gpt2", "int8")
+    assert model.source == "load"
+    assert calls == {"build": 1, "load": 1}
+
+
+def test_corrupt_artifact_is_rebuilt(artifact_dir, fake_builders):
+    calls, state = fake_builders
+    path = hf_inference.get_artifact_path("gpt2", "int8")
+    os.makedirs(path)
+    with open(os.path.join(path, hf_inference.INT8_WEIGHTS_FILE), "w") as f:
+        f.write("trunc")
+    rebuilds = HF_ARTIFACT_REBUILDS.labels("int8").value
+    state["load_error"] = "unexpected EOF"
+
+    model, _ = hf_inference.load_text_generation_model("gpt2", "int8")
+    assert model.source == "build"
+    assert calls == {"build": 1, "load": 1}
+    assert HF_ARTIFACT_REBUILDS.labels("int8").value == rebuilds + 1
+    with open(os.path.join(path, hf_inference.INT8_WEIGHTS_FILE)) as f:
+        assert f.read() == "weights"
+
+
+def test_rebuild_failure_reports_both_errors(artifact_dir, fake_builders):
+    _, state = fake_builders
+    os.makedirs(hf_inference.get_artifact_path("gpt2", "int8"))
+    state["load_error"] = "unexpected EOF"
+    state["build_error"] = "model not found"
+
+    with pytest.raises(RuntimeError) as excinfo:
+        hf_inference.load_text_generation_model("gpt2", "int8")
+    assert "unexpected EOF" in str(excinfo.value) and "model not found" in str(excinfo.value)
@@ -0,0 +1,165 @@
+# tests/test_hf_prefix_cache.py
+import contextlib
+import sys
+import types
+
+import pytest
+
+import hf_transformers
+from model_pool import ModelPool
+
+
+class FakeTensor:
+    def __init__(self, size: int):
+        self.size = size
+
+    def numel(self) -> int:
+        return self.size
+
+    def element_size(self) -> int:
+        return 4
+
+
+class FakeTokenizer:
+    """每个字符一个 token"""
+    pad_token_id = None
+    eos_token_id = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [ord(char) for char in text]}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(token) for token in ids)
+
+
+class FakeModel:
+    device = "cpu"
+    config = types.SimpleNamespace(eos_token_id=0)
+
+    def __init__(self):
+        self.prefills = []
+        self.generate_calls = []
+
+    def __call__(self, input_ids, use_cache=False):
+        # 预填充: KV 的大小与前缀长度成正比 (每个 token 1 KB)
+        self.prefills.append("".join(chr(token) for token in input_ids[0]))
+        size = len(input_ids[0]) * 128
+        return types.SimpleNamespace(past_key_values=[(FakeTensor(size), FakeTensor(size))])
+
+    def generate(self, input_ids, past_key_values=None, **kwargs):
+        self.generate_calls.append({"past_key_values": past_key_values,
+                                    "cached_layers": None if past_key_values is None else len(past_key_values),
+                                    **kwargs})
+        if past_key_values is not None:
+            # 与 transformers 一样就地追加新 token 的 KV
+            past_key_values.append((FakeTensor(128), FakeTensor(128)))
+        return [input_ids[0] + [ord("!")]]
+
+
+@pytest.fixture
+def fake_model(monkeypatch, settings):
+    """替换 torch、transformers 和文本生成 pipeline，并使用空的前缀缓存"""
+    torch = types.ModuleType("torch")
+    torch.tensor = lambda data, device=None: data
+    torch.ones_like = lambda data: [[1] * len(row) for row in data]
+    torch.no_grad = contextlib.nullcontext
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    transformers = types.ModuleType("transformers")
+    transformers.set_seed = lambda seed: None
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+
+    model = FakeModel()
+    pipeline = types.SimpleNamespace(tokenizer=FakeTokenizer(), model=model)
+    monkeypatch.setattr(hf_transformers, "get_text_generation_pipeline", lambda name, dtype=None: pipeline)
+    monkeypatch.setattr(hf_transformers, "_prefix_cache", None)
+    settings("ai_models.prefix_cache", {"enabled": True, "min_prefix_tokens": 4,
+                                        "max_memory_mb": 10000 / (1024 * 1024)})
+    return model
+
+
+def generate(prefix: str, prompt: str):
+    return hf_transformers.generate_text_hf_prefixed("m", prefix, prompt, max_new_tokens=5)
+
+
+def test_prefix_kv_cache_is_reused_and_copied(fake_model):
+    assert generate("system: ", "hi") == ("system: hi!", None)
+    assert generate("system: ", "bye") == ("system: bye!", None)
+
+    assert fake_model.prefills == ["system: "]
+    # generate 拿到的是副本，第一次生成就地追加的 KV 不会进入缓存中的前缀
+    first, second = fake_model.generate_calls
+    assert first["past_key_values"] is not second["past_key_values"]
+    assert first["cached_layers"] == second["cached_layers"] == 1
+    stats = hf_transformers.get_prefix_cache_stats()
+    assert stats["misses"] == 1 and stats["hits"] >= 1
+
+
+def test_different_prefix_misses_the_cache(fake_model):
+    generate("system: ", "hi")
+    generate("other:  ", "hi")
+    assert fake_model.prefills == ["system: ", "other:  "]
+    assert hf_transformers.get_prefix_cache_stats()["misses"] == 2
+
+
+def test_short_prefix_and_disabled_cache_skip_prefill(fake_model, settings):
+    assert generate("ab", "cd") == ("abcd!", None)
+    settings("ai_models.prefix_cache.enabled", False)
+    generate("system: ", "hi")
+    assert fake_model.prefills == []
+    assert all(call["past_key_values"] is None for call in fake_model.generate_calls)
+
+
+def test_prefix_entries_are_evicted_under_the_memory_budget(fake_model):
+    # 每个 8 token 的前缀占 8 KB，预算 10000 字节时只能保留最近使用的一个
+    for prefix in ("first:  ", "second: ", "first:  "):
+        generate(prefix, "x")
+
+    assert fake_model.prefills == ["first:  ", "second: ", "first:  "]
+    stats = hf_transformers.get_prefix_cache_stats()
+    assert stats["entries"] == 1 and stats["evictions"] == 2
+    assert stats["memory_bytes"] <= stats["max_memory_bytes"]
+
+
+def test_generation_errors_are_returned(fake_model):
+    def fail(**kwargs):
+        raise RuntimeError("CUDA out of memory")
+
+    fake_model.generate = fail
+    generated_text, error = generate("system: ", "hi")
+    assert generated_text is None and "out of memory" in error
+
+
+def test_tokenizer_padding_is_configured_once_at_load(monkeypatch, settings):
+    settings("ai_models.inference", {})
+    tokenizer = FakeTokenizer()
+    calls = []
+
+    transformers = types.ModuleType("transformers")
+    transformers.set_seed = lambda seed: None
+
+    def pipeline(task, **kwargs):
+        def run(prompts, **options):
+            calls.append((list(prompts), tokenizer.padding_side))
+            return [[{"generated_text": prompt + "!"}] for prompt in prompts]
+        run.tokenizer = tokenizer
+        run.model = FakeModel()
+        return run
+
+    transformers.pipeline = pipeline
+    torch = types.ModuleType("torch")
+    torch.float32 = "float32"
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    pool = ModelPool(10 ** 9, size_estimator=lambda model: 1)
+    monkeypatch.setattr(hf_transformers, "get_model_pool", lambda: pool)
+
+    assert hf_transformers.generate_texts_hf("m", ["a", "bb"]) == ["a!", "bb!"]
+    assert tokenizer.pad_token_id == 0 and tokenizer.padding_side == "left"
+
+    # 之后的批量生成不再修改共享的分词器
+    def forbid(self, name, value):
+        raise AssertionError(f"tokenizer.{name} modified during generation")
+
+    monkeypatch.setattr(FakeTokenizer, "__setattr__", forbid)
+    assert hf_transformers.generate_texts_hf("m", ["c"]) == ["c!"]
+    assert calls == [(["a", "bb"], "left"), (["c"], "left")]
@@ -0,0 +1,122 @@
+# tests/test_hf_streaming.py
+import queue
+import sys
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import hf_transformers
+import main
+from models.workflow_models import AIModuleCreate
+from services.ai_service import ai_module_repository
+
+
+class FakeStreamer:
+    """与 transformers.TextIteratorStreamer 相同的队列语义: end() 放入结束标记，超时抛出 queue.Empty"""
+
+    def __init__(self, tokenizer, skip_prompt=False, timeout=None, **kwargs):
+        self.queue = queue.Queue()
+        self.timeout = timeout
+
+    def put_text(self, text):
+        self.queue.put(text)
+
+    def end(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            text = self.queue.get(timeout=self.timeout)
+            if text is None:
+                return
+            yield text
+
+
+class FakeInputs(dict):
+    def to(self, device):
+        return self
+
+
+class FakeModel:
+    device = "cpu"
+
+    def __init__(self, generate):
+        self._generate = generate
+        self.threads = []
+
+    def generate(self, streamer, stopping_criteria, **kwargs):
+        self.threads.append(threading.current_thread().name)
+        self._generate(streamer, stopping_criteria[0].stop_event)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """替换 transformers 和文本生成 pipeline，返回一个设置 generate 行为的函数"""
+    module = types.ModuleType("transformers")
+    module.StoppingCriteria = object
+    module.StoppingCriteriaList = list
+    module.TextIteratorStreamer = FakeStreamer
+    module.set_seed = lambda seed: None
+    monkeypatch.setitem(sys.modules, "transformers", module)
+
+    def install(generate):
+        model = FakeModel(generate)
+        tokenizer = lambda text, return_tensors=None: FakeInputs(input_ids=[[1]])  # noqa: E731
+        tokenizer.pad_token_id = 0
+        pipeline = types.SimpleNamespace(tokenizer=tokenizer, model=model)
+        monkeypatch.setattr(hf_transformers, "get_text_generation_pipeline", lambda name, dtype=None: pipeline)
+        return model
+
+    return install
+
+
+def test_generation_errors_reach_the_consumer(fake_model):
+    def generate(streamer, stop_event):
+        streamer.put_text("Hel")
+        raise RuntimeError("CUDA out of memory")
+
+    model = fake_model(generate)
+    chunks = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="module-test") as executor:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            for chunk in hf_transformers.stream_text_hf("m", "p", executor=executor):
+                chunks.append(chunk)
+    assert chunks == ["Hel"]
+    assert model.threads[0].startswith("module-test")
+
+
+def test_stalled_generation_times_out_and_is_stopped(fake_model, settings):
+    settings("ai_models.stream_timeout_seconds", 0.05)
+    stopped = threading.Event()
+
+    def generate(streamer, stop_event):
+        # 模拟卡住的生成: 直到取消信号才结束
+        stop_event.wait(5)
+        stopped.set()
+        streamer.end()
+
+    fake_model(generate)
+    with pytest.raises(TimeoutError):
+        list(hf_transformers.stream_text_hf("m", "p"))
+    assert stopped.wait(1)
+
+
+def test_stream_endpoint_reports_generation_errors(fake_model):
+    def generate(streamer, stop_event):
+        streamer.put_text("Hel")
+        streamer.put_text("lo")
+        raise RuntimeError("generation failed")
+
+    fake_model(generate)
+    module = main.ai_service.create_ai_module(AIModuleCreate(
+        name="stream", type="text_generation", config={"backend": "huggingface", "model": "m"}))
+    with TestClient(main.app) as client:
+        response = client.post(f"/ai-modules/run/{module.id}/stream", json={"input_text": "p"})
+    ai_module_repository.delete(module.id)
+
+    events = response.text.split("\n\n")
+    assert events[:2] == ['data: {"token": "Hel"}', 'data: {"token": "lo"}']
+    assert events[2].startswith("event: error") and "generation failed" in events[2]
@@ -0,0 +1,56 @@
+# tests/test_hf_vision.py
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from hf_vision import expand_image_paths, resolve_image_path
+from models.workflow_models import AIModuleCreate
+from services.ai_service import ai_module_repository
+
+
+@pytest.fixture
+def image_root(tmp_path):
+    root = tmp_path / "images"
+    (root / "cats").mkdir(parents=True)
+    for name in ("b.png", "a.JPG", "notes.txt"):
+        (root / "cats" / name).write_bytes(b"")
+    (tmp_path / "secret.png").write_bytes(b"")
+    return root
+
+
+def test_paths_are_resolved_under_the_root(image_root):
+    root = os.path.realpath(image_root)
+    paths = expand_image_paths(["cats/b.png", str(image_root / "cats" / "a.JPG")], "cats", image_root=str(image_root))
+    assert paths == [os.path.join(root, "cats", name) for name in ("b.png", "a.JPG", "a.JPG", "b.png")]
+
+
+@pytest.mark.parametrize("path", ["../secret.png", "cats/../../secret.png", "/etc/passwd"])
+def test_paths_outside_the_root_are_rejected(image_root, path):
+    with pytest.raises(ValueError, match="不在允许的目录"):
+        resolve_image_path(path, str(image_root))
+    with pytest.raises(ValueError):
+        expand_image_paths(image_dir=path, image_root=str(image_root))
+
+
+def test_symlinks_escaping_the_root_are_rejected(image_root):
+    os.symlink(image_root.parent / "secret.png", image_root / "cats" / "link.png")
+    with pytest.raises(ValueError):
+        expand_image_paths(image_dir="cats", image_root=str(image_root))
+
+
+def test_run_endpoint_rejects_paths_outside_the_root(settings, image_root):
+    settings("ai_models.image_classification.image_root", str(image_root))
+    module = main.ai_service.create_ai_module(AIModuleCreate(
+        name="classify", type="image_classification", config={"backend": "huggingface"}))
+    try:
+        with TestClient(main.app) as client:
+            url = f"/ai-modules/run/{module.id}"
+            for payload in ({"image_dir": ".."}, {"image_paths": ["cats/a.JPG", "../secret.png"]},
+                            {"image_path": "/etc/passwd"}):
+                response = client.post(url, json=payload)
+                assert response.status_code == 400
+                assert "不在允许的目录" in response.json()["detail"]
+    finally:
+        ai_module_repository.delete(module.id)
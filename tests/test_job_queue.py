@@ -0,0 +1,156 @@
+# tests/test_job_queue.py
+import asyncio
+
+import pytest
+
+from services.job_queue import InMemoryJobQueue, JobWorkerPool, RedisJobQueue, new_job
+
+
+def test_claims_by_priority_then_fifo():
+    async def run():
+        queue = InMemoryJobQueue()
+        jobs = [await queue.enqueue(new_job("module", i, priority=p)) for i, p in enumerate((0, 5, 0, 9))]
+        claimed = [await queue.claim() for _ in jobs]
+        assert await queue.claim() is None
+        return [job.target_id for job in claimed], [job.status for job in claimed]
+
+    order, statuses = asyncio.run(run())
+    assert order == [3, 1, 0, 2]
+    assert statuses == ["running"] * 4
+
+
+def test_stale_worker_cannot_finish_a_requeued_job():
+    async def run():
+        queue = InMemoryJobQueue(visibility_timeout=0)
+        job = await queue.enqueue(new_job("module", 1))
+        first = await queue.claim()
+        assert await queue.requeue_expired() == [job.id]
+        # 租约过期后原来的 worker 才完成: 任务仍在就绪队列中，结果被忽略
+        assert not await queue.complete(job.id, "stale", attempt=first.attempts)
+        second = await queue.claim()
+        assert not await queue.complete(job.id, "stale", attempt=first.attempts)
+        assert await queue.complete(job.id, "fresh", attempt=second.attempts)
+        assert await queue.claim() is None
+        return second, await queue.get(job.id)
+
+    second, finished = asyncio.run(run())
+    assert second.attempts == 2
+    assert (finished.status, finished.result) == ("succeeded", "fresh")
+
+
+def test_finished_job_left_in_ready_queue_is_not_claimed_again():
+    async def run():
+        queue = InMemoryJobQueue(visibility_timeout=0)
+        job = await queue.enqueue(new_job("module", 1))
+        await queue.claim()
+        await queue.requeue_expired()
+        # 不带 attempt 的结束也要求任务持有租约
+        assert not await queue.fail(job.id, "late")
+        queue._jobs[job.id] = queue._jobs[job.id].copy(update={"status": "succeeded"})
+        return await queue.claim()
+
+    assert asyncio.run(run()) is None
+
+
+def test_finished_jobs_are_evicted_by_ttl_and_cap():
+    async def run():
+        queue = InMemoryJobQueue(max_finished_jobs=2)
+        jobs = [await queue.enqueue(new_job("module", i)) for i in range(3)]
+        for _ in jobs:
+            claimed = await queue.claim()
+            await queue.complete(claimed.id, claimed.target_id, attempt=claimed.attempts)
+        kept = [await queue.get(job.id) is not None for job in jobs]
+
+        expiring = InMemoryJobQueue(result_ttl_seconds=0)
+        job = await expiring.enqueue(new_job("module", 1))
+        running = await expiring.get(job.id)
+        claimed = await expiring.claim()
+        await expiring.fail(claimed.id, "boom")
+        return kept, running, await expiring.get(job.id)
+
+    kept, running, expired = asyncio.run(run())
+    assert kept == [False, True, True]
+    assert running is not None  # 未结束的任务不会被淘汰
+    assert expired is None
+
+
+def test_worker_pool_runs_jobs_to_completion():
+    async def run():
+        queue = InMemoryJobQueue()
+
+        async def handle(job):
+            if job.input_data.get("fail"):
+                raise RuntimeError("bad input")
+            return job.target_id * 2
+
+        workers = JobWorkerPool(queue, {"module": handle}, workers=2, poll_interval=0.01)
+        ok = await queue.enqueue(new_job("module", 21))
+        failed = await queue.enqueue(new_job("module", 1, {"fail": True}))
+        workers.start()
+        try:
+            results = []
+            for job in (ok, failed):
+                async for state in queue.watch(job.id):
+                    pass
+                results.append(state)
+            return results
+        finally:
+            await workers.stop()
+
+    ok, failed = asyncio.run(run())
+    assert (ok.status, ok.result) == ("succeeded", 42)
+    assert (failed.status, failed.error) == ("failed", "bad input")
+
+
+@pytest.fixture
+def redis_queues():
+    """共享同一个 fakeredis 服务器的两个 RedisJobQueue (模拟两个 worker 进程)"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+
+    def make(**kwargs):
+        return RedisJobQueue(client=fakeredis.FakeAsyncRedis(server=server), **kwargs)
+
+    return make
+
+
+def test_redis_finished_job_is_not_claimed_again(redis_queues):
+    async def run():
+        worker_a, worker_b = redis_queues(visibility_timeout=0), redis_queues(visibility_timeout=0)
+        job = await worker_a.enqueue(new_job("module", 1))
+        first = await worker_a.claim()
+        assert await worker_b.requeue_expired() == [job.id]
+        # 租约过期后原来的 worker 才完成: 结果被忽略，任务仍在就绪队列中
+        assert not await worker_a.complete(job.id, "stale", attempt=first.attempts)
+        second = await worker_b.claim()
+        assert (second.attempts, second.status) == (2, "running")
+        assert not await worker_a.complete(job.id, "stale", attempt=first.attempts)
+        assert await worker_b.complete(job.id, "fresh", attempt=second.attempts)
+        assert await worker_b.requeue_expired() == []
+        assert await worker_a.claim() is None
+        finished = await worker_a.get(job.id)
+        for queue in (worker_a, worker_b):
+            await queue.aclose()
+        return finished
+
+    finished = asyncio.run(run())
+    assert (finished.status, finished.result, finished.attempts) == ("succeeded", "fresh", 2)
+
+
+def test_redis_claim_skips_jobs_that_are_no_longer_queued(redis_queues):
+    async def run():
+        queue = redis_queues()
+        done = await queue.enqueue(new_job("module", 1, priority=9))
+        waiting = await queue.enqueue(new_job("module", 2))
+        # 就绪队列中残留一个已经结束的任务
+        await queue._save(done.copy(update={"status": "succeeded", "result": "kept"}))
+        claimed = await queue.claim()
+        again = await queue.claim()
+        kept = await queue.get(done.id)
+        await queue.aclose()
+        return waiting, claimed, again, kept
+
+    waiting, claimed, again, kept = asyncio.run(run())
+    assert claimed.id == waiting.id
+    assert again is None
+    assert (kept.status, kept.result, kept.attempts) == ("succeeded", "kept", 0)
@@ -0,0 +1,81 @@
+# tests/test_model_pool.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from model_pool import ModelPool
+
+
+def make_pool(max_memory_bytes: int = 100) -> ModelPool:
+    # 测试中模型就是字符串，大小取 len()
+    return ModelPool(max_memory_bytes, size_estimator=len)
+
+
+def test_concurrent_gets_for_one_key_load_once():
+    pool = make_pool()
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return "model"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(pool.get, ("gpt2", "text-generation"), loader) for _ in range(8)]
+        # 等所有线程都进入 get 后再结束加载
+        while len([f for f in futures if f.running()]) < 8:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert results == ["model"] * 8
+    assert len(loads) == 1
+    stats = pool.stats()
+    assert (stats["misses"], stats["hits"], stats["entries"]) == (1, 7, 1)
+
+
+def test_load_errors_reach_waiters_and_are_not_cached():
+    pool = make_pool()
+
+    def failing():
+        raise RuntimeError("weights missing")
+
+    with pytest.raises(RuntimeError, match="weights missing"):
+        pool.get(("m", "t"), failing)
+    assert pool.get(("m", "t"), lambda: "loaded") == "loaded"
+    stats = pool.stats()
+    assert (stats["load_errors"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+
+def test_lru_eviction_respects_the_byte_budget():
+    pool = make_pool(max_memory_bytes=100)
+    pool.get(("a",), lambda: "a" * 40)
+    pool.get(("b",), lambda: "b" * 40)
+    pool.get(("a",), lambda: "unused")  # a 变为最近使用
+    pool.get(("c",), lambda: "c" * 40)  # 超出预算，淘汰最久未使用的 b
+
+    stats = pool.stats()
+    assert stats["models"] == [["a"], ["c"]]
+    assert stats["memory_bytes"] == 80
+    assert stats["evictions"] == 1
+
+    # 单个超出预算的模型仍然保留 (刚加载的模型不会被淘汰)，其他模型都被淘汰
+    pool.get(("huge",), lambda: "h" * 150)
+    stats = pool.stats()
+    assert stats["models"] == [["huge"]]
+    assert (stats["memory_bytes"], stats["evictions"]) == (150, 3)
+
+
+def test_stats_counters():
+    pool = make_pool()
+    for key in ("a", "b", "a", "a"):
+        pool.get((key,), lambda: "x")
+    assert pool.evict(("b",)) and not pool.evict(("b",))
+    stats = pool.stats()
+    assert {k: stats[k] for k in ("hits", "misses", "evictions", "load_errors", "entries", "memory_bytes")} == {
+        "hits": 2, "misses": 2, "evictions": 1, "load_errors": 0, "entries": 1, "memory_bytes": 1}
+    pool.clear()
+    assert (pool.stats()["entries"], pool.stats()["memory_bytes"], pool.stats()["evictions"]) == (0, 0, 1)
@@ -0,0 +1,127 @@
+# tests/test_module_batch.py
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+import hf_batching
+import hf_vision
+import main
+import openai_api
+from hf_batching import MicroBatcher
+from models.workflow_models import AIModuleCreate
+from services.ai_service import AIService, ai_module_repository
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_module():
+    created = []
+
+    def make(module_type: str, **config: Any) -> int:
+        module = main.ai_service.create_ai_module(AIModuleCreate(name=module_type, type=module_type, config=config))
+        created.append(module.id)
+        return module.id
+
+    yield make
+    for module_id in created:
+        ai_module_repository.delete(module_id)
+
+
+def run_batch(client, module_id: int, inputs: List[Any], **headers):
+    return client.post(f"/ai-modules/run/{module_id}/batch", json={"inputs": inputs}, headers=headers)
+
+
+def test_results_keep_input_order_with_per_item_errors(client, make_module, monkeypatch):
+    async def execute(self, module_type, config, input_data):
+        if input_data["input_text"] == "bad":
+            raise ValueError("cannot clean")
+        # 先到的输入后完成，结果仍按输入顺序返回
+        await asyncio.sleep(0.01 * (5 - len(input_data["input_text"])))
+        return input_data["input_text"].upper()
+
+    monkeypatch.setattr(AIService, "_execute_module", execute)
+    module_id = make_module("data_processing", operation="clean_text")
+    response = run_batch(client, module_id, [{"input_text": "a"}, {"input_text": "bad"}, "not an object",
+                                             {"input_text": "abcd"}, None])
+    assert response.status_code == 200
+    assert response.json() == {"results": [
+        {"result": "A"},
+        {"error": "cannot clean"},
+        {"error": "input_data 必须是 JSON 对象"},
+        {"result": "ABCD"},
+        {"error": "input_data 必须是 JSON 对象"},
+    ]}
+
+
+def test_batch_size_limit_and_unknown_module(client, make_module, settings):
+    settings("execution.batch_max_items", 2)
+    module_id = make_module("data_processing", operation="clean_text")
+    assert run_batch(client, module_id, [{}] * 3).status_code == 413
+    assert run_batch(client, module_id, [{"input_text": " x "}] * 2).json() == {"results": [{"result": "x"}] * 2}
+    assert run_batch(client, 10 ** 9, [{}]).status_code == 404
+
+
+def test_hf_text_generation_is_submitted_as_one_batch(client, make_module, monkeypatch):
+    batches: List[List[str]] = []
+
+    def generate(prompts: List[str], options: Dict[str, Any]) -> List[str]:
+        batches.append(prompts)
+        return [prompt[::-1] for prompt in prompts]
+
+    batcher = MicroBatcher(generate, max_batch_size=8, max_wait_ms=50, name="batch-model")
+    monkeypatch.setitem(hf_batching._batchers, ("batch-model", None), batcher)
+    module_id = make_module("text_generation", backend="huggingface", model="batch-model")
+    response = run_batch(client, module_id, [{"input_text": f"p{i}"} for i in range(5)])
+    assert response.json() == {"results": [{"result": f"{i}p"} for i in range(5)]}
+    assert batches == [[f"p{i}" for i in range(5)]]
+
+
+def test_openai_items_fan_out_with_bounded_concurrency(client, make_module, monkeypatch, settings):
+    settings("execution.batch_max_concurrency", 2)
+    state = {"running": 0, "max_running": 0}
+
+    async def fake_generate(model_name, prompt_text, **options):
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        await asyncio.sleep(0.01)
+        state["running"] -= 1
+        if prompt_text == "fail":
+            return None, "upstream error"
+        return f"{model_name}:{prompt_text}", None
+
+    monkeypatch.setattr(openai_api, "generate_text_openai_async", fake_generate)
+    module_id = make_module("text_generation", backend="openai", model="m", temperature=0)
+    response = run_batch(client, module_id, [{"input_text": "a"}, {"input_text": "fail"}, {"input_text": "c"},
+                                             {"input_text": "d"}])
+    assert response.json()["results"] == [{"result": "m:a"}, {"error": "upstream error"}, {"result": "m:c"},
+                                          {"result": "m:d"}]
+    assert state["max_running"] == 2
+
+
+def test_hf_image_classification_fails_only_the_affected_items(client, make_module, monkeypatch, settings, tmp_path):
+    settings("ai_models.image_classification.image_root", str(tmp_path))
+    calls = []
+
+    def fake_classify(model_name, image_paths, top_k=1, dtype=None, batch_size=None):
+        calls.append(list(image_paths))
+        return [{"image_path": path, "error": "无法解码"} if path.endswith("broken.png")
+                else {"image_path": path, "label": "cat", "score": 0.9, "top_k": []} for path in image_paths]
+
+    monkeypatch.setattr(hf_vision, "classify_images_hf", fake_classify)
+    module_id = make_module("image_classification", backend="huggingface")
+    response = run_batch(client, module_id, [{"image_path": "cat.png"}, {"image_path": "../outside.png"}, {},
+                                             {"image_path": "broken.png"}])
+    results = response.json()["results"]
+    assert results[0]["result"]["label"] == "cat"
+    assert "不在允许的目录" in results[1]["error"]
+    assert results[2] == {"error": "未提供图像路径，无法分类"}
+    assert results[3] == {"error": "无法解码"}
+    # 有效的图像在一次运行中分类
+    assert calls == [[str(tmp_path / "cat.png"), str(tmp_path / "broken.png")]]
@@ -0,0 +1,41 @@
+# tests/test_module_executor.py
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+from services.ai_service import run_module_in_worker
+from services.module_executor import ModuleExecutor
+
+
+def test_default_pools_are_threads():
+    # 默认配置不使用进程池: 进程池的子进程不共享语料索引和模型池
+    executor = ModuleExecutor(config.DEFAULT_CONFIG["execution"]["module_types"],
+                              config.DEFAULT_CONFIG["execution"]["default"])
+    try:
+        for module_type in ("text_generation", "image_classification", "data_processing", "custom"):
+            assert isinstance(executor.get_pool(module_type), ThreadPoolExecutor)
+    finally:
+        executor.shutdown()
+
+
+def test_process_pools_spawn_fresh_interpreters():
+    executor = ModuleExecutor({"data_processing": {"kind": "process", "max_workers": 1}})
+    try:
+        pool = executor.get_pool("data_processing")
+        assert isinstance(pool, ProcessPoolExecutor)
+        assert pool._mp_context.get_start_method() == "spawn"
+        result = asyncio.run(executor.run("data_processing", run_module_in_worker, "data_processing",
+                                          {"operation": "normalize"}, {"data": [1, 2, 3]}))
+        assert result == [0.0, 0.5, 1.0]
+    finally:
+        executor.shutdown()
+
+
+def test_pools_are_shared_per_configuration():
+    executor = ModuleExecutor({"a": {"kind": "thread", "max_workers": 2}}, {"kind": "thread", "max_workers": 3})
+    try:
+        assert executor.get_pool("a") is executor.get_pool("a")
+        assert executor.get_pool("b") is executor.get_pool("c")
+        assert executor.get_pool("a") is not executor.get_pool("b")
+    finally:
+        executor.shutdown()
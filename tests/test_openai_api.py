@@ -0,0 +1,254 @@
+# tests/test_openai_api.py
+import asyncio
+import json
+import threading
+from typing import Callable, List
+
+import httpx
+import pytest
+
+import openai_api
+from openai_api import AsyncOpenAIBackend, OpenAIAPIError, generate_text_openai, generate_text_openai_async
+from openai_scheduler import FakeClock, RateLimitScheduler
+
+
+def completion(text: str, total_tokens: int = 10) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"text": text}], "usage": {"total_tokens": total_tokens}})
+
+
+def scripted(*responses) -> Callable[[httpx.Request], httpx.Response]:
+    """依次返回给定的响应 (异常实例会被抛出)，并记录收到的请求"""
+    remaining = list(responses)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        handler.requests.append(request)
+        response = remaining.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    handler.requests = []
+    return handler
+
+
+def make_backend(handler, **kwargs) -> AsyncOpenAIBackend:
+    kwargs.setdefault("max_retries", 3)
+    return AsyncOpenAIBackend(api_key="test-key", base_url="http://openai.test/v1",
+                              transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    """记录退避等待的时长，不真正等待"""
+    recorded: List[float] = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def test_complete_sends_payload_and_strips_text():
+    handler = scripted(completion("  hello  "))
+
+    async def run():
+        backend = make_backend(handler)
+        try:
+            return await backend.complete("prompt", model="m", max_tokens=5, temperature=0.0)
+        finally:
+            await backend.aclose()
+
+    assert asyncio.run(run()) == "hello"
+    request = handler.requests[0]
+    assert request.url.path == "/v1/completions"
+    assert request.headers["authorization"] == "Bearer test-key"
+    assert json.loads(request.content) == {"model": "m", "prompt": "prompt", "max_tokens": 5, "n": 1,
+                                           "temperature": 0.0}
+
+
+def test_retries_server_errors_with_full_jitter_backoff(sleeps):
+    handler = scripted(httpx.Response(503), httpx.Response(502), completion("ok"))
+
+    async def run():
+        backend = make_backend(handler, backoff_base=0.5, backoff_max=8.0)
+        try:
+            return await backend.complete("p")
+        finally:
+            await backend.aclose()
+
+    assert asyncio.run(run()) == "ok"
+    assert len(handler.requests) == 3
+    # full jitter: 第 n 次重试的等待在 [0, base * 2^n] 之间
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5
+    assert 0 <= sleeps[1] <= 1.0
+
+
+def test_retry_after_header_is_honoured_and_capped(sleeps):
+    handler = scripted(httpx.Response(429, headers={"Retry-After": "2"}),
+                       httpx.Response(429, headers={"Retry-After": "120"}),
+                       completion("ok"))
+
+    async def run():
+        backend = make_backend(handler, backoff_max=8.0)
+        try:
+            return await backend.complete("p")
+        finally:
+            await backend.aclose()
+
+    assert asyncio.run(run()) == "ok"
+    assert sleeps == [2.0, 8.0]
+
+
+def test_client_errors_are_not_retried(sleeps):
+    handler = scripted(httpx.Response(400, json={"error": {"message": "bad prompt"}}))
+
+    async def run():
+        backend = make_backend(handler)
+        try:
+            await backend.complete("p")
+        finally:
+            await backend.aclose()
+
+    with pytest.raises(OpenAIAPIError, match="bad prompt") as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 400
+    assert len(handler.requests) == 1
+    assert sleeps == []
+
+
+def test_transport_errors_exhaust_retries(sleeps):
+    handler = scripted(*[httpx.ConnectError("refused")] * 3)
+
+    async def run():
+        backend = make_backend(handler, max_retries=2)
+        try:
+            await backend.complete("p")
+        finally:
+            await backend.aclose()
+
+    with pytest.raises(OpenAIAPIError, match="请求失败"):
+        asyncio.run(run())
+    assert len(handler.requests) == 3
+    assert len(sleeps) == 2
+
+
+def test_last_retryable_status_is_reported(sleeps):
+    handler = scripted(httpx.Response(503), httpx.Response(503, json={"error": {"message": "overloaded"}}))
+
+    async def run():
+        backend = make_backend(handler, max_retries=1)
+        try:
+            return await generate_text_openai_async("m", "p", backend=backend)
+        finally:
+            await backend.aclose()
+
+    text, error = asyncio.run(run())
+    assert text is None
+    assert "503" in error and "overloaded" in error
+
+
+STREAM_BODY = "".join(f"data: {json.dumps({'choices': [{'text': token}]})}\n\n" for token in ("Hel", "lo")) + "data: [DONE]\n\n"
+
+
+def test_stream_complete_retries_before_first_byte(sleeps):
+    body = STREAM_BODY
+    handler = scripted(httpx.Response(503), httpx.Response(200, content=body.encode(),
+                                                           headers={"Content-Type": "text/event-stream"}))
+
+    async def run():
+        backend = make_backend(handler)
+        try:
+            return [chunk async for chunk in backend.stream_complete("p")]
+        finally:
+            await backend.aclose()
+
+    assert asyncio.run(run()) == ["Hel", "lo"]
+    assert json.loads(handler.requests[0].content)["stream"] is True
+    assert len(sleeps) == 1
+
+
+def make_scheduler() -> RateLimitScheduler:
+    # 时钟不前进，桶中的余额只随预留、结算和退还变化 (请求令牌 10 个，token 令牌 1000 个)
+    return RateLimitScheduler(requests_per_minute=600, tokens_per_minute=60000, burst_seconds=1, clock=FakeClock())
+
+
+# 提示 "p" 估算为 1 个 token，加上 complete 默认的 max_tokens=100
+ESTIMATE = 101
+
+
+@pytest.mark.parametrize("responses, expected_tokens", [
+    # 重试的尝试退还预留，成功的尝试按实际用量结算
+    ((httpx.Response(503), httpx.ConnectError("reset"), completion("ok", total_tokens=7)), 1000 - 7),
+    # 不重试的错误和重试耗尽都退还全部预留
+    ((httpx.Response(400, json={"error": {"message": "bad"}}),), 1000),
+    ((httpx.Response(503), httpx.Response(503), httpx.Response(503), httpx.Response(503)), 1000),
+])
+def test_reservations_are_settled_or_refunded_on_every_attempt(sleeps, responses, expected_tokens):
+    scheduler = make_scheduler()
+
+    async def run():
+        backend = make_backend(scripted(*responses), scheduler=scheduler)
+        try:
+            await backend.complete("p")
+        except OpenAIAPIError:
+            pass
+        finally:
+            await backend.aclose()
+            await scheduler.aclose()
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["tokens_available"] == expected_tokens
+    # 请求令牌不退还: 每次尝试都计入 RPM
+    assert stats["requests_available"] == 10 - len(responses)
+
+
+@pytest.mark.parametrize("consume", ["all", "first_chunk"])
+def test_stream_reservation_is_refunded_on_retry_and_kept_once_started(sleeps, consume):
+    scheduler = make_scheduler()
+    handler = scripted(httpx.Response(503), httpx.Response(200, content=STREAM_BODY.encode(),
+                                                           headers={"Content-Type": "text/event-stream"}))
+
+    async def run():
+        backend = make_backend(handler, scheduler=scheduler)
+        try:
+            stream = backend.stream_complete("p")
+            if consume == "all":
+                return [chunk async for chunk in stream]
+            # 调用方提前关闭流: 上游已经开始生成，估算的用量不退还
+            chunks = [await stream.__anext__()]
+            await stream.aclose()
+            return chunks
+        finally:
+            await backend.aclose()
+            await scheduler.aclose()
+
+    assert asyncio.run(run())[0] == "Hel"
+    assert scheduler.stats()["tokens_available"] == 1000 - ESTIMATE
+
+
+def test_sync_calls_from_worker_threads_use_the_shared_backend(monkeypatch):
+    handler = scripted(completion("shared", total_tokens=7))
+    scheduler = make_scheduler()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    backend = make_backend(handler, scheduler=scheduler)
+    monkeypatch.setattr(openai_api, "_openai_backend", backend)
+    monkeypatch.setattr(openai_api, "_openai_backend_loop", loop)
+    try:
+        assert generate_text_openai(None, "m", "p") == ("shared", None)
+    finally:
+        asyncio.run_coroutine_threadsafe(backend.aclose(), loop).result()
+        asyncio.run_coroutine_threadsafe(scheduler.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    # 请求经过共享后端的连接池和限流调度器
+    assert len(handler.requests) == 1
+    assert scheduler.dispatched["interactive"] == 1
+    assert scheduler.stats()["tokens_available"] == 1000 - 7
@@ -0,0 +1,101 @@
+# tests/test_openai_scheduler.py
+import asyncio
+
+from openai_scheduler import FakeClock, RateLimitScheduler, TokenBucket, request_context
+
+
+def make_scheduler(clock: FakeClock) -> RateLimitScheduler:
+    # 每秒放行 1 个请求，token 配额足够大，不影响放行顺序
+    return RateLimitScheduler(requests_per_minute=60, tokens_per_minute=60000, burst_seconds=1, clock=clock)
+
+
+def test_token_bucket_refills_with_the_clock():
+    async def run():
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=10, refill_per_second=2, clock=clock)
+        bucket.consume(10)
+        waits = [bucket.time_until(4)]
+        await clock.advance(1.5)
+        available = bucket.available()
+        await clock.advance(100)
+        full = bucket.available()
+        # 超过容量的请求在桶满时放行，之后的请求要等欠额补足
+        bucket.consume(20)
+        waits.append(bucket.time_until(1))
+        bucket.refund(100)
+        return waits, available, full, bucket.available()
+
+    waits, available, full, refunded = asyncio.run(run())
+    assert waits == [2.0, 5.5]
+    assert (available, full, refunded) == (3.0, 10, 10)
+
+
+async def dispatch_order(scheduler: RateLimitScheduler, clock: FakeClock, requests):
+    """同时提交 (租户, 通道) 请求，每秒推进一次时钟，返回放行顺序"""
+    order = []
+
+    async def request(tenant, lane):
+        with request_context(tenant, lane):
+            await scheduler.acquire(10)
+        order.append((tenant, lane))
+
+    tasks = [asyncio.create_task(request(tenant, lane)) for tenant, lane in requests]
+    await asyncio.sleep(0)
+    for _ in requests:
+        await clock.advance(1)
+    await asyncio.gather(*tasks)
+    await scheduler.aclose()
+    return order
+
+
+def test_tenants_share_a_lane_fairly():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    requests = [("a", "batch")] * 4 + [("b", "batch")] * 2
+    order = asyncio.run(dispatch_order(scheduler, clock, requests))
+    # a 的突发请求不会把 b 排到最后
+    assert [tenant for tenant, _ in order] == ["a", "b", "a", "b", "a", "a"]
+    # 通道排空后不再保留租户的完成时间
+    assert scheduler._last_finish == {}
+    assert scheduler._finish_tags == {"interactive": [], "batch": []}
+
+
+def test_interactive_lane_is_dispatched_before_batch():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    requests = [("jobs", "batch")] * 2 + [("user", "interactive")] * 2
+    order = asyncio.run(dispatch_order(scheduler, clock, requests))
+    assert [lane for _, lane in order] == ["interactive", "interactive", "batch", "batch"]
+    assert scheduler.dispatched == {"interactive": 2, "batch": 2}
+
+
+def test_finish_tags_behind_virtual_time_are_pruned():
+    async def run():
+        scheduler = RateLimitScheduler(requests_per_minute=60000, tokens_per_minute=600000, burst_seconds=1,
+                                       clock=FakeClock())
+        await asyncio.gather(*(scheduler.acquire(10, tenant=f"t{tenant}") for tenant in range(100)))
+        # 一次性到达的租户都已放行: 完成时间不晚于虚拟时间的记录全部被清理
+        pruned = (dict(scheduler._last_finish), scheduler._virtual_time["interactive"])
+        await scheduler.acquire(10, tenant="late")
+        await scheduler.aclose()
+        return pruned, scheduler
+
+    (last_finish, virtual_time), scheduler = asyncio.run(run())
+    assert (last_finish, virtual_time) == ({}, 10.0)
+    assert scheduler._last_finish == {} and scheduler._finish_tags["interactive"] == []
+
+
+def test_pause_after_rate_limit_holds_the_queue():
+    async def run():
+        clock = FakeClock()
+        scheduler = make_scheduler(clock)
+        scheduler.pause(5)
+        waiter = asyncio.create_task(scheduler.acquire(10))
+        await clock.advance(4.9)
+        held = not waiter.done()
+        await clock.advance(0.1)
+        released = waiter.done()
+        await scheduler.aclose()
+        return held, released
+
+    assert asyncio.run(run()) == (True, True)
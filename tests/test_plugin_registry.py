@@ -0,0 +1,155 @@
+# tests/test_plugin_registry.py
+import asyncio
+import sys
+import textwrap
+
+import pytest
+
+from services import builtin_modules, plugin_registry
+from services.ai_service import AIService
+from services.plugin_registry import PluginRegistry, get_plugin_registry
+
+PLUGIN_SOURCE = textwrap.dedent('''
+    def run(config, input_data):
+        return "sync:" + input_data["input_text"]
+
+    async def run_async(config, input_data, run_sync):
+        if config.get("mode") == "sync":
+            return await run_sync(config, input_data)
+        return "async:" + input_data["input_text"]
+
+    async def run_batch(config, inputs, run_one, run_each):
+        return ["batch:" + input_data["input_text"] for input_data in inputs]
+
+    async def stream(config, input_data, run_one):
+        for word in input_data["input_text"].split():
+            yield word
+''')
+
+
+@pytest.fixture
+def plugin_module(tmp_path, monkeypatch):
+    """在临时目录中写一个插件模块，测试结束后从 sys.modules 移除"""
+    module_name = f"aiflow_test_plugin_{abs(hash(str(tmp_path)))}"
+    (tmp_path / f"{module_name}.py").write_text(PLUGIN_SOURCE, encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield module_name
+    sys.modules.pop(module_name, None)
+
+
+@pytest.fixture
+def fresh_registry(monkeypatch):
+    """让 get_plugin_registry() 按当前配置重新构建注册表，测试结束后恢复原来的注册表"""
+    monkeypatch.setattr(plugin_registry, "_plugin_registry", None)
+    return get_plugin_registry
+
+
+class FakeEntryPoint:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        return self.value
+
+
+def test_handlers_are_imported_on_first_resolve(plugin_module):
+    registry = PluginRegistry()
+    registry.register("echo", f"{plugin_module}:run")
+    assert plugin_module not in sys.modules
+    assert not registry.is_loaded("echo")
+
+    assert registry.resolve("echo")({}, {"input_text": "x"}) == "sync:x"
+    assert plugin_module in sys.modules
+    assert registry.is_loaded("echo")
+    assert registry.resolve_handler("echo", "run_async") is None
+    assert registry.resolve("missing") is None
+
+
+def test_builtin_types_are_registered_lazily(fresh_registry):
+    registry = fresh_registry()
+    assert {"text_generation", "image_classification", "data_processing"} <= set(registry.module_types())
+    assert not registry.is_loaded("text_generation")
+
+    assert registry.resolve("text_generation") is builtin_modules.run_text_generation
+    assert registry.resolve_handler("text_generation", "run_async") is builtin_modules.run_text_generation_async
+    assert registry.resolve_handler("image_classification", "run_batch") is builtin_modules.run_image_classification_batch
+    assert registry.resolve_handler("data_processing", "stream") is None
+
+
+def test_handler_dict_is_validated(plugin_module):
+    registry = PluginRegistry()
+    registry.register("no_run", {"run_async": f"{plugin_module}:run_async"})
+    registry.register("typo", {"run": f"{plugin_module}:run", "run_stream": f"{plugin_module}:stream"})
+    with pytest.raises(ValueError, match="run"):
+        registry.resolve("no_run")
+    with pytest.raises(ValueError, match="run_stream"):
+        registry.resolve("typo")
+
+
+def test_entry_points_are_loaded_only_when_used(monkeypatch):
+    handler = FakeEntryPoint("sentiment", lambda config, input_data: "positive")
+    handlers = FakeEntryPoint("summary", {"run": lambda config, input_data: "short",
+                                          "run_async": lambda config, input_data, run_sync: None})
+    monkeypatch.setattr(plugin_registry, "entry_points",
+                        lambda group: [handler, handlers] if group == plugin_registry.ENTRY_POINT_GROUP else [])
+
+    registry = PluginRegistry()
+    assert registry.discover_entry_points() == ["sentiment", "summary"]
+    assert not handler.loaded and not handlers.loaded
+
+    assert registry.resolve("sentiment")({}, {}) == "positive"
+    assert handler.loaded and not handlers.loaded
+    assert registry.resolve_handler("summary", "run_async") is not None
+    assert registry.resolve("summary")({}, {}) == "short"
+
+
+def test_plugin_system_flag_gates_configured_types_and_entry_points(fresh_registry, monkeypatch, settings,
+                                                                    plugin_module):
+    monkeypatch.setattr(plugin_registry, "entry_points",
+                        lambda group: [FakeEntryPoint("sentiment", lambda config, input_data: "positive")])
+    settings("plugins.module_types", {"echo": f"{plugin_module}:run"})
+
+    settings("feature_flags.enable_plugin_system", False)
+    registry = fresh_registry()
+    assert "echo" not in registry.module_types() and "sentiment" not in registry.module_types()
+    assert AIService().run_module("echo", {}, {"input_text": "x"}) == "AI 模块类型 'echo' 的运行逻辑尚未实现"
+
+    settings("feature_flags.enable_plugin_system", True)
+    monkeypatch.setattr(plugin_registry, "_plugin_registry", None)
+    registry = fresh_registry()
+    assert {"echo", "sentiment"} <= set(registry.module_types())
+    assert AIService().run_module("echo", {}, {"input_text": "x"}) == "sync:x"
+
+
+def test_plugin_handlers_take_part_in_async_batch_and_stream_runs(fresh_registry, settings, plugin_module):
+    settings("feature_flags.enable_plugin_system", True)
+    settings("plugins.module_types", {
+        "echo": {kind: f"{plugin_module}:{kind}" for kind in ("run", "run_async", "run_batch", "stream")},
+        "echo_sync": f"{plugin_module}:run",
+    })
+    fresh_registry()
+    service = AIService()
+
+    async def scenario():
+        streamed = [chunk async for chunk in service.stream_module("echo", {}, {"input_text": "a b c"})]
+        return (
+            await service.run_module_async("echo", {}, {"input_text": "x"}),
+            await service.run_module_async("echo", {"mode": "sync"}, {"input_text": "x"}),
+            await service.run_module_batch_async("echo", {}, [{"input_text": "x"}, {"input_text": "y"}]),
+            await service.run_module_batch_async("echo_sync", {}, [{"input_text": "x"}]),
+            streamed,
+            [chunk async for chunk in service.stream_module("echo_sync", {}, {"input_text": "a b"})],
+        )
+
+    async_result, sync_result, batch, fallback_batch, streamed, fallback_stream = asyncio.run(scenario())
+    assert async_result == "async:x"
+    # run_sync 把输入交给执行层运行同步的 run 处理函数
+    assert sync_result == "sync:x"
+    assert batch == [{"result": "batch:x"}, {"result": "batch:y"}]
+    # 没有 run_batch / stream 处理函数时逐条运行、一次性产出
+    assert fallback_batch == [{"result": "sync:x"}]
+    assert streamed == ["a", "b", "c"]
+    assert fallback_stream == ["sync:a b"]
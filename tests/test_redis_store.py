@@ -0,0 +1,134 @@
+# tests/test_redis_store.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from models.workflow_models import AIModule
+from services.redis_store import RedisDocumentStore, RedisRepository
+from services.repository import VersionConflictError
+from services.shared_cache import CachedDocumentStore, CachedRepository, InvalidationBus
+from services.workflow_service import CanvasItem, WorkflowData
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_server():
+    """同一个 fakeredis 服务器上的多个客户端模拟多个 worker 进程"""
+    return fakeredis.FakeServer()
+
+
+def connect(server):
+    return fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture
+def buses(redis_server):
+    created = []
+
+    def make() -> InvalidationBus:
+        bus = InvalidationBus(connect(redis_server))
+        created.append(bus)
+        return bus
+
+    yield make
+    for bus in created:
+        bus.close()
+
+
+def wait_until(condition, timeout: float = 3.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def make_document(*item_ids: str) -> WorkflowData:
+    return WorkflowData(canvasItems=[CanvasItem(id=item_id, type="data_processing", name=item_id, top=0, left=0,
+                                                width=100, height=50) for item_id in item_ids],
+                        connections=[])
+
+
+def make_module(name: str, module_type: str = "data_processing"):
+    return {"name": name, "type": module_type, "config": {}}
+
+
+def test_workers_allocate_unique_ids(redis_server):
+    workers = [RedisRepository(connect(redis_server), "ai_modules", AIModule, indexed_fields=("type",))
+               for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        created = list(pool.map(lambda i: workers[i % 2].create(make_module(f"m{i}")), range(40)))
+
+    ids = [module.id for module in created]
+    assert len(set(ids)) == 40
+    # 两个 worker 看到同一份数据
+    assert [module.id for module in workers[0].list()] == sorted(ids)
+    assert workers[1].count() == 40
+
+
+def test_update_from_one_worker_keeps_indexes_consistent(redis_server):
+    first, second = [RedisRepository(connect(redis_server), "ai_modules", AIModule, indexed_fields=("type",))
+                     for _ in range(2)]
+    module = first.create(make_module("m", "data_processing"))
+
+    assert second.update(module.id, {"type": "text_generation"}).type == "text_generation"
+    assert first.find_by("type", "data_processing") == []
+    assert [item.id for item in first.find_by("type", "text_generation")] == [module.id]
+    assert second.delete(module.id) and first.get(module.id) is None
+    assert first.update(module.id, {"name": "gone"}) is None
+
+
+def test_stale_document_version_is_rejected_across_workers(redis_server):
+    first, second = [RedisDocumentStore(connect(redis_server), WorkflowData) for _ in range(2)]
+    version = first.put(1, make_document(), expected_version=0)
+
+    assert second.put(1, make_document("a"), expected_version=version) == version + 1
+    with pytest.raises(VersionConflictError):
+        first.put(1, make_document(), expected_version=version)
+    document, current = first.get_versioned(1)
+    assert current == version + 1
+    assert [item.id for item in document.canvasItems] == ["a"]
+
+
+def test_write_on_one_worker_invalidates_the_other_workers_cache(redis_server, buses):
+    first, second = [CachedRepository(RedisRepository(connect(redis_server), "ai_modules", AIModule),
+                                      "ai_modules", bus=buses())
+                     for _ in range(2)]
+    module = first.create(make_module("before"))
+    assert second.get(module.id).name == "before"
+
+    first.update(module.id, {"name": "after"})
+    assert first.get(module.id).name == "after"
+    assert wait_until(lambda: second.get(module.id).name == "after")
+
+    first.delete(module.id)
+    assert wait_until(lambda: second.get(module.id) is None)
+
+
+def test_document_cache_is_invalidated_across_workers(redis_server, buses):
+    first, second = [CachedDocumentStore(RedisDocumentStore(connect(redis_server), WorkflowData),
+                                         "workflow_data", bus=buses())
+                     for _ in range(2)]
+    first.put(1, make_document())
+    assert second.get_versioned(1)[1] == 1
+
+    first.put(1, make_document("a"), expected_version=1)
+    assert wait_until(lambda: second.get_versioned(1)[1] == 2)
+    assert [item.id for item in second.get(1).canvasItems] == ["a"]
+
+
+def test_local_cache_without_bus_serves_stale_reads_until_ttl(redis_server):
+    """没有失效通知时只能依赖 TTL 兜底"""
+    first = CachedRepository(RedisRepository(connect(redis_server), "ai_modules", AIModule), "ai_modules")
+    second = CachedRepository(RedisRepository(connect(redis_server), "ai_modules", AIModule), "ai_modules",
+                              ttl_seconds=0.05)
+    module = first.create(make_module("before"))
+    assert second.get(module.id).name == "before"
+
+    first.update(module.id, {"name": "after"})
+    assert second.get(module.id).name == "before"
+    time.sleep(0.1)
+    assert second.get(module.id).name == "after"
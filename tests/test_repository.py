@@ -0,0 +1,79 @@
+# tests/test_repository.py
+import uuid
+
+from fastapi.testclient import TestClient
+
+import main
+from models.workflow_models import AIModule
+from services.repository import InMemoryRepository
+
+
+def make_repository(count: int) -> InMemoryRepository:
+    repository = InMemoryRepository(AIModule, indexed_fields=("type",))
+    repository.bulk_create({"name": f"m{i}", "type": "even" if i % 2 == 0 else "odd"} for i in range(count))
+    return repository
+
+
+def test_page_walks_ids_in_order_across_deletes():
+    repository = make_repository(20)
+    for item_id in (2, 3, 4, 10):
+        repository.delete(item_id)
+
+    pages, after_id = [], None
+    while True:
+        page = repository.page(after_id, limit=5)
+        pages.append([item.id for item in page])
+        if len(page) < 5:
+            break
+        after_id = page[-1].id
+    assert pages == [[1, 5, 6, 7, 8], [9, 11, 12, 13, 14], [15, 16, 17, 18, 19], [20]]
+    assert repository.count() == 16
+
+
+def test_deleted_ids_are_compacted():
+    repository = make_repository(10)
+    for item_id in range(1, 7):
+        assert repository.delete(item_id)
+    assert not repository.delete(1)
+    assert repository._ordered_ids == [7, 8, 9, 10]
+    assert [item.id for item in repository.page(limit=10)] == [7, 8, 9, 10]
+
+
+def test_filtered_page_uses_sorted_secondary_index():
+    repository = make_repository(10)
+    # 修改后进入另一个索引值的记录按 id 插入，而不是追加到末尾
+    repository.update(2, {"type": "odd"})
+    repository.update(9, {"type": "even"})
+
+    assert [m.id for m in repository.find_by("type", "odd")] == [2, 4, 6, 8, 10]
+    first = repository.page(limit=2, filters={"type": "odd"})
+    rest = repository.page(after_id=first[-1].id, limit=10, filters={"type": "odd"})
+    assert [m.id for m in first] == [2, 4]
+    assert [m.id for m in rest] == [6, 8, 10]
+    assert [m.id for m in repository.page(after_id=3, limit=2, filters={"type": "even", "name": "m8"})] == [9]
+    assert [m.id for m in repository.page(limit=10, filters={"type": "missing"})] == []
+
+
+def test_workflow_list_cursor_pagination():
+    name = f"paged-{uuid.uuid4().hex[:8]}"
+    with TestClient(main.app) as client:
+        created = [client.post("/workflows", json={"name": name, "description": "", "steps": []}).json()["id"]
+                   for _ in range(5)]
+        try:
+            seen, cursor = [], None
+            while True:
+                params = {"name": name, "limit": 2, "fields": "name"}
+                if cursor:
+                    params["cursor"] = cursor
+                response = client.get("/workflows", params=params)
+                assert response.status_code == 200
+                seen += [workflow["id"] for workflow in response.json()]
+                cursor = response.headers.get("X-Next-Cursor")
+                if cursor is None:
+                    break
+                assert 'rel="next"' in response.headers["Link"]
+            assert seen == created
+            assert client.get("/workflows", params={"cursor": "not-a-cursor"}).status_code == 400
+        finally:
+            for workflow_id in created:
+                main.workflow_service.delete_workflow(workflow_id)
@@ -0,0 +1,119 @@
+# tests/test_result_cache.py
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from models.workflow_models import AIModuleCreate
+from services import result_cache
+from services.ai_service import AIService, ai_module_repository
+from services.result_cache import ResultCache, canonical_key, result_ttl
+
+
+def test_canonical_key_ignores_dict_key_order():
+    first = canonical_key(1, "text_generation", {"model": "m", "options": {"a": 1, "b": 2}}, {"input_text": "hi", "n": 1})
+    second = canonical_key(1, "text_generation", {"options": {"b": 2, "a": 1}, "model": "m"}, {"n": 1, "input_text": "hi"})
+    assert first == second
+    assert first != canonical_key(2, "text_generation", {"model": "m", "options": {"a": 1, "b": 2}},
+                                  {"input_text": "hi", "n": 1})
+    assert first != canonical_key(1, "text_generation", {"model": "m", "options": {"a": 1, "b": 2}},
+                                  {"input_text": "hi", "n": 2})
+
+
+@pytest.mark.parametrize("module_type, config, expected", [
+    ("data_processing", {}, 60),
+    ("text_generation", {"backend": "huggingface"}, 30),
+    # OpenAI 只在 temperature 为 0 时缓存，未设置时按默认的 0.7 处理
+    ("text_generation", {"backend": "openai", "temperature": 0}, 30),
+    ("text_generation", {"backend": "openai"}, 0),
+    ("text_generation", {"backend": "openai", "temperature": 0.2}, 0),
+    # 未配置 TTL 的类型 (例如插件) 不缓存
+    ("sentiment_analysis", {}, 0),
+])
+def test_ttl_and_non_cacheable_rules(module_type, config, expected):
+    ttl_seconds = {"data_processing": 60, "text_generation": 30}
+    assert result_ttl(module_type, config, ttl_seconds) == expected
+    assert ResultCache(ttl_seconds=ttl_seconds).ttl_for(module_type, config) == expected
+
+
+def test_l1_hit_then_l2_hit_after_l1_is_lost():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        cache = ResultCache(ttl_seconds={"data_processing": 60})
+        cache._redis = fakeredis.FakeAsyncRedis()
+        await cache.set("k", {"labels": ["cat"]}, 60)
+        l1 = await cache.get("k")
+        # 模拟另一个进程 (或本进程重启后) 只有 Redis 中有这个结果
+        cache.l1.clear()
+        l2 = await cache.get("k")
+        refilled = await cache.get("k")
+        missing = await cache.get("other")
+        await cache.aclose()
+        return cache.stats(), l1, l2, refilled, missing
+
+    stats, l1, l2, refilled, missing = asyncio.run(run())
+    assert l1 == l2 == refilled == (True, {"labels": ["cat"]})
+    assert missing == (False, None)
+    # L2 命中后写回 L1，之后的读取不再访问 Redis
+    assert (stats["l1_hits"], stats["l2_hits"], stats["misses"]) == (2, 1, 1)
+    assert stats["hit_ratio"] == 0.75
+
+
+def test_l1_entries_expire_and_are_bounded():
+    cache = ResultCache(l1_max_entries=2)
+    cache.l1.set("expired", 1, -1)
+    assert cache.l1.get("expired") == (False, None)
+    for key in ("a", "b", "c"):
+        cache.l1.set(key, key, 60)
+    assert cache.l1.get("a") == (False, None)
+    assert len(cache.l1) == 2
+
+
+def test_oversize_values_are_not_cached():
+    async def run():
+        cache = ResultCache(max_item_bytes=16)
+        stored = [await cache.set("small", "ok", 60), await cache.set("large", "x" * 32, 60)]
+        return cache, stored, await cache.get("large")
+
+    cache, stored, large = asyncio.run(run())
+    assert stored == [True, False]
+    assert large == (False, None)
+    assert cache.stats()["skipped_oversize"] == 1
+
+
+@pytest.fixture
+def cached_module(monkeypatch, settings):
+    settings("result_cache.enabled", True)
+    settings("result_cache.redis_url", None)
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    runs = []
+
+    async def execute(self, module_type, config, input_data):
+        runs.append(input_data)
+        return input_data["input_text"].strip()
+
+    monkeypatch.setattr(AIService, "_execute_module", execute)
+    module = main.ai_service.create_ai_module(AIModuleCreate(
+        name="clean", type="data_processing", config={"operation": "clean_text"}))
+    yield module, runs
+    ai_module_repository.delete(module.id)
+
+
+def test_run_endpoint_cache_bypass_headers(cached_module):
+    module, runs = cached_module
+    url = f"/ai-modules/run/{module.id}"
+    with TestClient(main.app) as client:
+        responses = [
+            client.post(url, json={"input_text": " hi "}),
+            client.post(url, json={"input_text": " hi "}),  # 命中
+            client.post(url, json={"input_text": " hi "}, headers={"X-Cache-Bypass": "1"}),
+            client.post(url, json={"input_text": " hi "}, headers={"Cache-Control": "no-cache"}),
+            client.post(url, json={"input_text": " hi "}, headers={"X-Cache-Bypass": "0"}),  # 命中
+        ]
+        stats = client.get("/stats/cache").json()
+    assert [response.json() for response in responses] == [{"result": "hi"}] * 5
+    assert len(runs) == 3
+    assert (stats["l1_hits"], stats["misses"], stats["bypassed"]) == (2, 1, 2)
@@ -0,0 +1,119 @@
+# tests/test_singleflight.py
+import asyncio
+
+import pytest
+
+from services.ai_service import AIService
+from services.singleflight import SingleFlight
+
+
+class SlowCall:
+    """在 release 之前一直挂起的调用，记录被执行和被取消的次数"""
+
+    def __init__(self, result="done"):
+        self.result = result
+        self.runs = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    async def run():
+        flight, call = SingleFlight(), SlowCall()
+        coalesced = []
+        waiters = [asyncio.create_task(flight.do("k", call, on_coalesced=lambda: coalesced.append(1)))
+                   for _ in range(5)]
+        other = asyncio.create_task(flight.do("other", SlowCall("other")))
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*waiters)
+        other.cancel()
+        return flight, call, coalesced, results
+
+    flight, call, coalesced, results = asyncio.run(run())
+    assert results == ["done"] * 5
+    assert call.runs == 1
+    assert len(coalesced) == 4
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 4}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def run():
+        flight, failing = SingleFlight(), SlowCall(RuntimeError("upstream down"))
+        waiters = [asyncio.create_task(flight.do("k", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        retry = SlowCall("recovered")
+        retry.release.set()
+        return outcomes, await flight.do("k", retry)
+
+    outcomes, retried = asyncio.run(run())
+    assert [str(outcome) for outcome in outcomes] == ["upstream down"] * 3
+    assert retried == "recovered"
+
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    async def run():
+        flight, call = SingleFlight(), SlowCall()
+        leader = asyncio.create_task(flight.do("k", call))
+        follower = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        return call, await follower, leader.cancelled()
+
+    call, result, leader_cancelled = asyncio.run(run())
+    assert leader_cancelled and result == "done"
+    assert call.cancelled == 0
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def run():
+        flight, call = SingleFlight(), SlowCall()
+        waiters = [asyncio.create_task(flight.do("k", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight, call
+
+    flight, call = asyncio.run(run())
+    assert call.cancelled == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("coalesce, expected_runs", [(True, 1), (False, 3)])
+def test_module_runs_are_coalesced_by_canonical_key(monkeypatch, settings, coalesce, expected_runs):
+    settings("execution.coalesce_identical_runs", coalesce)
+    runs = []
+
+    async def execute(self, module_type, config, input_data):
+        runs.append(input_data)
+        await asyncio.sleep(0.01)
+        return input_data["input_text"].upper()
+
+    monkeypatch.setattr(AIService, "_execute_module", execute)
+
+    async def run():
+        service = AIService()
+        # 字段顺序不同但内容相同的配置得到同一个键
+        configs = [{"model": "m", "temperature": 0}, {"temperature": 0, "model": "m"}, {"model": "m", "temperature": 0}]
+        return await asyncio.gather(*(service.run_module_async("text_generation", config, {"input_text": "hi"})
+                                      for config in configs))
+
+    assert asyncio.run(run()) == ["HI"] * 3
+    assert len(runs) == expected_runs
@@ -0,0 +1,94 @@
+# tests/test_storage.py
+import pytest
+
+from models.workflow_models import Workflow
+from services import storage
+from services.repository import InMemoryRepository
+
+
+class FakeRepository:
+    def __init__(self, pool):
+        self.pool = pool
+
+
+@pytest.fixture
+def shared_pool(monkeypatch):
+    """模拟共享后端: 每次创建的连接池编号递增，close_storage 时关闭"""
+    created = []
+
+    class FakePool:
+        def __init__(self):
+            self.closed = False
+            created.append(self)
+
+        def close(self):
+            self.closed = True
+
+    def get_pool():
+        if storage._postgres_pool is None:
+            storage._postgres_pool = FakePool()
+        return storage._postgres_pool
+
+    monkeypatch.setattr(storage, "_postgres_pool", None)
+    return get_pool, created
+
+
+def test_repository_is_created_on_first_use(settings):
+    settings("database.type", "inmemory")
+    repository = storage.create_repository("workflows", Workflow, indexed_fields=("name",))
+    assert repository._target is None
+    created = repository.create({"name": "flow"})
+    assert isinstance(repository.resolve(), InMemoryRepository)
+    assert repository.get(created.id) == created
+
+
+def test_close_storage_rebuilds_shared_backends(shared_pool):
+    get_pool, created = shared_pool
+    repository = storage.StorageProxy(lambda: FakeRepository(get_pool()))
+    first_pool = repository.pool
+
+    storage.close_storage()
+
+    assert first_pool.closed
+    # 重置后重新创建仓储，使用新的连接池而不是已关闭的那个
+    assert repository.pool is not first_pool
+    assert not repository.pool.closed
+    assert len(created) == 2
+
+
+def test_close_storage_keeps_in_memory_data(settings):
+    settings("database.type", "inmemory")
+    repository = storage.create_repository("workflows", Workflow)
+    created = repository.create({"name": "flow"})
+
+    storage.close_storage()
+
+    assert repository.get(created.id) == created
+
+
+@pytest.mark.parametrize("database_type, jobs_backend, workers, allowed", [
+    ("inmemory", "inmemory", 1, True),
+    ("inmemory", "inmemory", 4, False),
+    ("redis", "inmemory", 4, False),
+    ("redis", "redis", 4, True),
+    ("postgresql", "redis", 4, True),
+])
+def test_check_shared_state(settings, monkeypatch, database_type, jobs_backend, workers, allowed):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    settings("database.type", database_type)
+    settings("jobs.backend", jobs_backend)
+    settings("server.workers", workers)
+    if allowed:
+        storage.check_shared_state()
+    else:
+        with pytest.raises(RuntimeError, match=f"{workers} 个 worker"):
+            storage.check_shared_state()
+
+
+def test_worker_count_from_environment_overrides_setting(settings, monkeypatch):
+    settings("database.type", "inmemory")
+    settings("server.workers", 1)
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    assert storage.get_worker_count() == 2
+    with pytest.raises(RuntimeError, match="database.type='inmemory'"):
+        storage.check_shared_state()
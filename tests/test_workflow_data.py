@@ -0,0 +1,112 @@
+# tests/test_workflow_data.py
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.repository import InMemoryDocumentStore, VersionConflictError
+from services.workflow_service import WorkflowData, workflow_data_store
+
+ITEM = {"id": "n1", "type": "text_generation", "name": "Generate", "top": 10, "left": 20, "width": 100,
+        "height": 40}
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def workflow_id(client):
+    workflow = client.post("/workflows", json={"name": "canvas", "description": "", "steps": []}).json()
+    yield workflow["id"]
+    main.workflow_service.delete_workflow(workflow["id"])
+
+
+def save(client, workflow_id, items, **headers):
+    return client.post(f"/workflows/data/{workflow_id}", json={"canvasItems": items, "connections": []},
+                       headers=headers)
+
+
+def test_etag_and_conditional_requests(client, workflow_id):
+    response = save(client, workflow_id, [ITEM])
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == f'"{workflow_id}-1"'
+
+    assert client.get(f"/workflows/data/{workflow_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/workflows/data/{workflow_id}", headers={"If-None-Match": '"0-0"'}).status_code == 200
+
+    assert save(client, workflow_id, [ITEM], **{"If-Match": etag}).headers["ETag"] == f'"{workflow_id}-2"'
+    conflict = save(client, workflow_id, [ITEM], **{"If-Match": etag})
+    assert conflict.status_code == 409
+    assert conflict.json()["detail"]["currentVersion"] == 2
+    assert save(client, workflow_id, [ITEM], **{"If-Match": '"other"'}).status_code == 412
+
+
+def test_patch_updates_items_against_base_version(client, workflow_id):
+    etag = save(client, workflow_id, [ITEM, {**ITEM, "id": "n2"}]).headers["ETag"]
+    url = f"/workflows/data/{workflow_id}"
+
+    assert client.patch(url, json={"updateItems": [{"id": "n1", "top": 50}]}).status_code == 428
+    response = client.patch(url, json={"updateItems": [{"id": "n1", "top": 50}],
+                                       "addConnections": [{"source": "n1", "target": "n2"}]},
+                            headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {"version": 2}
+
+    data = client.get(url).json()
+    assert [(item["id"], item["top"], item["left"]) for item in data["canvasItems"]] == [("n1", 50, 20), ("n2", 10, 20)]
+    assert data["connections"] == [{"source": "n1", "target": "n2"}]
+    assert client.patch(url, json={"baseVersion": 1, "removeItemIds": ["n2"]}).status_code == 409
+
+
+def test_patch_rejects_invalid_merged_items(client, workflow_id):
+    save(client, workflow_id, [ITEM])
+    url = f"/workflows/data/{workflow_id}"
+
+    response = client.patch(url, json={"baseVersion": 1, "updateItems": [{"id": "n1", "top": None}]})
+    assert response.status_code == 400
+    assert client.patch(url, json={"baseVersion": 1, "updateItems": [{"id": "missing", "top": 1}]}).status_code == 400
+    # 无效的修改没有写入
+    assert client.get(url).headers["ETag"] == f'"{workflow_id}-1"'
+    assert client.get(url).json()["canvasItems"][0]["top"] == 10
+
+
+def in_memory_store():
+    return InMemoryDocumentStore(WorkflowData)
+
+
+def redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    from services.redis_store import RedisDocumentStore
+    return RedisDocumentStore(fakeredis.FakeRedis(), WorkflowData)
+
+
+@pytest.mark.parametrize("make_store", [in_memory_store, redis_store])
+def test_versions_keep_increasing_across_delete(make_store):
+    store = make_store()
+    document = WorkflowData(canvasItems=[], connections=[])
+    assert store.put(1, document) == 1
+    assert store.put(1, document, expected_version=1) == 2
+    assert store.delete(1) and not store.delete(1)
+    assert store.get_versioned(1) is None
+
+    # 删除后的文档视为不存在: 删除前的版本号不再匹配，期望不存在 (0) 的写入成功
+    with pytest.raises(VersionConflictError) as excinfo:
+        store.put(1, document, expected_version=2)
+    assert excinfo.value.current_version == 0
+    assert store.put(1, document, expected_version=0) == 3
+    assert store.get_versioned(1)[1] == 3
+    store.bulk_put({1: document, 2: document})
+    assert (store.get_versioned(1)[1], store.get_versioned(2)[1]) == (4, 1)
+
+
+def test_recreated_workflow_data_does_not_reuse_etags(client, workflow_id):
+    old_etag = save(client, workflow_id, [ITEM]).headers["ETag"]
+    workflow_data_store.delete(workflow_id)
+
+    new_etag = save(client, workflow_id, [ITEM]).headers["ETag"]
+    assert new_etag != old_etag
+    assert client.get(f"/workflows/data/{workflow_id}", headers={"If-None-Match": old_etag}).status_code == 200
+    assert save(client, workflow_id, [ITEM], **{"If-Match": old_etag}).status_code == 409
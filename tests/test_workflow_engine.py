@@ -0,0 +1,141 @@
+# tests/test_workflow_engine.py
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Dict
+
+import pytest
+
+from services.node_memo import NodeOutputMemo
+from services.workflow_engine import WorkflowCycleError, WorkflowEngine, compile_workflow
+from services.workflow_service import CanvasItem, Connection, WorkflowData
+
+
+class CountingAIService:
+    """记录每个节点执行次数的 AIService 替身，输出中带上执行次数 (模拟不确定的输出)"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+
+    async def run_module_async(self, module_type: str, config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+        name = config["name"]
+        self.calls[name] += 1
+        return f"{name}#{self.calls[name]}" if config.get("backend") == "openai" else f"{name}({input_data.get('input_text', '')})"
+
+
+def node(node_id: str, module_type: str, **config: Any) -> CanvasItem:
+    return CanvasItem(id=node_id, type=module_type, name=node_id, top=0, left=0, width=1, height=1,
+                      config={"name": node_id, **config})
+
+
+def workflow(*items: CanvasItem, connections=()) -> WorkflowData:
+    return WorkflowData(canvasItems=list(items),
+                        connections=[Connection(source=source, target=target) for source, target in connections])
+
+
+def run_twice(data: WorkflowData):
+    service = CountingAIService()
+    engine = WorkflowEngine(service, memo=NodeOutputMemo())
+    first = asyncio.run(engine.run(data))
+    second = asyncio.run(engine.run(data))
+    return service, first, second
+
+
+def test_deterministic_nodes_are_memoized():
+    data = workflow(node("clean", "data_processing"), node("summary", "text_generation", backend="openai", temperature=0),
+                    connections=[("clean", "summary")])
+    service, first, second = run_twice(data)
+    assert first["executed"] == ["clean", "summary"]
+    assert second["cache_hits"] == ["clean", "summary"]
+    assert second["results"] == first["results"]
+    assert service.calls == {"clean": 1, "summary": 1}
+
+
+def test_sampling_and_uncached_types_always_run():
+    data = workflow(node("story", "text_generation", backend="openai", temperature=0.9),
+                    node("plugin", "sentiment_analysis"),
+                    node("after_story", "data_processing"),
+                    connections=[("story", "after_story")])
+    service, first, second = run_twice(data)
+    assert sorted(second["executed"]) == ["after_story", "plugin", "story"]
+    assert second["cache_hits"] == []
+    assert (first["results"]["story"], second["results"]["story"]) == ("story#1", "story#2")
+    # 下游节点的指纹包含上游的输出哈希: 上游输出变化时重新执行
+    assert second["results"]["after_story"] == "after_story(story#2)"
+    assert service.calls == {"story": 2, "plugin": 2, "after_story": 2}
+
+
+def test_downstream_of_sampling_node_still_hits_when_its_output_repeats():
+    data = workflow(node("story", "text_generation", backend="openai"), node("after", "data_processing"),
+                    connections=[("story", "after")])
+    service = CountingAIService()
+
+    async def same_output(module_type, config, input_data):
+        service.calls[config["name"]] += 1
+        return "fixed" if config["name"] == "story" else input_data["input_text"].upper()
+
+    service.run_module_async = same_output
+    engine = WorkflowEngine(service, memo=NodeOutputMemo())
+    asyncio.run(engine.run(data))
+    second = asyncio.run(engine.run(data))
+    assert second["executed"] == ["story"]
+    assert second["cache_hits"] == ["after"]
+
+
+class SleepingAIService:
+    """每个节点睡眠 config["sleep"] 秒，记录同时执行的节点数和每个节点收到的输入"""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.inputs: Dict[str, Dict[str, Any]] = {}
+
+    async def run_module_async(self, module_type: str, config: Dict[str, Any], input_data: Dict[str, Any]) -> Any:
+        self.inputs[config["name"]] = input_data
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(config.get("sleep", 0))
+        finally:
+            self.running -= 1
+        return f"{config['name']}<{input_data.get('input_text', '')}>"
+
+
+def test_independent_nodes_in_a_level_run_concurrently():
+    data = workflow(*(node(name, "text_generation", sleep=0.2) for name in ("a", "b", "c")))
+    service = SleepingAIService()
+    start = time.perf_counter()
+    result = asyncio.run(WorkflowEngine(service, memo=NodeOutputMemo()).run(data))
+    elapsed = time.perf_counter() - start
+    assert result["levels"] == [["a", "b", "c"]]
+    assert service.max_running == 3
+    # 三个 0.2 秒的节点并发执行，总耗时接近最长的一个而不是三者之和
+    assert elapsed < 0.5
+
+
+def test_max_concurrency_bounds_a_level():
+    data = workflow(*(node(f"n{i}", "text_generation", sleep=0.01) for i in range(6)))
+    service = SleepingAIService()
+    asyncio.run(WorkflowEngine(service, max_concurrency=2, memo=NodeOutputMemo()).run(data))
+    assert service.max_running == 2
+
+
+def test_upstream_outputs_reach_downstream_inputs():
+    data = workflow(node("a", "text_generation"), node("b", "text_generation"), node("join", "text_generation"),
+                    node("own_text", "text_generation"),
+                    connections=[("a", "join"), ("b", "join"), ("a", "own_text")])
+    service = SleepingAIService()
+    result = asyncio.run(WorkflowEngine(service, memo=NodeOutputMemo()).run(
+        data, inputs={"a": {"input_text": "x"}, "own_text": {"input_text": "given"}}))
+    assert result["levels"] == [["a", "b"], ["own_text", "join"]]
+    # 上游输出以节点 ID 为键传入，未提供 input_text 时按连接顺序拼接
+    assert service.inputs["join"] == {"a": "a<x>", "b": "b<>", "input_text": "a<x>\nb<>"}
+    assert result["results"]["join"] == "join<a<x>\nb<>>"
+    # 显式提供的 input_text 不被上游输出覆盖
+    assert service.inputs["own_text"] == {"input_text": "given", "a": "a<x>"}
+
+
+def test_cycles_are_rejected():
+    data = workflow(node("a", "data_processing"), node("b", "data_processing"), connections=[("a", "b"), ("b", "a")])
+    with pytest.raises(WorkflowCycleError):
+        compile_workflow(data)